@@ -0,0 +1,360 @@
+# ================================================================
+# Benchmarks of scanning, hashing and list handling
+#
+# Usage:
+#   python bench.py -o bench_output.txt
+#   python bench.py --compare bench_output.txt
+#
+# Synthetic corpus is generated once per set of parameters and reused
+# afterwards, so numbers of different commits can be compared.
+# ================================================================
+
+# ================================================================
+# Imports
+# ================================================================
+import sys, os, json, random, struct, zipfile, argparse, tempfile, platform, subprocess
+from contextlib import redirect_stdout
+from statistics import median
+from timeit import default_timer as timer
+
+from wadfile import WAD_HEADER, WAD_ENTRY
+from wadhash import FileCache
+import wadscan
+
+# ================================================================
+# Constants
+# ================================================================
+# Bumped whenever generated corpus changes, so old corpora get rebuilt
+CORPUS_VERSION = 1
+MAP_LUMPS = ['THINGS', 'LINEDEFS', 'SIDEDEFS', 'VERTEXES', 'SEGS', 'SSECTORS', 'NODES', 'SECTORS', 'REJECT', 'BLOCKMAP']
+WORDS = ['doom', 'hell', 'revenge', 'castle', 'speed', 'slaughter', 'episode', 'tech', 'base', 'gothic', 'evil', 'dark', 'map', 'pack']
+QUERIES = ['d', 'do', 'doom', 'slaughter', 'hell map', 'zzz']
+BLOCK_SIZE = 1024 * 1024
+
+# ================================================================
+# Corpus generator
+# ================================================================
+def randomBytes(rng, size):
+    return rng.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+
+def wadBytes(kind, lumps):
+    """ Builds WAD file in memory.
+
+    Args:
+    kind - b'IWAD' or b'PWAD'
+    lumps - list of (name, data) tuples
+
+    Return:
+    Contents of file as bytes.
+    """
+    data = bytearray()
+    directory = bytearray()
+    offset = WAD_HEADER.size
+    for name, lump in lumps:
+        directory += WAD_ENTRY.pack(offset, len(lump), name.encode('ascii'))
+        data += lump
+        offset += len(lump)
+    return WAD_HEADER.pack(kind, len(lumps), offset) + bytes(data) + bytes(directory)
+
+def mapLumps(rng, maps, lump_size):
+    lumps = []
+    for i in range(1, maps + 1):
+        lumps.append(('MAP{0:02d}'.format(i), b''))
+        for name in MAP_LUMPS:
+            lumps.append((name, randomBytes(rng, rng.randint(0, lump_size))))
+    return lumps
+
+def writeWad(path, kind, lumps):
+    with open(path, 'wb') as file:
+        file.write(wadBytes(kind, lumps))
+
+def writePk3(path, rng, entries, iwad = False):
+    """ Writes PK3 with given number of members, every tenth one deflated.
+
+    """
+    with zipfile.ZipFile(path, 'w') as pk3:
+        if iwad:
+            pk3.writestr('iwadinfo.txt', 'IWad { Name = "Benchmark" }')
+        for i in range(entries):
+            folder = wadscan.LUMPS[i % len(wadscan.LUMPS)]
+            compression = zipfile.ZIP_DEFLATED if i % 10 == 0 else zipfile.ZIP_STORED
+            pk3.writestr(zipfile.ZipInfo('{0}/LUMP{1:05d}.lmp'.format(folder, i)), randomBytes(rng, rng.randint(16, 512)), compression)
+        pk3.writestr('maps/MAP01.wad', wadBytes(b'PWAD', mapLumps(rng, 1, 256)))
+
+def writeBig(path, rng, size):
+    """ Writes PWAD with one huge lump, in blocks, so memory use stays low.
+
+    """
+    block = randomBytes(rng, BLOCK_SIZE)
+    blocks = max(1, size // BLOCK_SIZE)
+    with open(path, 'wb') as file:
+        file.write(WAD_HEADER.pack(b'PWAD', 1, WAD_HEADER.size + blocks * BLOCK_SIZE))
+        for i in range(blocks):
+            file.write(block)
+        file.write(WAD_ENTRY.pack(WAD_HEADER.size, blocks * BLOCK_SIZE, b'BIGLUMP'))
+
+def corpusFolders(root, depth, fanout):
+    """ Paths of nested folders corpus is spread over.
+
+    """
+    folders = [root]
+    level = [root]
+    for i in range(depth):
+        level = [os.path.join(parent, '{0}{1}'.format(WORDS[j % len(WORDS)], j)) for parent in level for j in range(fanout)]
+        folders.extend(level)
+    return folders
+
+def makeCorpus(root, params):
+    """ Generates synthetic WAD folder, unless one with same parameters exists.
+
+    Corpus has IWADs and PWADs with valid headers and directories, PK3s
+    and IPK3s with many members, large files for hashing, plus broken
+    WADs and unrelated files scan is supposed to skip.
+
+    Args:
+    root - folder to generate corpus in
+    params - dictionary of corpus parameters, see main()
+
+    Return:
+    Number of files written, 0 if existing corpus was reused.
+    """
+    manifest = os.path.join(root, 'corpus.json')
+    wanted = dict(params, version = CORPUS_VERSION)
+    try:
+        with open(manifest, 'r') as file:
+            if json.load(file) == wanted:
+                return 0
+    except (OSError, ValueError):
+        pass
+    if os.path.isdir(root):
+        for path, folders, files in os.walk(root, topdown = False):
+            for name in files:
+                os.remove(os.path.join(path, name))
+            for name in folders:
+                os.rmdir(os.path.join(path, name))
+    rng = random.Random(params['seed'])
+    folders = corpusFolders(root, params['depth'], params['fanout'])
+    for folder in folders:
+        os.makedirs(folder, exist_ok = True)
+    count = 0
+    def place(name):
+        return os.path.join(rng.choice(folders), name)
+    for i in range(params['iwads']):
+        writeWad(place('iwad{0}.wad'.format(i)), b'IWAD', [('PLAYPAL', randomBytes(rng, 10752)), ('COLORMAP', randomBytes(rng, 8704))] + mapLumps(rng, 32, 2048))
+        count += 1
+    for i in range(params['pwads']):
+        name = '{0}_{1}{2}.wad'.format(rng.choice(WORDS), rng.choice(WORDS), i)
+        writeWad(place(name), b'PWAD', mapLumps(rng, rng.randint(1, 8), 1024))
+        count += 1
+    for i in range(params['pk3s']):
+        iwad = i % 20 == 0
+        name = '{0}{1}.{2}'.format(rng.choice(WORDS), i, 'ipk3' if iwad else 'pk3')
+        writePk3(place(name), rng, params['pk3_entries'], iwad)
+        count += 1
+    for i in range(params['big']):
+        writeBig(place('big{0}.wad'.format(i)), rng, params['big_size'] * BLOCK_SIZE)
+        count += 1
+    # Things scan has to throw away
+    for i in range(max(1, params['pwads'] // 20)):
+        with open(place('broken{0}.wad'.format(i)), 'wb') as file:
+            file.write(randomBytes(rng, 64))
+        with open(place('readme{0}.txt'.format(i)), 'w') as file:
+            file.write('Not a WAD.\n')
+        count += 2
+    with open(manifest, 'w') as file:
+        json.dump(wanted, file)
+    return count
+
+def corpusFiles(root):
+    """ Paths of all files with WAD extensions in corpus.
+
+    """
+    result = []
+    for path, folders, files in os.walk(root):
+        folders.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in wadscan.EXTS:
+                result.append(os.path.join(path, name))
+    return result
+
+# ================================================================
+# Measuring
+# ================================================================
+def measure(function, repeat, setup = None):
+    """ Runs function several times, timing each run.
+
+    Args:
+    function - function to time, gets result of setup if there's one
+    repeat - number of runs
+    setup - function run before each run, not timed
+
+    Return:
+    Tuple (dictionary of timings, result of last run).
+    """
+    times = []
+    result = None
+    for i in range(repeat):
+        state = setup() if setup else None
+        start = timer()
+        result = function(state) if setup else function()
+        times.append(timer() - start)
+    return {'min': min(times), 'median': median(times), 'max': max(times), 'repeat': repeat}, result
+
+def gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)),
+                                       stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runBenchmarks(root, workdir, repeat, workers, pool):
+    """ Times every benchmark over corpus.
+
+    Program is imported from inside workdir, so it keeps its settings,
+    caches and index there, not next to real ones. Its output goes to
+    stderr, stdout is left for results.
+
+    Return:
+    Dictionary of results by benchmark name.
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    os.makedirs(workdir, exist_ok = True)
+    os.chdir(workdir)
+    results = {}
+    files = corpusFiles(root)
+    total = sum(os.path.getsize(path) for path in files)
+    def record(name, timings, items):
+        timings['items'] = items
+        timings['per_item'] = timings['min'] / items if items else None
+        results[name] = timings
+        print('{0:<24} {1:9.4f} s  ({2} items)'.format(name, timings['min'], items), file = sys.stderr)
+    with redirect_stdout(sys.stderr):
+        import main_window as app
+        app.bootstrap()
+        # Hashing
+        def hashAll(cache):
+            app.file_cache = cache
+            for path in files:
+                app.fileToHash(path)
+            return cache
+        timings, cache = measure(hashAll, repeat, lambda: FileCache(None))
+        timings['bytes'] = total
+        record('fileToHash cold', timings, len(files))
+        timings, cache = measure(lambda: hashAll(cache), repeat)
+        record('fileToHash warm', timings, len(files))
+        # Classification, what checkWAD used to do
+        timings, kinds = measure(lambda: [wadscan.classifyWAD(path) for path in files], repeat)
+        record('checkWAD', timings, len(files))
+        # Full scan
+        timings, tree = measure(lambda state: wadscan.scanFolders(root, True, state[0], workers, pool, state[1]), repeat,
+                                lambda: (FileCache(None), wadscan.DirCache(None)))
+        record('scanFolders cold', timings, len(files))
+        caches = (FileCache(None), wadscan.DirCache(None))
+        wadscan.scanFolders(root, True, caches[0], workers, pool, caches[1])
+        timings, tree = measure(lambda: wadscan.scanFolders(root, True, caches[0], workers, pool, caches[1]), repeat)
+        record('scanFolders warm', timings, len(files))
+        # Model population
+        scanned = list(tree.walk()) if tree else []
+        def populate():
+            library = app.Library()
+            library.checkWADs(scanned)
+            return library
+        timings, library = measure(populate, repeat)
+        record('model population', timings, len(scanned))
+        timings, found = measure(lambda: [library.search.search(query) for query in QUERIES], repeat)
+        record('search', timings, len(QUERIES))
+        timings, none = measure(lambda: library.wad_model.sort(0), repeat)
+        record('sort', timings, len(library.items))
+        # Loading saved lists
+        app.saveWADList(library)
+        def loadAll():
+            lists = {}, {}
+            app.loadWADList('PWAD', lists[0])
+            app.loadWADList('IWAD', lists[1])
+            return lists
+        timings, lists = measure(loadAll, repeat)
+        record('loadWADList', timings, len(lists[0]) + len(lists[1]))
+        app.index.close()
+    return results
+
+def compare(old, new, threshold):
+    """ Prints changes between two result files.
+
+    Return:
+    List of names of benchmarks that got slower than threshold allows.
+    """
+    slower = []
+    print('{0:<24} {1:>10} {2:>10} {3:>8}'.format('benchmark', 'old', 'new', 'ratio'))
+    for name, timings in new['results'].items():
+        before = old['results'].get(name)
+        if before is None or not before['min']:
+            print('{0:<24} {1:>10} {2:10.4f}'.format(name, '-', timings['min']))
+            continue
+        ratio = timings['min'] / before['min']
+        flag = ''
+        if ratio > threshold:
+            slower.append(name)
+            flag = '  SLOWER'
+        print('{0:<24} {1:10.4f} {2:10.4f} {3:8.2f}{4}'.format(name, before['min'], timings['min'], ratio, flag))
+    return slower
+
+# ================================================================
+# Main
+# ================================================================
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmarks of WAD scanning and list handling.')
+    parser.add_argument('--corpus', default = os.path.join(tempfile.gettempdir(), 'frontdoom-bench', 'corpus'), help = 'folder of synthetic corpus')
+    parser.add_argument('--iwads', type = int, default = 20)
+    parser.add_argument('--pwads', type = int, default = 2000)
+    parser.add_argument('--pk3s', type = int, default = 200)
+    parser.add_argument('--pk3-entries', type = int, default = 500)
+    parser.add_argument('--big', type = int, default = 2, help = 'number of large files')
+    parser.add_argument('--big-size', type = int, default = 64, help = 'size of large files in MB')
+    parser.add_argument('--depth', type = int, default = 4, help = 'depth of nested folders')
+    parser.add_argument('--fanout', type = int, default = 3, help = 'subfolders per folder')
+    parser.add_argument('--seed', type = int, default = 1)
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--workers', type = int, default = min(8, os.cpu_count() or 1))
+    parser.add_argument('--pool', choices = sorted(wadscan.POOLS), default = 'thread')
+    parser.add_argument('-o', '--output', help = 'write JSON results to file instead of stdout')
+    parser.add_argument('--compare', help = 'JSON results of earlier run to compare with')
+    parser.add_argument('--threshold', type = float, default = 1.25, help = 'ratio above which benchmark counts as slower')
+    args = parser.parse_args(argv)
+
+    root = os.path.abspath(args.corpus)
+    params = {'iwads': args.iwads, 'pwads': args.pwads, 'pk3s': args.pk3s, 'pk3_entries': args.pk3_entries,
+              'big': args.big, 'big_size': args.big_size, 'depth': args.depth, 'fanout': args.fanout, 'seed': args.seed}
+    start = timer()
+    written = makeCorpus(root, params)
+    if written:
+        print('Generated corpus of {0} files in {1:.1f} seconds.'.format(written, timer() - start), file = sys.stderr)
+    output = os.path.abspath(args.output) if args.output else None
+    old = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            old = json.load(file)
+
+    report = {
+        'commit': gitCommit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'workers': args.workers,
+        'pool': args.pool,
+        'corpus': params,
+        'results': runBenchmarks(root, os.path.join(os.path.dirname(root), 'work'), args.repeat, args.workers, args.pool),
+    }
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent = 2)
+    elif old is None:
+        print(json.dumps(report, indent = 2))
+    if old is not None:
+        if old.get('corpus') != params:
+            print('Warning: corpus parameters differ from compared run.', file = sys.stderr)
+        if compare(old, report, args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
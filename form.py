@@ -16,7 +16,14 @@ class Ui_MainWindow(object):
         self.horizontal_lists = QtWidgets.QHBoxLayout()
         self.vertical_main.addLayout(self.horizontal_lists)
         
-        # Left block is tabbed list WADs
+        # Left block is search box over tabbed list WADs
+        self.vertical_wads = QtWidgets.QVBoxLayout()
+        self.horizontal_lists.addLayout(self.vertical_wads)
+        self.search_box = QtWidgets.QLineEdit(self.centralwidget)
+        self.search_box.setPlaceholderText("Search WADs")
+        self.search_box.setClearButtonEnabled(True)
+        self.vertical_wads.addWidget(self.search_box)
+        
         self.tabs = QtWidgets.QTabWidget(self.centralwidget)
         self.tab_installed = QtWidgets.QWidget()
         self.tab_installed_horizontal = QtWidgets.QHBoxLayout()
@@ -24,6 +31,11 @@ class Ui_MainWindow(object):
         self.wad_list = QtWidgets.QTreeView(self.centralwidget)
         self.wad_list.setUniformRowHeights(True)
         #self.wad_list.setHeaderHidden(True)
+        self.wad_list.header().setSectionsClickable(True)
+        self.wad_list.header().setSortIndicatorShown(True)
+        self.wad_list.header().setSortIndicator(-1, QtCore.Qt.AscendingOrder)
+        self.wad_list.header().setStretchLastSection(False)
+        self.wad_list.header().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
         self.tab_installed_horizontal.addWidget(self.wad_list)
         
         self.tab_installed.setLayout(self.tab_installed_horizontal)
@@ -35,13 +47,14 @@ class Ui_MainWindow(object):
         self.cat_list = QtWidgets.QTreeView(self.centralwidget)
         self.cat_list.setUniformRowHeights(True)
         self.cat_list.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
+        self.cat_list.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
         #self.wad_list.setHeaderHidden(True)
         self.tab_folders_horizontal.addWidget(self.cat_list)
         
         self.tab_folders.setLayout(self.tab_folders_horizontal)
         self.tabs.addTab(self.tab_folders, 'Folder view')
         
-        self.horizontal_lists.addWidget(self.tabs)
+        self.vertical_wads.addWidget(self.tabs)
         
         # First block is IWAD choice and related things
         self.vertical_iwad = QtWidgets.QVBoxLayout()
@@ -50,11 +63,29 @@ class Ui_MainWindow(object):
         self.vertical_iwad.addWidget(self.iwad_label)
         self.iwad_select = QtWidgets.QComboBox(self.centralwidget)
         self.vertical_iwad.addWidget(self.iwad_select)
-        #self.map_label = QtWidgets.QLabel("Map:", self.centralwidget)
-        
-        # Second block is list of PWADs of user's choice.
-        #self.load_list = QtWidgets.QListView(self.centralwidget)
-        #self.horizontal_lists.addWidget(self.load_list)
+        self.map_label = QtWidgets.QLabel("Map:", self.centralwidget)
+        self.vertical_iwad.addWidget(self.map_label)
+        self.map_select = QtWidgets.QComboBox(self.centralwidget)
+        self.map_select.setSizeAdjustPolicy(QtWidgets.QComboBox.AdjustToMinimumContentsLengthWithIcon)
+        self.map_select.setMinimumContentsLength(16)
+        self.vertical_iwad.addWidget(self.map_select)
+        # Title picture of WAD selected in list
+        self.preview_label = QtWidgets.QLabel(self.centralwidget)
+        self.preview_label.setAlignment(QtCore.Qt.AlignCenter)
+        self.preview_label.setMinimumSize(QtCore.QSize(160, 120))
+        self.vertical_iwad.addWidget(self.preview_label)
+        self.vertical_iwad.addStretch()
+        
+        # Second block is list of PWADs of user's choice, in load order.
+        # Files are dragged around to change it.
+        self.vertical_load = QtWidgets.QVBoxLayout()
+        self.horizontal_lists.addLayout(self.vertical_load)
+        self.load_label = QtWidgets.QLabel("Load order:", self.centralwidget)
+        self.vertical_load.addWidget(self.load_label)
+        self.load_list = QtWidgets.QListWidget(self.centralwidget)
+        self.load_list.setDragDropMode(QtWidgets.QAbstractItemView.InternalMove)
+        self.load_list.setDefaultDropAction(QtCore.Qt.MoveAction)
+        self.vertical_load.addWidget(self.load_list)
 
         # Lower-most section is delegated to launch-game button
         self.horizontal_buttons = QtWidgets.QHBoxLayout()
@@ -1,26 +1,46 @@
 # ================================================================
 # Imports
 # ================================================================
-import sys, os, subprocess, configparser, json, getpass, zipfile, hashlib#, time, urllib.request
-from functools import partial
 from timeit import default_timer as timer
+# Start of program, for measuring how long it takes to show up
+STARTED = timer()
+import sys, os, time, getpass, threading, traceback, codecs#, urllib.request
+from functools import partial
+from collections import deque
 
 import PyQt5
 from PyQt5 import QtWidgets, QtCore, QtGui
 
 import form
+from wadmodel import Node, WADTreeModel, WADResultModel, WADCategoryModel, sizeText
+from wadsearch import SearchIndex
+import wadscan
+from wadhash import FileCache, fingerprint, hashFile, isFingerprintKey
+from wadindex import WADIndex
+from wadlaunch import loadPrefs, buildCommand
+import waddupes
+from wadconflict import LumpCache, ConflictAnalyzer
+import wadpreview
+import wadmaps
+from wadorder import LoadOrder
+from wadident import GAMES, IdentCache
+from wadtags import TagStore
+import wadtrace
+from wadtrace import span
 # ================================================================
 # Constants
 # ================================================================
-EXTS = ['.wad', '.pk3', '.pk7', '.ipk3', '.zip']
-LUMPS = ['acs', 'colormaps', 'filter', 'flats', 'graphics', 'hires', 'maps', 'music', 'patches', 'sounds', 'sprites', 'textures', 'voices', 'voxels']
-LOGOS = {'doom.wad': "images/doom.png",
-            'doom2.wad':"images/doom2.png",
-            'heretic.wad':"images/heretic.png",
-            'hexen.wad':"images/hexen.png",
-            'strife1.wad':"images/strife.png",
-            'chex.wad':"images/chexquest.png",
-            'def':"images/no_logo.png"}
+# Shown for games without logo, logos of known games are in wadident.GAMES
+NO_LOGO = "images/no_logo.png"
+
+# Biggest size of preview thumbnails
+THUMB_SIZE = QtCore.QSize(320, 240)
+# Lines of game output kept per session
+LOG_LINES = 5000
+# What main window does while game runs, see MyWindowClass.launchGame
+LAUNCH_BEHAVIOURS = {'hide': 'Hide window', 'minimize': 'Minimize window', 'stay': 'Leave window as it is'}
+# Category WADs without any tags are shown in, can't be removed
+DEFAULT_CAT = "Unsorted"
 
 if sys.platform.startswith('win32'):
     PLATFORM = 'WIN'
@@ -33,251 +53,970 @@ else:
 # ================================================================
 # Classes
 # ================================================================        
-class WADListItem(PyQt5.QtGui.QStandardItem):
-    """List item class.
+class VerifyThread(QtCore.QThread):
+    """ Background checksum verification of saved WAD lists.
     
-    Links to relevant item from list of WADs.
+    Startup only compares fingerprints, actual hashing of files is left
+    to this thread, so window shows up right away. Result for every
+    checked file is sent back with "checked" signal.
     """
+    checked = QtCore.pyqtSignal(str, bool)
     
-    def __init__(self, wad):
-        super().__init__()
-        self.wad = wad
-        self.setText(wad.name())        
-        
-    def __lt__(a, b):
-        """ "Less than" function.
+    def __init__(self, items, parent = None):
+        """
+        Args:
+        items - list of WADItem objects to verify
+        """
+        super().__init__(parent)
+        self.items = items
         
-        Required by Qt to do sorting in lists.    
+    def run(self):
+        for item in self.items:
+            if self.isInterruptionRequested():
+                return
+            try:
+                fp = fingerprint(item.path)
+                ok = hashFile(item.path) == item.hash
+            except OSError:
+                ok = False
+            if ok:
+                item.fp = fp
+            self.checked.emit(item.path, ok)
+            
+class HashThread(QtCore.QThread):
+    """ Hashes files scans filed under fingerprint keys.
+    
+    Scans only read headers, see wadscan.examineFile, so new files are
+    hashed here afterwards, one by one. Caches are left to GUI thread,
+    "hashed" sends it path, hash and fingerprint of every file.
+    """
+    hashed = QtCore.pyqtSignal(str, str, list)
+    
+    def __init__(self, items, parent = None):
         """
-        if a.text() < b.text():
-            return True
-        else:
-            return False
+        Args:
+        items - list of paths to hash
+        """
+        super().__init__(parent)
+        self.items = items
+        
+    def run(self):
+        with span('hash.pass', files = len(self.items)):
+            for path in self.items:
+                if self.isInterruptionRequested():
+                    return
+                try:
+                    fp = fingerprint(path)
+                    hash = hashFile(path)
+                except OSError as error:
+                    print('{0}: {1}'.format(path, error))
+                    continue
+                self.hashed.emit(path, hash, fp)
             
 class WADItem:
-    def __init__(self, path, cat = "Unsorted"):
+    def __init__(self, path, hash, fp = None, meta = None):
         super().__init__()
         self.path = path
-        self.cat = cat
+        # MD5 of file, or fingerprint key until it's hashed, see HashThread
+        self.hash = hash
+        # Things extracted from file, e.g. 'maps', kept in WAD index.
+        # 'added' marks files added by hand, see Library.keepMissing
+        self.meta = meta or {}
+        # Fingerprint of file when its hash was last confirmed, see
+        # wadhash.fingerprint. Items loaded with fingerprint that no
+        # longer matches file on disk are marked unverified.
+        self.fp = fp
+        self.verified = True
         
     def name(self):
         return os.path.basename(self.path)
         
+    def searchTexts(self):
+        """ What search box finds WAD by - path and map titles.
+        
+        Categories are added by Library, they are kept apart from WAD.
+        """
+        return [self.path] + [title for name, title in self.meta.get('maps', ())]
+        
 
-# ================================================================
-# Functions
-# ================================================================
-def saveWADList(filename, dictionary):
-    """ Saves list of WADItem objects.
+class Library:
+    """ WAD lists together with item models showing them.
     
-    Function writes JSON file with list of WAD files which consists of:
-    hash - hash of file
-    item.path - file path
-    item.cat - assigned category
+    Everything is keyed by file path, copies of one file are separate
+    entries sharing hash. Tags go by hash, so copies share them too.
+    Rescans fill new library while old one stays on screen, once scan
+    is done useLibrary() swaps it in.
+    """
     
-    Args:
-    filename - where to save
-    dictionary - what to save
+    def __init__(self, store = None):
+        """ Creates empty library.
+        
+        Args:
+        store - TagStore with tags of PWADs, by default program-wide one,
+                or empty store if bootstrap() hasn't made it
+        """
+        if store is None:
+            store = tags if tags is not None else TagStore()
+        self.tags = store
+        # WADItem objects by path
+        self.wad_list = {}
+        self.iwad_list = {}
+        # Nodes by path
+        self.items = {}
+        # Nodes by hash, {path: node} for every copy of file
+        self.copies = {}
+        # Folder nodes by path, created once first WAD inside shows up
+        self.folders = {}
+        self.iwad_model = WADTreeModel(lazy = False)
+        self.wad_model = WADTreeModel()
+        # Same PWAD nodes as wad_model, grouped by tags, see TagStore
+        self.cat_model = WADCategoryModel(groupsOf = self.categories)
+        # PWADs by path, for search box
+        self.search = SearchIndex()
+        
+    def modelOf(self, path):
+        return self.iwad_model if path in self.iwad_list else self.wad_model
+        
+    def nodesOf(self, hash):
+        """ Nodes of every copy of file with given hash.
+        
+        """
+        return list(self.copies.get(hash, {}).values())
+        
+    def pwadNodes(self, hashes):
+        """ Nodes of PWADs having any of given hashes.
+        
+        """
+        return [node for hash in hashes for node in self.nodesOf(hash) if node.checkable]
+        
+    def makeNode(self, wad, kind, search = True):
+        """ Creates model node for WAD, without putting it anywhere.
+        
+        Args:
+        wad - WADItem object
+        kind - 'IWAD' or 'PWAD'
+        search - if False, PWAD is left out of search index
+        """
+        node = Node(wad.name(), wad, wad.hash, kind == 'PWAD')
+        node.checked = node.checkable and wad.path in config_current['-file']
+        self.items[wad.path] = node
+        self.copies.setdefault(wad.hash, {})[wad.path] = node
+        if kind == 'PWAD' and search:
+            self.search.add(wad.path, wad.searchTexts() + self.tags.tagsOf(wad.hash))
+        return node
+        
+    def addWADItem(self, wad, kind, root = None):
+        """ Puts WAD into relevant list and item model.
+        
+        Args:
+        wad - WADItem object
+        kind - 'IWAD' or 'PWAD'
+        root - folder node to append PWADs to, top of the tree by default
+        
+        Return:
+        New Node object.
+        """
+        self.removeWAD(wad.path)
+        (self.iwad_list if kind == 'IWAD' else self.wad_list)[wad.path] = wad
+        node = self.makeNode(wad, kind)
+        if kind == 'IWAD':
+            self.iwad_model.appendNodes(None, [node])
+        else:
+            self.wad_model.appendNodes(root, [node])
+            self.addToCategories([node])
+        return node
+        
+    def removeWAD(self, path):
+        """ Takes file out of lists and models, along with folders left empty.
+        
+        Args:
+        path - path to file
+        
+        Return:
+        True if file was known.
+        """
+        node = self.items.pop(path, None)
+        if node is None:
+            return False
+        model = self.modelOf(path)
+        self.wad_list.pop(path, None)
+        self.iwad_list.pop(path, None)
+        self.forgetCopy(node)
+        self.search.remove(path)
+        if node.checkable:
+            for name in self.categories(node):
+                self.cat_model.removeNodes(name, [node])
+        while True:
+            parent = node.parent
+            model.removeNode(node)
+            if parent is model.root or parent.children:
+                break
+            for key, value in list(self.folders.items()):
+                if value is parent:
+                    del self.folders[key]
+            node = parent
+        return True
+        
+    def forgetCopy(self, node):
+        copies = self.copies.get(node.hash)
+        if copies is not None:
+            copies.pop(node.wad.path, None)
+            if not copies:
+                del self.copies[node.hash]
+        
+    def addSaved(self):
+        """ Fills models with what's on the lists.
+        
+        Search index comes ready with lists, see LoadThread.
+        """
+        self.iwad_model.appendNodes(None, [self.makeNode(item, 'IWAD') for item in self.iwad_list.values()])
+        self.wad_model.appendNodes(None, [self.makeNode(item, 'PWAD', False) for item in self.wad_list.values()])
+        self.fillCategories()
+        
+    def categories(self, node):
+        """ Names of categories PWAD is shown in, its tags or default one.
+        
+        """
+        return self.tags.tagsOf(node.hash) or [DEFAULT_CAT]
+        
+    def fillCategories(self):
+        """ Shows every tag in category model, with single model reset.
+        
+        Rows come straight from inverted index of TagStore, WADs without
+        tags go to default category.
+        """
+        groups = [(DEFAULT_CAT, [self.items[path] for path, wad in self.wad_list.items() if not self.tags.tagsOf(wad.hash)])]
+        for tag in self.tags.names():
+            groups.append((tag, self.pwadNodes(self.tags.hashes(tag))))
+        self.cat_model.setGroups(groups)
+        
+    def addToCategories(self, nodes):
+        """ Puts PWAD nodes into category model, one insert per category.
+        
+        """
+        groups = {}
+        for node in nodes:
+            for name in self.categories(node):
+                groups.setdefault(name, []).append(node)
+        for name, group in groups.items():
+            self.cat_model.addNodes(name, group)
+            
+    def addCategory(self, name):
+        self.tags.addTag(name)
+        index.setValue('tags', self.tags.names())
+        self.cat_model.addGroup(name)
+        
+    def tagWADs(self, nodes, tag):
+        """ Gives tag to many PWADs, with one write to index.
+        
+        Tags go by hash, so copies of given WADs get it too. WADs that
+        had no tags leave default category.
+        
+        Args:
+        nodes - list of PWAD Node objects
+        tag - name of category
+        """
+        known = tag in self.tags
+        added = self.tags.tag(list(dict.fromkeys(node.hash for node in nodes)), tag)
+        nodes = self.pwadNodes(added)
+        if not known:
+            index.setValue('tags', self.tags.names())
+            self.cat_model.addGroup(tag)
+        self.cat_model.removeNodes(DEFAULT_CAT, [node for node in nodes if self.tags.tagsOf(node.hash) == [tag]])
+        self.cat_model.addNodes(tag, nodes)
+        index.tagWADs(tag, added)
+        self.updateSearch(nodes)
+        
+    def untagWADs(self, nodes, tag):
+        """ Takes tag from many PWADs, see tagWADs.
+        
+        WADs left without tags go to default category.
+        """
+        removed = self.tags.untag(list(dict.fromkeys(node.hash for node in nodes)), tag)
+        nodes = self.pwadNodes(removed)
+        self.cat_model.removeNodes(tag, nodes)
+        self.cat_model.addNodes(DEFAULT_CAT, [node for node in nodes if not self.tags.tagsOf(node.hash)])
+        index.untagWADs(tag, removed)
+        self.updateSearch(nodes)
+        
+    def moveWADs(self, nodes, old, new):
+        """ Moves PWADs from one category to another.
+        
+        Default category isn't a tag, moving there only takes old tag.
+        """
+        if new != DEFAULT_CAT:
+            self.tagWADs(nodes, new)
+        if old != DEFAULT_CAT:
+            self.untagWADs(nodes, old)
+            
+    def removeCategory(self, name):
+        """ Deletes tag, in one step no matter how many WADs have it.
+        
+        """
+        hashes = self.tags.removeTag(name)
+        index.removeTag(name)
+        index.setValue('tags', self.tags.names())
+        self.cat_model.removeGroup(name)
+        nodes = self.pwadNodes(hashes)
+        self.cat_model.addNodes(DEFAULT_CAT, [node for node in nodes if not self.tags.tagsOf(node.hash)])
+        self.updateSearch(nodes)
+        
+    def updateSearch(self, nodes):
+        """ Lets search index know tags or map titles of PWADs changed.
+        
+        """
+        for node in nodes:
+            self.search.add(node.wad.path, node.wad.searchTexts() + self.tags.tagsOf(node.hash))
+        
+    def rekey(self, path, new):
+        """ Files WAD under its real hash, in place of fingerprint key.
+        
+        Tags given to WAD meanwhile go along with it.
+        
+        Return:
+        Node of WAD, None if it's not in library anymore.
+        """
+        node = self.items.get(path)
+        if node is None:
+            return None
+        old = node.hash
+        self.forgetCopy(node)
+        self.copies.setdefault(new, {})[path] = node
+        if node.checkable:
+            for name in self.categories(node):
+                self.cat_model.removeNodes(name, [node])
+            for tag in self.tags.tagsOf(old):
+                self.tags.tag([new], tag)
+                index.tagWADs(tag, [new])
+                if old not in self.copies:
+                    self.tags.untag([old], tag)
+                    index.untagWADs(tag, [old])
+        node.hash = node.wad.hash = new
+        if node.checkable:
+            self.addToCategories([node])
+            self.updateSearch([node])
+        return node
+        
+    def folderNode(self, folder):
+        """ Node of scanned folder, created along with its parents.
+        
+        Args:
+        folder - wadscan.ScanFolder object
+        """
+        if folder is None:
+            return None
+        node = self.folders.get(folder.path)
+        if node is None:
+            node = Node(folder.name())
+            # Folders reported by FolderWatcher come without parents
+            if folder.parent is None:
+                parent = self.folders.get(os.path.dirname(folder.path))
+            else:
+                parent = self.folderNode(folder.parent)
+            self.wad_model.appendNodes(parent, [node])
+            self.folders[folder.path] = node
+        return node
+        
+    def checkWADs(self, results, previous = None):
+        """ Files WADs found by scan into lists and item models.
+        
+        Metadata WAD had in previous library is kept. IWADs go to IWAD
+        model, PWADs are appended under their folder. Nodes are inserted
+        into models in bulk, one insert per folder.
+        See wadscan.classifyWAD for how type of WAD is decided.
+        
+        Args:
+        results - list of wadscan.ScanResult objects
+        previous - library that's being replaced
+        """
+        with span('model.insert', items = len(results)):
+            self.fileResults(results, previous)
+            
+    def fileResults(self, results, previous):
+        iwads = []
+        pwads = {}
+        for result in results:
+            if result.path in self.items:
+                self.removeWAD(result.path)
+            old = previous.items.get(result.path) if previous else None
+            meta = old.wad.meta if old is not None and old.hash == result.hash else None
+            wad = WADItem(result.path, result.hash, result.fp, meta)
+            (self.iwad_list if result.kind == 'IWAD' else self.wad_list)[result.path] = wad
+            node = self.makeNode(wad, result.kind)
+            if result.kind == 'IWAD':
+                iwads.append(node)
+            else:
+                pwads.setdefault(self.folderNode(result.parent), []).append(node)
+        if iwads:
+            self.iwad_model.appendNodes(None, iwads)
+        for parent, nodes in pwads.items():
+            self.wad_model.appendNodes(parent, nodes)
+        self.addToCategories([node for nodes in pwads.values() for node in nodes])
+        
+    def keepMissing(self, previous, roots):
+        """ Takes over WADs scan didn't find, but which still exist.
+        
+        Those are files added by hand from outside of WAD folders, marked
+        with 'added' in their metadata. Anything else scan didn't find,
+        including files of folders no longer in WAD paths, is dropped.
+        
+        Args:
+        previous - library that's being replaced
+        roots - folders scan went through
+        """
+        roots = tuple(os.path.join(os.path.abspath(root), '') for root in roots if root)
+        for old, new, kind in ((previous.iwad_list, self.iwad_list, 'IWAD'), (previous.wad_list, self.wad_list, 'PWAD')):
+            nodes = []
+            for path, wad in old.items():
+                if not wad.meta.get('added') or path in self.items or os.path.abspath(path).startswith(roots):
+                    continue
+                if os.path.exists(path):
+                    new[path] = wad
+                    nodes.append(self.makeNode(wad, kind))
+            if kind == 'IWAD':
+                self.iwad_model.appendNodes(None, nodes)
+            else:
+                self.wad_model.appendNodes(None, nodes)
+                self.addToCategories(nodes)
+                    
+    def syncChecks(self):
+        """ Sets check marks of PWADs according to current game config.
+        
+        """
+        for path, node in self.items.items():
+            if node.checkable:
+                self.wad_model.setChecked(node, path in config_current['-file'])
+        
+class LoadThread(QtCore.QThread):
+    """ Loads caches and saved WAD lists after window is shown.
     
+    Checking saved fingerprints means one stat per file, which is what
+    makes startup slow with big lists. Search index of PWADs is built
+    here too, models are built from loaded lists on GUI thread, once
+    thread finished.
     """
-    temp = []
-    for hash, item in dictionary.items():
-        temp.append([hash, item.path, item.cat])
-    try:
-        with open(filename, 'w') as file:
-            json.dump(temp, file)
-    except OSError:
-        print('Couldn\'t write WAD list to file {0}.'.format(filename))
-
-def loadWADList(filename, dictionary):
-    """ Loads list of "installed" WADs.
     
-    Function reads JSON file with list of WAD files which consists of:
-    l[0] - hash of file
-    l[1] - file path
-    l[2] - assigned category
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.wad_list = {}
+        self.iwad_list = {}
+        self.search = SearchIndex()
+        
+    def run(self):
+        with span('startup.caches'):
+            file_cache.load()
+            dir_cache.load()
+            lump_cache.load()
+            thumb_cache.load()
+            ident_cache.load()
+        # SQLite connections can't be shared between threads
+        source = WADIndex(index.filename)
+        try:
+            loadWADList('PWAD', self.wad_list, source)
+            loadWADList('IWAD', self.iwad_list, source)
+            loadTags(tags, source)
+        finally:
+            source.close()
+        with span('startup.search', items = len(self.wad_list)):
+            for wad in self.wad_list.values():
+                self.search.add(wad.path, wad.searchTexts() + tags.tagsOf(wad.hash))
+            
+class ScanThread(QtCore.QThread):
+    """ Background scan of all WAD folders program uses.
     
-    Args:
-    filename - from where to load
-    dictionary - what to load
+    Results are sent to GUI thread in batches with "batch" signal,
+    "progress" tells how many files were examined out of how many.
+    If scan breaks halfway, "failed" is set, so results sent so far
+    aren't taken for whole library.
     """
-    try:
-        with open(filename, 'r') as file:
-            temp_list = json.load(file)
-        for item in temp_list:
-            if os.path.exists(item[1]):
-                if item[0] == fileToHash(item[1]):
-                    dictionary[item[0]] = WADItem(item[1], item[2])
-                else:
-                    print("{0} - incorrect checksum.")
-            else:
-                print("{0} - file does not exist.".format(item[1]))
-    except OSError:
-        print('Couldn\'t load WAD list from file {0}.'.format(filename))
-    return
+    batch = QtCore.pyqtSignal(list)
+    progress = QtCore.pyqtSignal(int, int)
+    
+    def __init__(self, paths, workers, pool, parent = None, files = None):
+        """
+        Args:
+        paths - folders to scan recursively
+        workers, pool - see wadscan.examineFiles
+        files - list of wadscan.ScanResult objects to examine on top of
+        what's found in folders
+        """
+        super().__init__(parent)
+        self.paths = paths
+        self.workers = workers
+        self.pool = pool
+        self.files = files or []
+        self.cancel = threading.Event()
+        self.failed = False
         
-def loadCats():
-    """ Everything is better with cats.
+    def run(self):
+        try:
+            self.scan()
+        except Exception:
+            self.failed = True
+            traceback.print_exc()
+            
+    def scan(self):
+        with span('scan', folders = len(self.paths)):
+            files = list(self.files)
+            for line in self.paths:
+                if not os.path.exists(line):
+                    print('Path {} does not exist.'.format(line))
+                    continue
+                files.extend(wadscan.listFolder(line, True, dircache = dir_cache).walk())
+            done = 0
+            self.progress.emit(done, len(files))
+            for batch in wadscan.examineFiles(files, file_cache, self.workers, self.pool, self.cancel):
+                done += len(batch)
+                self.batch.emit([file for file in batch if file.kind])
+                self.progress.emit(done, len(files))
+        
+class DupeThread(QtCore.QThread):
+    """ Looks for duplicate files in WAD folders, see waddupes.
     
+    Groups found end up in "groups", None if search was cancelled.
     """
-    global cats
-    try:
-        with open('CatsList.dat', 'r') as file:
-            cats = json.load(file)
-    except OSError:
-        print('Couldn\'t load cat list file.')
-    except json.decoder.JSONDecodeError:
-        print('CatsList.dat malformed. Please delete file and restart application.')
-        
-def saveCats():
-    """ Saves your cats for better times.
+    progress = QtCore.pyqtSignal(int, int)
     
+    def __init__(self, paths, parent = None):
+        super().__init__(parent)
+        self.paths = paths
+        self.groups = None
+        self.cancel = threading.Event()
+        
+    def run(self):
+        with span('dupes', folders = len(self.paths)):
+            files = []
+            for line in self.paths:
+                if os.path.exists(line):
+                    files.extend(result.path for result in wadscan.listFolder(line, True, dircache = dir_cache).walk())
+            self.groups = waddupes.findDuplicates(files, file_cache, self.cancel, self.progress.emit)
+        
+class PreviewThread(QtCore.QThread):
+    """ Makes thumbnails of title pictures, one file at a time.
+    
+    Only file requested last waits for its turn, so files skipped over
+    while going through list are never read. Thumbnails go into
+    thumb_cache, "ready" sends GUI thread hash of file and thumbnail.
+    Files still under fingerprint key aren't cached, key would only
+    be thrown away once they're hashed and it's no valid file name.
+    Thread starts with first request and runs until stop().
     """
-    try:
-        with open('CatsList.dat', 'w') as file:
-            json.dump(cats, file)
-    except OSError:
-        print('Couldn\'t write cats list file.')
-
-def checkCats(item):
-    """ Checks breed cat belongs to.
+    ready = QtCore.pyqtSignal(str, bytes)
     
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.pending = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        
+    def request(self, hash, path, fallback):
+        """ Asks for thumbnail, replacing request not started yet.
+        
+        Args:
+        hash, path - hash and path of file
+        fallback - file to take palette from, see wadpreview.extractPreview
+        """
+        with self.lock:
+            self.pending = (hash, path, fallback)
+        self.wake.set()
+        if not self.isRunning():
+            self.start()
+            
+    def stop(self):
+        self.requestInterruption()
+        self.wake.set()
+        self.wait()
+        
+    def run(self):
+        while not self.isInterruptionRequested():
+            self.wake.wait()
+            with self.lock:
+                self.wake.clear()
+                job, self.pending = self.pending, None
+            if job is None:
+                continue
+            hash, path, fallback = job
+            with span('preview.thumbnail'):
+                data = makeThumbnail(path, fallback)
+                if not isFingerprintKey(hash):
+                    thumb_cache.store(hash, data)
+            self.ready.emit(hash, data)
+            
+class MapThread(QtCore.QThread):
+    """ Reads map lists of files that don't have one yet, see wadmaps.
+    
+    Results are sent to GUI thread in batches of (hash, maps) tuples.
     """
-    global cats
-    item.cat = cats.setdefault(item.text(), 'All WADs')
-    if item.cat in cat_model_contents:
-        cat_model_contents[item.cat].appendRow(item.copy())
-        #print('CATS - Added {0} to listing'.format(item.text()))
-    else:
-        temp = WADListItem(item.cat, '', 0, 'Dog')
-        cat_model_contents[item.cat] = temp
-        temp.appendRow(item.copy())
-        cat_model.appendRow(temp)
-        #print('CATS - Added {0} to listing'.format(item.text()))
-
-def checkWAD(path, name, root):
-    """ Check supplied WAD to see what kind of beast it is.
-
-    WAD files can be of two main types - IWAD (Internal WAD), which is
-    game itself and requires nothing else to be played, or PWAD
-    (Patch WAD), which "patches" some IWAD with it's own data.
-    Function makes sure PWADs are separated from IWADs, process is
-    different for various formats.
+    batch = QtCore.pyqtSignal(list)
     
-    .wad files has 4-byte header which plainly states if it's I or P.
-    .pk3, .ipk3, .zip files must contain 'iwadinfo' file
-    .pk7 - not yet implemented, considered PWAD by default
-    .ipk7 - not yet implemented, considered IWAD by default
+    def __init__(self, files, workers, pool, parent = None):
+        """
+        Args:
+        files - list of (hash, path) tuples
+        workers, pool - see wadmaps.readAllMaps
+        """
+        super().__init__(parent)
+        self.files = files
+        self.workers = workers
+        self.pool = pool
+        self.cancel = threading.Event()
+        
+    def run(self):
+        hashes = dict((path, hash) for hash, path in self.files)
+        with span('maps', files = len(self.files)):
+            for batch in wadmaps.readAllMaps(list(hashes), self.workers, self.pool, self.cancel):
+                # Unreadable files get empty list, so they aren't tried again
+                self.batch.emit([(hashes[path], maps or []) for path, maps in batch])
+                
+class GameSession(QtCore.QObject):
+    """ Single running game, supervised with QProcess.
     
-    Args:
-    path - path to WAD file
-    name - name of WAD file
-    root - item to append to for data model
+    Nothing blocks while game runs. Output of both stdout and stderr is
+    kept, line by line, in ring buffer of LOG_LINES lines and sent out
+    with "output" signal as it comes. "ended" is emitted once game is
+    gone, be it by exiting, crashing or failing to start.
+    """
+    output = QtCore.pyqtSignal(object, str)
+    ended = QtCore.pyqtSignal(object)
     
-    Return:
-    New WADListItem object in either item list.
-    WADs with malformed headers are dropped.
+    def __init__(self, command, parent = None):
+        """
+        Args:
+        command - list of arguments, first one being executable
+        """
+        super().__init__(parent)
+        self.command = command
+        self.log = deque(maxlen = LOG_LINES)
+        self.started = None
+        self.exit_code = None
+        self.crashed = False
+        self.error = None
+        # Incomplete last line of each channel
+        self.partial = {}
+        # UTF-8 decoder of each channel, keeping characters split between
+        # reads until rest of them comes
+        self.decoders = {}
+        self.process = QtCore.QProcess(self)
+        self.process.readyReadStandardOutput.connect(partial(self.readOutput, QtCore.QProcess.StandardOutput))
+        self.process.readyReadStandardError.connect(partial(self.readOutput, QtCore.QProcess.StandardError))
+        self.process.finished.connect(self.processFinished)
+        self.process.errorOccurred.connect(self.processError)
+        
+    def name(self):
+        return '{0} ({1})'.format(os.path.basename(self.command[0]), time.strftime('%H:%M:%S', time.localtime(self.started)) if self.started else '-')
+        
+    def start(self):
+        self.started = time.time()
+        self.process.start(self.command[0], self.command[1:])
+        
+    def running(self):
+        return self.process.state() != QtCore.QProcess.NotRunning
+        
+    def readOutput(self, channel):
+        self.process.setReadChannel(channel)
+        if channel not in self.decoders:
+            self.decoders[channel] = codecs.getincrementaldecoder('utf-8')('replace')
+        self.addText(channel, self.decoders[channel].decode(bytes(self.process.readAll())))
+        
+    def addText(self, channel, text):
+        """ Splits output into lines, keeping incomplete last one.
+        
+        """
+        text = self.partial.pop(channel, '') + text
+        lines = text.split('\n')
+        if lines[-1]:
+            self.partial[channel] = lines[-1]
+        for line in lines[:-1]:
+            self.addLine(line.rstrip('\r'))
+            
+    def addLine(self, line):
+        self.log.append(line)
+        self.output.emit(self, line)
+        
+    def processFinished(self, code, status):
+        # Bytes of character cut off by end of output are shown as such
+        for channel, decoder in self.decoders.items():
+            self.addText(channel, decoder.decode(b'', final = True))
+        self.decoders = {}
+        for line in self.partial.values():
+            self.addLine(line)
+        self.partial = {}
+        self.exit_code = code
+        self.crashed = status == QtCore.QProcess.CrashExit
+        self.ended.emit(self)
+        
+    def processError(self, error):
+        # Only failure to start means game won't finish on its own
+        if error == QtCore.QProcess.FailedToStart:
+            self.error = self.process.errorString()
+            self.addLine('Couldn\'t start {0}: {1}'.format(self.command[0], self.error))
+            self.ended.emit(self)
+            
+    def status(self):
+        """ Short description of how session ended, None while running.
+        
+        """
+        if self.error is not None:
+            return 'failed to start'
+        if self.running() or self.started is None:
+            return None
+        if self.crashed:
+            return 'crashed'
+        return 'exited with code {0}'.format(self.exit_code)
+        
+class ListThread(QtCore.QThread):
+    """ Lists folder trees for FolderWatcher, using dir_cache.
+    
+    Trees end up in "trees", one wadscan.ScanFolder per existing folder.
     """
-    iwadStatus = False
-    temp_ext = os.path.splitext(name)[1].lower()
-    # Testing .wad file for status of stand-alone game
-    if temp_ext == '.wad':
-        with open(path, 'rb') as wad:
-            header = wad.read(4)
-            if header == b'IWAD':
-                iwadStatus = True
-            elif header == b'PWAD':
-                pass
-            else:
-                print('{0}{1}: WAD header not found'.format(path, name))
-                return
-    # Testing .ipk3 and .zip for status of stand-alone game
-    elif temp_ext in ['.ipk3', '.zip', '.pk3']:
-        pwadStatus = False
-        with zipfile.ZipFile(path, 'r') as wad:
-            for thing in wad.infolist():
-                #print('1 - {0}, 2 - {1}, 3 - {2}'.format(pwadStatus, thing.is_dir(), thing.filename.lower()))
-                if thing.filename.lower() == 'iwadinfo':
-                    iwadStatus = True
-                    break
-                elif not pwadStatus and thing.filename.partition('/')[0].lower() in LUMPS:
-                    pwadStatus = True
-        if not (pwadStatus or iwadStatus):
-            print('{0}{1}: not compatible with GZDoom'.format(path, name))
-            return    
-    # "Testing" .ipk7 for status of stand-alone game
-    if temp_ext == '.ipk7':
-        iwadStatus = True
+    
+    def __init__(self, paths, parent = None):
+        super().__init__(parent)
+        self.paths = paths
+        self.trees = []
+        
+    def run(self):
+        with span('watch.list', folders = len(self.paths)):
+            for line in self.paths:
+                if os.path.isdir(line):
+                    self.trees.append(wadscan.listFolder(line, True, dircache = dir_cache))
+                    
+class FolderWatcher(QtCore.QObject):
+    """ Watches WAD folders and reports what changed in them.
+    
+    Uses QFileSystemWatcher, which sits on top of inotify on Linux.
+    Events are collected for a moment before anything is reported, so
+    single download or unpacked archive cause only one update. Listing
+    of every watched folder is kept, so only files that actually came
+    or went are reported with "changed" signal:
+    removed - list of paths of files that are gone
+    added - list of wadscan.ScanResult objects for new files
+    Folders are listed in ListThread, watching starts once it's done.
+    """
+    changed = QtCore.pyqtSignal(list, list)
+    
+    def __init__(self, parent = None, delay = 1000):
+        super().__init__(parent)
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.folderChanged)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.flush)
+        self.pending = set()
+        self.held = False
+        # Folder path -> (set of WAD paths, set of subfolder paths)
+        self.listings = {}
+        # Top folders being watched, see watch
+        self.roots = ()
+        self.list_thread = None
+        # Threads of stopped watches, still running
+        self.stale_threads = []
+        
+    def watch(self, paths):
+        """ Starts watching given folders and everything inside them.
+        
+        Same folders as already watched are left alone, so watcher is
+        only rebuilt when settings actually changed.
+        """
+        paths = tuple(paths)
+        if paths == self.roots:
+            return
+        self.stop()
+        self.roots = paths
+        self.list_thread = ListThread(paths, self)
+        self.list_thread.finished.connect(self.listed)
+        self.list_thread.start(QtCore.QThread.LowPriority)
+        
+    def listed(self):
+        thread = self.sender()
+        if thread in self.stale_threads:
+            self.stale_threads.remove(thread)
+            return
+        self.list_thread = None
+        for tree in thread.trees:
+            self.register(tree)
                 
-    temp = WADListItem(name, path, 1)            
-    if iwadStatus:
-        iwad_model.appendRow(temp)
-        if name == config_current['-iwad']:
-            config_current['-iwad_index'] = iwad_model.rowCount()-1
-        #print('IWAD - Added {0} to listing'.format(temp.text()))
-    else:
-        if name in config_current['-file']:
-            temp.setCheckState(QtCore.Qt.Checked)
-        root.appendRow(temp)
-        #print('PWAD - Added {0} to listing'.format(temp.text()))
-        checkCats(temp)
-    return
-
-def scanFolders(path, recursive, parent):
-    """ Scan folder used for mods.
-
-    Runs through files, drops everything that's not a WAD on the first
-    glance, then checks if WADs are actually WADs, and of what type.
-    See checkWAD for more.
-
+    def stop(self):
+        self.timer.stop()
+        self.pending.clear()
+        self.roots = ()
+        if self.list_thread is not None:
+            self.stale_threads.append(self.list_thread)
+            self.list_thread = None
+        if self.listings:
+            self.watcher.removePaths(list(self.listings.keys()))
+        self.listings.clear()
+        
+    def wait(self):
+        """ Waits for listing threads, before program exits.
+        
+        """
+        for thread in [self.list_thread] + self.stale_threads:
+            if thread is not None:
+                thread.wait()
+        
+    def register(self, top):
+        """ Remembers listing of scanned folder tree and watches it.
+        
+        Args:
+        top - wadscan.ScanFolder object
+        """
+        stack = [top]
+        paths = []
+        while stack:
+            folder = stack.pop()
+            self.listings[folder.path] = (set(file.path for file in folder.files), set(sub.path for sub in folder.folders))
+            paths.append(folder.path)
+            stack.extend(folder.folders)
+        self.watcher.addPaths(paths)
+            
+    def forget(self, top, removed):
+        """ Stops watching folder tree, its files are considered gone.
+        
+        """
+        stack = [top]
+        paths = []
+        while stack:
+            path = stack.pop()
+            if path not in self.listings:
+                continue
+            files, folders = self.listings.pop(path)
+            removed.extend(files)
+            paths.append(path)
+            stack.extend(folders)
+        if paths:
+            self.watcher.removePaths(paths)
+        
+    def hold(self, held):
+        """ Holds back reporting, e.g. while full rescan is running.
+        
+        """
+        self.held = held
+        if not held and self.pending:
+            self.timer.start()
+        
+    def folderChanged(self, path):
+        self.pending.add(path)
+        self.timer.start()
+        
+    def flush(self):
+        """ Compares pending folders with their listings.
+        
+        """
+        if self.held:
+            return
+        removed = []
+        added = []
+        for path in sorted(self.pending):
+            if path not in self.listings:
+                continue
+            if not os.path.isdir(path):
+                self.forget(path, removed)
+                continue
+            try:
+                names, folder_names = wadscan.readFolder(path)
+            except OSError as error:
+                print('{0}: {1}'.format(path, error))
+                continue
+            folder = wadscan.ScanFolder(path)
+            old_files, old_folders = self.listings[path]
+            new_files = set(os.path.join(path, name) for name in names)
+            new_folders = set(os.path.join(path, name) for name in folder_names)
+            removed.extend(sorted(old_files - new_files))
+            added.extend(wadscan.ScanResult(os.path.join(path, name), folder) for name in names if os.path.join(path, name) not in old_files)
+            for sub in sorted(old_folders - new_folders):
+                self.forget(sub, removed)
+            for sub in sorted(new_folders - old_folders):
+                tree = wadscan.listFolder(sub, True, dircache = dir_cache)
+                self.register(tree)
+                added.extend(tree.walk())
+            self.listings[path] = (new_files, new_folders)
+        self.pending.clear()
+        if removed or added:
+            self.changed.emit(removed, added)
+        
+# ================================================================
+# Functions
+# ================================================================
+def storeWAD(wad, kind):
+    """ Writes single WADItem object to WAD index.
+    
     Args:
-    path - filesystem path to folder containing WADs
-    recursive - if True, also recursively scans all folders found
-    during procedure's run
-    parent - item model or previous root found during recursive folder
-    scanning
+    wad - WADItem object
+    kind - 'IWAD' or 'PWAD'
+    """
+    index.putWAD(wad.hash, wad.path, kind, wad.fp, wad.meta)
     
-    Return:
-    Two item models filled with info about WADs - for PWADs and IWADs
+def saveWADList(new):
+    """ Replaces whole WAD index with lists of given library.
+    
+    Used after full rescan, everything else is written to index as it
+    changes, see storeWAD.
+    
+    Args:
+    new - Library object
     """
-    temp = os.path.basename(path)
-    #print("Found folder {}...".format(temp))
-    root = WADListItem(temp, '', 0)
-    parent.appendRow(root)
-    with os.scandir(path) as stuff:
-        for thing in stuff:
-            if not thing.name.startswith('.'):
-                if thing.is_file():
-                    if os.path.splitext(thing.name)[1].lower() in EXTS:
-                        checkWAD(thing.path, thing.name, root)
-                elif thing.is_dir() and recursive:
-                    scanFolders(thing.path, recursive, root)
-    if not root.hasChildren():
-        parent.takeRow(root.row())
-    return
+    with span('config.save_wads'):
+        rows = []
+        for dictionary, kind in ((new.iwad_list, 'IWAD'), (new.wad_list, 'PWAD')):
+            for item in dictionary.values():
+                rows.append(index.row(item.hash, item.path, kind, item.fp, item.meta))
+        index.replaceWADs(rows)
+
+def loadWADList(kind, dictionary, source = None):
+    """ Loads list of "installed" WADs from WAD index.
     
-def refreshFolders():
-    """ Initiates full rescan of all WAD folders program uses.
+    Files are not hashed here. If fingerprint on disk matches saved one,
+    hash is trusted, otherwise item is marked unverified and left for
+    VerifyThread to check once window is up. Files that don't exist
+    are skipped, but stay in index until next full rescan.
     
-    Cleans item models, measures time taken for refresh.
+    Args:
+    kind - 'IWAD' or 'PWAD'
+    dictionary - what to load
+    source - WADIndex to read from, global one by default, other
+    threads have to use their own connection
+    """
+    with span('config.load_wads', kind = kind):
+        for hash, path, saved_fp, meta in (source or index).wads(kind):
+            try:
+                fp = fingerprint(path)
+            except OSError:
+                print("{0} - file does not exist.".format(path))
+                continue
+            wad = WADItem(path, hash, saved_fp, meta)
+            wad.verified = fp == saved_fp
+            dictionary[path] = wad
+    return
+        
+def loadTags(store, source = None):
+    """ Loads categories of WADs from WAD index, see loadWADList.
     
     Args:
-    None
+    store - TagStore to fill
+    source - WADIndex to read from, global one by default
+    """
+    source = source or index
+    with span('config.load_tags'):
+        store.load(source.value('tags', []), source.tagged())
+
+def useLibrary(new):
+    """ Makes given library the one whole program works with.
     
-    Returns:
-    See scanFolders()
+    Lists and models of library are bound to module-wide names, so
+    swapping them is a single step, no matter how big library is.
+    
+    Args:
+    new - Library object
     """
-    wad_model.clear()
-    iwad_model.clear()
-    start = timer()
-    for line in prefs['WADPaths']['path'].split('\n'):
-        if not os.path.exists(line):
-            print('Path {} does not exist.'.format(line))
-            continue
-        #wad_model.appendRow(WADListItem(line, '', 0))
-        scanFolders(line, True, wad_model)
-    end = timer()
-    print('Folder scan complete in {} seconds'.format(end - start))
+    global library, wad_list, iwad_list, wad_model, iwad_model, list_items
+    library = new
+    wad_list = new.wad_list
+    iwad_list = new.iwad_list
+    wad_model = new.wad_model
+    iwad_model = new.iwad_model
+    list_items = new.items
     
 def attachToPort(path):
     """ Acquire relevant settings from selected source port.
@@ -317,115 +1056,446 @@ def attachToPort(path):
         return
         
 def fileToHash(filename):
-    md5 = hashlib.md5()
-    md5.update(open(filename, 'rb').read())
-    return md5.hexdigest()    
+    """ MD5 of file, served from file cache when file didn't change.
     
-def saveConfig(filename):
-    """ Writes game-specific configuration into JSON.
+    See wadhash.FileCache for more.
+    
+    Args:
+    filename - path to file
+    
+    Returns:
+    Hex digest of file contents.
+    """
+    return file_cache.hash(filename)
+    
+def saveConfig(name = 'lastconfig'):
+    """ Writes game-specific configuration into WAD index.
     
     Game-specific config is one that will be given directly to source
     port of choice, includes IWAD to load, PWADs to add on top of it, skill
     level, map, whatever else. Basically, storage for command line arguments.
     
     Args:
-    filename - specifies filename of written file.
+    name - name config is saved under, "lastconfig" is the one used
+    at startup.
     
     Returns:
-    File "filename" in frontend's config folder.
+    Key "config:name" in settings table of WAD index.
     """
-    try:
-        with open(filename, 'w') as file:
-            json.dump(config_current, file)
-    except OSError:
-        print('Couldn\'t save currently used game config to file.')
+    with span('config.save'):
+        index.setValue('config:' + name, dict(config_current, **{'-file': config_current['-file'].paths()}))
     
-def loadConfig(filename):
-    """ Loads game-specific configuration from JSON.
+def loadConfig(name = 'lastconfig'):
+    """ Loads game-specific configuration from WAD index.
     
     See saveConfig for more.
     
     Args:
-    filename - specifies filename of read file.
+    name - name config was saved under.
     
     Returns:
-    config_current rewritten with info from file "filename".
+    config_current rewritten with saved config, if there is one.
     """
     global config_current
-    try:
-        with open(filename, 'r') as file:
-            config_current = json.load(file)
-            #print(config_current)
-    except OSError:
-        print('Couldn\'t load last used game config from file.')
+    with span('config.load'):
+        config_current = index.value('config:' + name, config_current)
+        config_current['-file'] = LoadOrder(config_current.get('-file', ()))
         
+def makeThumbnail(path, fallback = None):
+    """ Title picture of file, scaled down to THUMB_SIZE.
+    
+    Safe to call outside of GUI thread, only QImage is used.
+    
+    Args:
+    path - path to WAD or PK3
+    fallback - file to take palette from, see wadpreview.extractPreview
+    
+    Return:
+    PNG bytes, empty if file has no picture.
+    """
+    picture = wadpreview.extractPreview(path, fallback)
+    if picture is None:
+        return b''
+    if isinstance(picture, bytes):
+        image = QtGui.QImage.fromData(picture)
+    else:
+        width, height, pixels = picture
+        # Doom pictures are made for non-square pixels, 320x200 fills 4:3 screen
+        image = QtGui.QImage(pixels, width, height, width * 4, QtGui.QImage.Format_RGBA8888).scaled(width, height * 6 // 5)
+    if image.isNull():
+        return b''
+    if image.width() > THUMB_SIZE.width() or image.height() > THUMB_SIZE.height():
+        image = image.scaled(THUMB_SIZE, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+    buffer = QtCore.QBuffer()
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    return bytes(buffer.data())
+    
 # ================================================================
 # Initializing
 # ================================================================
 
-# Qt-specifics
-#icons = {'dir': QtGui.QIcon('dir.png'),
-#            'wad': QtGui.QIcon('file.png')}
-
-# Preferences file
-print('Initializing...')
-prefs = configparser.ConfigParser()
-prefs['General'] = {'gz_path': '', 'executable': ''}
-prefs['WADPaths'] = {'path': ''}
-if not prefs.read('prefs.ini'):
-    print('Couldn\'t read preferences file, using default settings.')
-
-
-gzShortcuts = {'$PROGDIR': prefs['General']['gz_path'],
-                '$DOOMWADDIR': os.environ['DOOMWADDIR'] if 'DOOMWADDIR' in os.environ else '',
-                '$HOME': os.environ['HOME'] if 'HOME' in os.environ else '',
-                '.': prefs['General']['gz_path']}
-                
-# Saved mod list
-wad_list = {}
-loadWADList('WADList.dat', wad_list)
-iwad_list = {}
-loadWADList('IWADList.dat', iwad_list)
-print(iwad_list, "ping")
+# Importing this module only defines things, everything below is filled
+# in by bootstrap() and MyWindowClass.startLoading()
+prefs = None
+gzShortcuts = {}
+file_cache = None
+dir_cache = None
+lump_cache = None
+thumb_cache = None
+ident_cache = None
+index = None
+tags = None
+config_current = {'-iwad': None, '-file': LoadOrder()}
+library = None
 
-# Last game config file
-config_current = {'-iwad': None, '-file': []}
-loadConfig('lastconfig.dat')
-
-# Filesystem stuff
-# List of IWADs known by application
-iwad_model = PyQt5.QtGui.QStandardItemModel()
-for item in iwad_list.values():
-    temp = WADListItem(item)
-    iwad_model.appendRow(temp)
-
-wad_model = PyQt5.QtGui.QStandardItemModel()
-for item in wad_list.values():
-    temp = WADListItem(item)
-    temp.setCheckable(True)
-    if temp.wad.path in config_current['-file']:
-        temp.setCheckState(QtCore.Qt.Checked)
-    wad_model.appendRow(temp)
-#cat_model = PyQt5.QtGui.QStandardItemModel()
-
-
-# Categories
-#cats = {}
-#dtemp = WADListItem('All WADs', '', 0, 'Dog')
-#cat_model.appendRow(dtemp)
-#cat_model_contents = {'All WADs': dtemp}
-#loadCats()
-
-#for line in prefs['WADCats']['cats'].split('\n'):
-#    Cats[line] = WADListItem(line, '', 0)
-
-#refreshFolders()
+def bootstrap():
+    """ Prepares everything main window needs to show up.
+    
+    Only cheap things are done here - preferences, WAD index and last
+    game config. Caches and saved WAD lists are loaded once window is
+    on screen, see MyWindowClass.startLoading, until then program works
+    with empty library.
+    """
+    global prefs, gzShortcuts, file_cache, dir_cache, lump_cache, thumb_cache, ident_cache, index, tags
+    print('Initializing...')
+    # Trace times count from start of program, not from first span
+    wadtrace.tracer.origin = STARTED
+    prefs = loadPrefs()
+    
+    # Trace file asked for, either in preferences or for single run with
+    # FRONTDOOM_TRACE variable, ".jsonl" files get JSON lines, anything
+    # else Chrome trace
+    trace_file = os.environ.get('FRONTDOOM_TRACE') or prefs['Diagnostics']['trace']
+    if trace_file:
+        wadtrace.tracer.addSink(wadtrace.makeSink(trace_file))
         
-# Quick exit
-#sys.exit()
-
-print('Initializing done.')
+    gzShortcuts = {'$PROGDIR': prefs['General']['gz_path'],
+                    '$DOOMWADDIR': os.environ['DOOMWADDIR'] if 'DOOMWADDIR' in os.environ else '',
+                    '$HOME': os.environ['HOME'] if 'HOME' in os.environ else '',
+                    '.': prefs['General']['gz_path']}
+                    
+    # Hashes of known files, so unchanged files are never read twice, and
+    # listings of WAD folders, so unchanged folders are never read twice.
+    # Both are filled from disk by LoadThread.
+    file_cache = FileCache('FileCache.dat')
+    dir_cache = wadscan.DirCache('DirCache.dat')
+    # Lump names of files by hash, for conflict analysis
+    lump_cache = LumpCache('LumpCache.dat')
+    # Title pictures of files by hash, see PreviewThread
+    thumb_cache = wadpreview.ThumbCache('thumbs')
+    # Games of IWADs by hash, see wadident
+    ident_cache = IdentCache('IdentCache.dat')
+    
+    # Everything known about WADs, JSON files of older versions are
+    # imported on first run
+    with span('startup.index'):
+        index = WADIndex('FrontDoom.db')
+        index.migrate('WADList.dat', 'IWADList.dat', 'CatsList.dat', 'lastconfig.dat')
+        index.migrateCategories()
+    # Categories of WADs by hash, filled by LoadThread
+    tags = TagStore()
+        
+    # Last game config
+    loadConfig()
+    useLibrary(Library())
+    print('Initializing done.')
+    
+def main():
+    """ Runs the program.
+    
+    Window is shown first and painted, everything else is loaded after,
+    see MyWindowClass.firstPaint.
+    """
+    app = QtWidgets.QApplication(sys.argv)
+    bootstrap()
+    window = MyWindowClass(None)
+    window.show()
+    # Runs once event loop got through showing and painting window
+    QtCore.QTimer.singleShot(0, window.firstPaint)
+    return app.exec_()
+            
+class GameLogDialog(QtWidgets.QDialog):
+    """ Output of game sessions, updated as games write it.
+    
+    Text view keeps at most LOG_LINES lines, same as sessions do.
+    """
+    
+    def __init__(self, sessions, parent = None):
+        super().__init__(parent)
+        self.setWindowTitle('Game log')
+        self.resize(640, 400)
+        self.sessions = []
+        self.shown = None
+        
+        layoutV = QtWidgets.QVBoxLayout()
+        layoutH = QtWidgets.QHBoxLayout()
+        self.combo_sessions = QtWidgets.QComboBox()
+        self.combo_sessions.currentIndexChanged.connect(self.sessionChosen)
+        layoutH.addWidget(self.combo_sessions, 1)
+        self.label_status = QtWidgets.QLabel()
+        layoutH.addWidget(self.label_status)
+        layoutV.addLayout(layoutH)
+        
+        self.text_log = QtWidgets.QPlainTextEdit()
+        self.text_log.setReadOnly(True)
+        self.text_log.setMaximumBlockCount(LOG_LINES)
+        self.text_log.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+        layoutV.addWidget(self.text_log)
+        
+        close = QtWidgets.QPushButton('Close')
+        close.clicked.connect(self.hide)
+        layoutV.addWidget(close, 0, QtCore.Qt.AlignRight)
+        self.setLayout(layoutV)
+        for session in sessions:
+            self.addSession(session)
+            
+    def addSession(self, session):
+        self.sessions.append(session)
+        session.output.connect(self.sessionOutput)
+        session.ended.connect(self.sessionEnded)
+        self.combo_sessions.addItem(session.name())
+        self.showSession(session)
+        
+    def showSession(self, session):
+        if session is None or session not in self.sessions:
+            return
+        self.combo_sessions.setCurrentIndex(self.sessions.index(session))
+        
+    def sessionChosen(self, row):
+        if not 0 <= row < len(self.sessions):
+            return
+        self.shown = self.sessions[row]
+        self.text_log.setPlainText('\n'.join(self.shown.log))
+        self.text_log.moveCursor(QtGui.QTextCursor.End)
+        self.updateStatus()
+        
+    def sessionOutput(self, session, line):
+        if session is self.shown:
+            self.text_log.appendPlainText(line)
             
+    def sessionEnded(self, session):
+        if session is self.shown:
+            self.updateStatus()
+            
+    def updateStatus(self):
+        self.label_status.setText(self.shown.status() or 'running')
+        
+class DuplicatesDialog(QtWidgets.QDialog):
+    """ Report of duplicate files, with means to get rid of them.
+    
+    Every group lists paths of one file. File selected in group is kept,
+    first one if nothing is selected, others are either replaced with
+    hard links to it or removed. Paths that stopped existing are sent
+    with "removed" signal as list of (path, kept path) pairs.
+    """
+    removed = QtCore.pyqtSignal(list)
+    
+    def __init__(self, paths, parent = None):
+        super().__init__(parent)
+        self.setWindowTitle('Duplicate files')
+        self.resize(720, 480)
+        self.groups = {}
+        
+        layoutV = QtWidgets.QVBoxLayout()
+        self.label_summary = QtWidgets.QLabel('Looking for duplicates...')
+        layoutV.addWidget(self.label_summary)
+        self.progress = QtWidgets.QProgressBar()
+        layoutV.addWidget(self.progress)
+        
+        self.tree = QtWidgets.QTreeWidget()
+        self.tree.setHeaderLabels(['File', 'Size'])
+        self.tree.header().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.tree.header().setStretchLastSection(False)
+        layoutV.addWidget(self.tree)
+        
+        layoutH = QtWidgets.QHBoxLayout()
+        self.button_link = QtWidgets.QPushButton('Hardlink')
+        self.button_link.setToolTip('Replace other copies with hard links to kept file')
+        self.button_link.clicked.connect(partial(self.resolve, False, False))
+        layoutH.addWidget(self.button_link)
+        self.button_link_all = QtWidgets.QPushButton('Hardlink all')
+        self.button_link_all.setToolTip('Hardlink copies in every group, keeping first file')
+        self.button_link_all.clicked.connect(partial(self.resolve, False, True))
+        layoutH.addWidget(self.button_link_all)
+        self.button_remove = QtWidgets.QPushButton('Remove others')
+        self.button_remove.setToolTip('Delete other copies, keeping only selected file')
+        self.button_remove.clicked.connect(partial(self.resolve, True, False))
+        layoutH.addWidget(self.button_remove)
+        close = QtWidgets.QPushButton('Close')
+        close.clicked.connect(self.reject)
+        layoutH.addWidget(close)
+        layoutV.addLayout(layoutH)
+        layoutV.setAlignment(layoutH, QtCore.Qt.AlignRight)
+        self.setLayout(layoutV)
+        self.enableButtons(False)
+        
+        self.thread = DupeThread(paths, self)
+        self.thread.progress.connect(self.searchProgress)
+        self.thread.finished.connect(self.searchFinished)
+        self.thread.start()
+        
+    def enableButtons(self, enabled):
+        for button in (self.button_link, self.button_link_all, self.button_remove):
+            button.setEnabled(enabled)
+            
+    def searchProgress(self, done, total):
+        self.progress.setMaximum(max(total, 1))
+        self.progress.setValue(done)
+        
+    def searchFinished(self):
+        self.progress.hide()
+        if self.thread.groups is None:
+            return
+        for group in self.thread.groups:
+            item = QtWidgets.QTreeWidgetItem(['', sizeText(group.size)])
+            self.groups[id(item)] = group
+            self.tree.addTopLevelItem(item)
+            self.updateGroup(item)
+            item.setExpanded(True)
+        self.updateSummary()
+        self.enableButtons(bool(self.groups))
+        
+    def updateGroup(self, item):
+        """ Fills group item with its paths and totals.
+        
+        """
+        group = self.groups[id(item)]
+        item.setText(0, '{0} copies, {1} wasted'.format(group.copies(), sizeText(group.wasted())))
+        item.takeChildren()
+        for path in group.paths:
+            child = QtWidgets.QTreeWidgetItem(item, [path, ''])
+            if path in group.links:
+                child.setToolTip(0, 'Hard link of {0}'.format(group.links[path]))
+        
+    def updateSummary(self):
+        groups = list(self.groups.values())
+        wasted = sum(group.wasted() for group in groups)
+        self.label_summary.setText('Files with copies: {0}, {1} can be reclaimed.'.format(len(groups), sizeText(wasted)))
+        
+    def resolve(self, remove, everything):
+        """ Hardlinks or removes duplicates, keeping one copy of each.
+        
+        Args:
+        remove - if True, duplicates are deleted instead of linked
+        everything - if True, all groups are handled, keeping first file
+        of each, otherwise just selected group
+        """
+        if everything:
+            items = [(self.tree.topLevelItem(row), 0) for row in range(self.tree.topLevelItemCount())]
+        else:
+            item = self.tree.currentItem()
+            if item is None:
+                return
+            parent = item.parent()
+            if parent is None:
+                items = [(item, 0)]
+            else:
+                items = [(parent, parent.indexOfChild(item))]
+        if remove:
+            keep = items[0][0].child(items[0][1]).text(0)
+            answer = QtWidgets.QMessageBox.question(self, 'Remove duplicates', 'Delete every copy except {0}?'.format(keep))
+            if answer != QtWidgets.QMessageBox.Yes:
+                return
+        gone = []
+        errors = []
+        with span('dupes.resolve', groups = len(items), remove = remove):
+            for item, row in items:
+                group = self.groups[id(item)]
+                keep = group.paths[row]
+                failed = []
+                for path in list(group.paths):
+                    if path == keep:
+                        continue
+                    try:
+                        if remove:
+                            os.remove(path)
+                            gone.append((path, keep))
+                            group.paths.remove(path)
+                        elif not os.path.samefile(keep, path):
+                            fp = waddupes.hardlink(keep, path)
+                            # Contents are the same, so cached values still hold
+                            entry = file_cache.entry(keep) or {}
+                            for field, value in entry.items():
+                                if field != 'fp':
+                                    file_cache.store(path, field, value, fp)
+                    except OSError as error:
+                        errors.append('{0}: {1}'.format(path, error))
+                        failed.append(path)
+                group.links = {path: keep for path in group.paths if path != keep and path not in failed}
+                self.updateGroup(item)
+        self.removeFinished(items)
+        if gone:
+            self.removed.emit(gone)
+        if errors:
+            QtWidgets.QMessageBox.warning(self, 'Duplicate files', '\n'.join(errors))
+            
+    def removeFinished(self, items):
+        """ Drops groups that have nothing left to reclaim.
+        
+        """
+        for item, row in items:
+            if self.groups[id(item)].copies() < 2:
+                del self.groups[id(item)]
+                self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(item))
+        self.updateSummary()
+        self.enableButtons(bool(self.groups))
+        
+    def done(self, result):
+        self.thread.cancel.set()
+        self.thread.wait()
+        super().done(result)
+        
+class ConflictsDialog(QtWidgets.QDialog):
+    """ Lumps and maps overridden by files later in load order.
+    
+    Stays open while PWADs are checked and unchecked, window sends new
+    report with showReport.
+    """
+    
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.setWindowTitle('Load order conflicts')
+        self.resize(640, 480)
+        
+        layoutV = QtWidgets.QVBoxLayout()
+        self.label_summary = QtWidgets.QLabel()
+        layoutV.addWidget(self.label_summary)
+        self.tree = QtWidgets.QTreeWidget()
+        self.tree.setHeaderLabels(['File', 'Overrides'])
+        self.tree.header().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.tree.header().setStretchLastSection(False)
+        layoutV.addWidget(self.tree)
+        close = QtWidgets.QPushButton('Close')
+        close.clicked.connect(self.hide)
+        layoutV.addWidget(close, 0, QtCore.Qt.AlignRight)
+        self.setLayout(layoutV)
+        
+    def showReport(self, report):
+        """ Fills tree with report of ConflictAnalyzer.
+        
+        Every file of load order is listed with files it overrides
+        something in, and names of what it overrides under those.
+        """
+        self.tree.clear()
+        total = 0
+        for entry in report:
+            item = QtWidgets.QTreeWidgetItem([os.path.basename(entry['path']), ''])
+            item.setToolTip(0, entry['path'])
+            overrides = 0
+            for what, overridden in (('map', entry['maps']), ('lump', entry['lumps'])):
+                for path, names in overridden.items():
+                    child = QtWidgets.QTreeWidgetItem(item, ['{0}s of {1}'.format(what, os.path.basename(path)), str(len(names))])
+                    child.setToolTip(0, path)
+                    for name in names:
+                        QtWidgets.QTreeWidgetItem(child, [name, ''])
+                    overrides += len(names)
+            item.setText(1, str(overrides) if overrides else '')
+            total += overrides
+            self.tree.addTopLevelItem(item)
+            item.setExpanded(overrides > 0)
+        self.label_summary.setText('{0} files in load order, {1} lumps and maps overridden.'.format(len(report), total))
+        
 # ================================================================
 # Main window class, clean up later
 class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
@@ -441,11 +1511,21 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         actPrefs = QtWidgets.QAction('Preferences...', self)
         actPrefs.triggered.connect(self.prefDialog)
         actRefresh = QtWidgets.QAction('Refresh WAD list', self)
-        actRefresh.triggered.connect(refreshFolders)
+        actRefresh.triggered.connect(self.refreshFolders)
         actAdd = QtWidgets.QAction('Add new WAD file...', self)
         actAdd.triggered.connect(self.addDialog)
         actAddI = QtWidgets.QAction('Add new IWAD file...', self)
         actAddI.triggered.connect(self.addIDialog)
+        actLog = QtWidgets.QAction('Game log...', self)
+        actLog.triggered.connect(partial(self.logDialog, None))
+        actConflicts = QtWidgets.QAction('Load order conflicts...', self)
+        actConflicts.triggered.connect(self.conflictsDialog)
+        actDupes = QtWidgets.QAction('Find duplicates...', self)
+        actDupes.triggered.connect(self.dupesDialog)
+        actDiag = QtWidgets.QAction('Diagnostics...', self)
+        actDiag.triggered.connect(self.diagDialog)
+        actProfile = QtWidgets.QAction('Save game config as profile...', self)
+        actProfile.triggered.connect(self.profileDialog)
         #actLogin = QtWidgets.QAction(QIcon('icon_login.png'), 'Log in', self)
         #actLogin.triggered.connect(self.loginDialog)
         #actLogout = QtWidgets.QAction(QIcon('icon_logout.png'), 'Log out', self)
@@ -466,8 +1546,13 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         self.menuFile.addAction(actAdd)
         self.menuFile.addAction(actAddI)
         self.menuFile.addAction(actRefresh)
+        self.menuFile.addAction(actProfile)
         self.menuFile.addSeparator()
         self.menuFile.addAction(actPrefs)
+        self.menuFile.addAction(actConflicts)
+        self.menuFile.addAction(actDupes)
+        self.menuFile.addAction(actLog)
+        self.menuFile.addAction(actDiag)
         #self.menuUser.addAction(self.actCart)
         #self.menuUser.addAction(actLogout)
         #self.menuQuit.addAction(actRegister)
@@ -483,8 +1568,11 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         #self.wad_model = PyQt5.QtGui.QStandardItemModel(self)
         #self.iwad_model = dummyI
         #self.wad_model = dummyP
-        wad_model.itemChanged.connect(self.checkingItems)
+        wad_model.itemChecked.connect(self.checkingItems)
         self.iwad_select.activated.connect(self.iwadChanged)
+        self.map_select.activated.connect(self.mapChanged)
+        self.load_list.model().rowsMoved.connect(self.loadOrderMoved)
+        self.fillLoadList()
         #self.load_wad_model = PyQt5.QtGui.QStandardItemModel(self)
         
         #self.loadSettings()
@@ -492,55 +1580,539 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         #self.scanFolders()
         #self.load_list.setModel(self.load_wad_model)
         #self.load_list.setSelectionMode(0)
+        # Library is empty until startLoading is done
         self.iwad_select.setModel(iwad_model)
-        #self.iwad_select.setCurrentIndex()
-        for i in range(0, iwad_model.rowCount()):
-            if iwad_model.item(i).wad.path == config_current['-iwad']:
-                self.iwad_select.setCurrentIndex(iwad_model.item(i).row())
-                try:
-                    self.iwad_label.setPixmap(QtGui.QPixmap(LOGOS[iwad_model.item(i).text().lower()]))
-                except KeyError:
-                    self.iwad_label.setPixmap(QtGui.QPixmap(LOGOS['def']))
-        
-        self.wad_list.setModel(wad_model)
-        #self.cat_list.setModel(cat_model)
-        #self.cat_list.customContextMenuRequested.connect(self.wadMenu)
+        self.setListModel(wad_model)
+        self.shown = library
+        # Search results share nodes with whichever library is shown
+        self.search_model = WADResultModel(self)
+        self.search_model.itemChecked.connect(self.checkingItems)
+        self.search_box.textChanged.connect(self.searchChanged)
+        # Sorting only when asked, so switching models doesn't sort again
+        self.wad_list.header().sortIndicatorChanged.connect(self.sortList)
+        self.cat_list.setModel(library.cat_model)
+        self.cat_list.customContextMenuRequested.connect(self.wadMenu)
 
         
         
+        # Scan progress lives in status bar, shown only while scanning
+        self.scan_thread = None
+        self.scan_progress = QtWidgets.QProgressBar()
+        self.scan_progress.setMaximumWidth(200)
+        self.scan_progress.hide()
+        self.statusBar().addPermanentWidget(self.scan_progress)
+        self.scan_cancel = QtWidgets.QPushButton('Cancel')
+        self.scan_cancel.hide()
+        self.statusBar().addPermanentWidget(self.scan_cancel)
+        
+        self.watcher = FolderWatcher(self)
+        self.watcher.changed.connect(self.foldersChanged)
+        self.watch_threads = []
+        
+        # Running and finished games, see launchGame
+        self.sessions = []
+        self.log_dialog = None
+        self.quitting = False
+        
+        # Overrides between checked PWADs, see updateConflicts
+        self.analyzer = ConflictAnalyzer(lump_cache)
+        self.conflicts_dialog = None
+        
+        # Map lists of files, see extractMaps
+        self.map_thread = None
+        
+        # Hashes of files scans only classified, see startHashing
+        self.hash_thread = None
+        self.hash_again = False
+        
+        # Title picture of selected WAD, see wadSelected
+        self.preview_thread = PreviewThread(self)
+        self.preview_thread.ready.connect(self.previewReady)
+        self.preview_hash = None
+        
+        # Things that need saved lists wait for them
+        self.load_thread = None
+        self.needs_library = [actRefresh, actAdd, actAddI, actConflicts]
+        for action in self.needs_library:
+            action.setEnabled(False)
+        
+    def firstPaint(self):
+        """ Reports how long it took window to show up, starts loading.
+        
+        """
+        wadtrace.tracer.spanSince('startup.first_paint', STARTED)
+        print('Window shown in {0:.0f} ms'.format((timer() - STARTED) * 1000))
+        self.startLoading()
+        
+    def startLoading(self):
+        """ Loads caches and saved WAD lists in background.
+        
+        See LoadThread and libraryLoaded.
+        """
+        self.load_thread = LoadThread(self)
+        self.load_thread.finished.connect(self.libraryLoaded)
+        self.statusBar().showMessage('Loading WAD lists...')
+        self.load_thread.start()
+        
+    def libraryLoaded(self):
+        """ Shows saved WAD lists, once LoadThread is done with them.
+        
+        """
+        loaded = Library()
+        loaded.wad_list = self.load_thread.wad_list
+        loaded.iwad_list = self.load_thread.iwad_list
+        loaded.search = self.load_thread.search
+        self.load_thread = None
+        with span('startup.models'):
+            loaded.addSaved()
+        useLibrary(loaded)
+        self.showLibrary(loaded)
+        for action in self.needs_library:
+            action.setEnabled(True)
+        self.extractMaps()
+        wadtrace.count('startup.cache_hits', file_cache.hits)
+        wadtrace.count('startup.cache_misses', file_cache.misses)
+        wadtrace.tracer.spanSince('startup.loaded', STARTED, items = len(list_items))
         self.statusBar().showMessage('Ready.')
+        self.startVerification()
+        self.startHashing()
+        self.startWatching()
+        
+    def startVerification(self):
+        """ Starts background checksum pass over saved WAD lists.
+        
+        Files whose fingerprint changed since last run are always checked,
+        everything else only if enabled in preferences.
+        """
+        check_all = prefs['General'].getboolean('verify_checksums', False)
+        items = [item for dictionary in (iwad_list, wad_list)
+                    for item in dictionary.values()
+                    if (check_all or not item.verified) and not isFingerprintKey(item.hash)]
+        if not items:
+            return
+        self.verify_thread = VerifyThread(items, self)
+        self.verify_thread.checked.connect(self.verifiedItem)
+        self.verify_thread.finished.connect(partial(self.statusBar().showMessage, 'Checksum verification done.', 3000))
+        self.statusBar().showMessage('Verifying checksums of {0} files...'.format(len(items)))
+        self.verify_thread.start()
+        
+    def verifiedItem(self, path, ok):
+        """ Marks list item whose file failed checksum verification.
+        
+        """
+        if path in list_items:
+            node = list_items[path]
+            node.wad.verified = ok
+            if ok:
+                storeWAD(node.wad, 'IWAD' if path in iwad_list else 'PWAD')
+            else:
+                node.color = QtCore.Qt.red
+                node.tooltip = 'Checksum mismatch, file was changed since it was added.'
+                library.modelOf(path).nodeChanged(node)
+                library.cat_model.nodeChanged(node)
+                self.search_model.nodeChanged(node)
+        
+    def showLibrary(self, shown):
+        """ Attaches models of library to views.
+        
+        """
+        for model in (self.shown.wad_model, self.shown.cat_model):
+            try:
+                model.itemChecked.disconnect(self.checkingItems)
+            except TypeError:
+                pass
+        self.shown = shown
+        shown.wad_model.itemChecked.connect(self.checkingItems)
+        shown.cat_model.itemChecked.connect(self.checkingItems)
+        self.iwad_select.setModel(shown.iwad_model)
+        self.cat_list.setModel(shown.cat_model)
+        for i in range(0, shown.iwad_model.rowCount()):
+            if shown.iwad_model.node(i).wad.path == config_current['-iwad']:
+                self.iwad_select.setCurrentIndex(i)
+                self.showGame(shown.iwad_model.node(i))
+        self.searchChanged(self.search_box.text())
+        self.fillMaps()
+        
+    def sortList(self, column, order):
+        with span('model.sort', column = column):
+            self.wad_list.model().sort(column, order)
+        
+    def setListModel(self, model):
+        """ Shows model in WAD list, keeping preview in sync with selection.
+        
+        """
+        self.wad_list.setModel(model)
+        self.wad_list.selectionModel().currentChanged.connect(self.wadSelected)
+        
+    def wadSelected(self, current, previous = None):
+        """ Shows title picture of WAD that became current in list.
+        
+        Thumbnails come from memory or thumb_cache if possible, otherwise
+        PreviewThread is asked to make one, see previewReady.
+        """
+        node = self.wad_list.model().nodeFromIndex(current) if current.isValid() else None
+        if node is None or node.wad is None:
+            self.preview_hash = None
+            self.preview_label.clear()
+            return
+        self.preview_hash = node.hash
+        pixmap = QtGui.QPixmapCache.find(node.hash)
+        if pixmap is not None:
+            self.preview_label.setPixmap(pixmap)
+            return
+        filename = thumb_cache.lookup(node.hash)
+        if filename is None:
+            self.preview_label.setText('Loading preview...')
+            self.preview_thread.request(node.hash, node.wad.path, config_current['-iwad'])
+        else:
+            self.showPreview(node.hash, filename)
+            
+    def previewReady(self, hash, data):
+        if hash == self.preview_hash:
+            pixmap = QtGui.QPixmap()
+            if not (data and pixmap.loadFromData(data)):
+                pixmap = QtGui.QPixmap(NO_LOGO)
+            self.showPixmap(hash, pixmap)
+            
+    def showPreview(self, hash, filename):
+        """ Puts thumbnail on screen and into memory cache.
+        
+        Args:
+        hash - hash of file
+        filename - thumbnail, empty for files without picture
+        """
+        self.showPixmap(hash, QtGui.QPixmap(filename or NO_LOGO))
+        
+    def showPixmap(self, hash, pixmap):
+        QtGui.QPixmapCache.insert(hash, pixmap)
+        self.preview_label.setPixmap(pixmap)
+        
+    def searchChanged(self, text):
+        """ Shows PWADs matching search box in place of whole tree.
+        
+        Called on every keystroke, see wadsearch.SearchIndex for how
+        it's kept fast. Empty search box brings tree back.
+        """
+        with span('model.search'):
+            paths = self.shown.search.search(text)
+        if paths is None:
+            self.search_model.clear()
+            if self.wad_list.model() is not self.shown.wad_model:
+                self.setListModel(self.shown.wad_model)
+            return
+        with span('model.results', items = len(paths)):
+            items = self.shown.items
+            self.search_model.setNodes([items[path] for path in paths])
+        if self.wad_list.model() is not self.search_model:
+            self.setListModel(self.search_model)
+        
+    def refreshFolders(self):
+        """ Initiates full rescan of all WAD folders program uses.
+        
+        Scan runs in ScanThread and fills new library, old one stays
+        usable until scan is done. Only if there's nothing to show yet,
+        new library is shown right away and fills up as scan goes.
+        Measures time taken for refresh.
+        """
+        if self.scan_thread is not None:
+            return
+        self.scan_library = Library()
+        if not (wad_model.rowCount() or iwad_model.rowCount()):
+            self.showLibrary(self.scan_library)
+        self.scan_start = timer()
+        self.scan_paths = prefs['WADPaths']['path'].split('\n')
+        self.scan_thread = ScanThread(self.scan_paths, prefs['Scan'].getint('workers', 1), prefs['Scan'].get('pool', 'thread'), self)
+        self.scan_thread.batch.connect(self.scanBatch)
+        self.scan_thread.progress.connect(self.scanProgress)
+        self.scan_thread.finished.connect(self.scanFinished)
+        self.scan_cancel.clicked.connect(self.scan_thread.cancel.set)
+        self.scan_progress.setValue(0)
+        self.scan_progress.show()
+        self.scan_cancel.show()
+        self.watcher.hold(True)
+        self.statusBar().showMessage('Scanning WAD folders...')
+        self.scan_thread.start()
+        
+    def scanBatch(self, results):
+        self.scan_library.checkWADs(results, library)
+            
+    def scanProgress(self, done, total):
+        self.scan_progress.setMaximum(max(total, 1))
+        self.scan_progress.setValue(done)
+        
+    def scanFinished(self):
+        """ Swaps freshly scanned library in, unless scan was cancelled or failed.
+        
+        """
+        self.scan_cancel.clicked.disconnect()
+        self.scan_progress.hide()
+        self.scan_cancel.hide()
+        cancelled = self.scan_thread.cancel.is_set()
+        failed = self.scan_thread.failed
+        self.scan_thread = None
+        self.watcher.hold(False)
+        if cancelled or failed:
+            self.showLibrary(library)
+            self.statusBar().showMessage('Scan failed, WAD list left as it was.' if failed else 'Scan cancelled.', 3000)
+            return
+        self.scan_library.keepMissing(library, self.scan_paths)
+        self.scan_library.syncChecks()
+        useLibrary(self.scan_library)
+        saveWADList(library)
+        self.showLibrary(library)
+        self.extractMaps()
+        self.startHashing()
+        end = timer()
+        print('Folder scan complete in {} seconds'.format(end - self.scan_start))
+        wadtrace.count('scan.cache_hits', file_cache.hits)
+        wadtrace.count('scan.cache_misses', file_cache.misses)
+        self.statusBar().showMessage('Scan complete, {0} IWADs and {1} PWADs found.'.format(len(iwad_list), len(wad_list)), 3000)
+        
+    def startWatching(self):
+        """ (Re)starts watching WAD folders, if enabled in preferences.
+        
+        """
+        if prefs['Scan'].getboolean('watch', False):
+            self.watcher.watch(prefs['WADPaths']['path'].split('\n'))
+        else:
+            self.watcher.stop()
+            
+    def foldersChanged(self, removed, added):
+        """ Applies changes reported by FolderWatcher to current library.
+        
+        Gone files are dropped right away, new ones are examined in
+        background and filed in as they come, see watchBatch.
+        """
+        for path in removed:
+            if library.removeWAD(path):
+                index.removeWAD(path)
+                if config_current['-file'].discard(path):
+                    saveConfig()
+                    self.fillLoadList()
+        if removed and self.search_box.text():
+            self.searchChanged(self.search_box.text())
+        added = [result for result in added if result.path not in library.items]
+        if not added:
+            return
+        thread = ScanThread([], prefs['Scan'].getint('workers', 1), prefs['Scan'].get('pool', 'thread'), self, added)
+        thread.batch.connect(self.watchBatch)
+        thread.finished.connect(partial(self.watch_threads.remove, thread))
+        self.watch_threads.append(thread)
+        thread.start()
+        
+    def watchBatch(self, results):
+        library.checkWADs(results, library)
+        for result in results:
+            storeWAD(list_items[result.path].wad, result.kind)
+        if self.search_box.text():
+            self.searchChanged(self.search_box.text())
+        self.extractMaps()
+        self.startHashing()
+        
+    def startHashing(self):
+        """ Hashes files scans left under fingerprint keys, in background.
+        
+        Files hashed since scan, e.g. by duplicate finder, are taken from
+        file cache right away. Pass started while another one runs waits
+        for it, see hashingFinished.
+        """
+        if self.hash_thread is not None:
+            self.hash_again = True
+            return
+        items = []
+        for dictionary in (iwad_list, wad_list):
+            for path, wad in list(dictionary.items()):
+                if not isFingerprintKey(wad.hash):
+                    continue
+                hash = file_cache.lookup(path, 'md5', wad.fp) if wad.fp else None
+                if hash is None:
+                    items.append(path)
+                else:
+                    self.itemHashed(path, hash, wad.fp)
+        if not items:
+            return
+        self.hash_again = False
+        self.hash_thread = HashThread(items, self)
+        self.hash_thread.hashed.connect(self.itemHashed)
+        self.hash_thread.finished.connect(self.hashingFinished)
+        self.hash_thread.start(QtCore.QThread.LowPriority)
+        
+    def itemHashed(self, path, hash, fp):
+        """ Replaces fingerprint key of WAD with hash sent by HashThread.
+        
+        """
+        node = library.items.get(path)
+        if node is None or not isFingerprintKey(node.hash):
+            return
+        key = node.hash
+        library.rekey(path, hash)
+        node.wad.fp = fp
+        file_cache.store(path, 'md5', hash, fp)
+        storeWAD(node.wad, 'IWAD' if path in iwad_list else 'PWAD')
+        if self.preview_hash == key:
+            self.preview_hash = hash
+        
+    def hashingFinished(self):
+        again = self.hash_again and not self.quitting
+        self.hash_thread = None
+        if again:
+            self.startHashing()
+        
+    def extractMaps(self):
+        """ Reads map lists of WADs that don't have one, in background.
+        
+        Lists are kept in metadata of WADs, so every file is read once,
+        see MapThread and mapsRead.
+        """
+        if self.map_thread is not None:
+            return
+        # One copy of every file is enough, see mapsRead
+        files = list({wad.hash: (wad.hash, path) for dictionary in (iwad_list, wad_list)
+                    for path, wad in dictionary.items() if 'maps' not in wad.meta}.values())
+        if not files:
+            return
+        self.map_thread = MapThread(files, prefs['Scan'].getint('workers', 1), prefs['Scan'].get('pool', 'thread'), self)
+        self.map_thread.batch.connect(self.mapsRead)
+        self.map_thread.finished.connect(self.mapsFinished)
+        self.map_thread.start()
+        
+    def mapsRead(self, results):
+        """ Stores map lists sent by MapThread.
+        
+        """
+        used = set(config_current['-file'])
+        used.add(config_current['-iwad'])
+        stored = []
+        refill = False
+        for hash, maps in results:
+            nodes = library.nodesOf(hash)
+            for node in nodes:
+                node.wad.meta['maps'] = maps
+                if maps and node.checkable:
+                    library.updateSearch([node])
+                refill = refill or node.wad.path in used
+            if nodes:
+                stored.append((hash, nodes[0].wad.meta))
+        index.setHashMeta(stored)
+        if refill:
+            self.fillMaps()
+            
+    def mapsFinished(self):
+        cancelled = self.map_thread.cancel.is_set()
+        self.map_thread = None
+        # Library may have been replaced by scan in the meantime
+        if not cancelled:
+            self.extractMaps()
+            
+    def fillMaps(self):
+        """ Fills map choice with maps of IWAD and checked PWADs.
+        
+        Maps of files loaded later replace ones of the same name, as
+        they do in game. Map chosen before stays chosen, even if no file
+        has it anymore.
+        """
+        titles = {}
+        for path in [config_current['-iwad']] + config_current['-file'].paths():
+            wad = iwad_list.get(path) or wad_list.get(path)
+            if wad is None:
+                continue
+            for name, title in wad.meta.get('maps', ()):
+                if title or name not in titles:
+                    titles[name] = title
+        self.map_select.clear()
+        self.map_select.addItem('Default', None)
+        for name, title in titles.items():
+            self.map_select.addItem('{0} - {1}'.format(name, title) if title else name, name)
+        chosen = config_current.get('+map')
+        if chosen:
+            if self.map_select.findData(chosen) < 0:
+                self.map_select.addItem(chosen, chosen)
+            self.map_select.setCurrentIndex(self.map_select.findData(chosen))
+            
+    def fillLoadList(self):
+        """ Shows PWADs of game config in load order.
+        
+        """
+        self.load_list.clear()
+        for path in config_current['-file']:
+            item = QtWidgets.QListWidgetItem(os.path.basename(path))
+            item.setToolTip(path)
+            item.setData(QtCore.Qt.UserRole, path)
+            self.load_list.addItem(item)
+            
+    def loadOrderMoved(self, *args):
+        """ Takes new load order from list, once files were dragged around.
+        
+        """
+        config_current['-file'].setPaths(self.load_list.item(row).data(QtCore.Qt.UserRole) for row in range(self.load_list.count()))
+        saveConfig()
+        self.fillMaps()
+        self.updateConflicts()
+        
+    def mapChanged(self, row):
+        name = self.map_select.itemData(row)
+        if name:
+            config_current['+map'] = name
+        else:
+            config_current.pop('+map', None)
+        saveConfig()
         
     def wadMenu(self, position):
-        item = cat_model.itemFromIndex(self.cat_list.indexAt(position))
-        # If nothing is selected, default to root
-        if isinstance(item, type(None)):
-            item = cat_model.item(0)
-            print(item.text())
+        """ Context menu of folder view, for WAD or category under cursor.
+        
+        Actions on WADs apply to all selected ones, moving and removing
+        them is done from category clicked WAD is in.
+        """
+        model = self.cat_list.model()
+        clicked = self.cat_list.indexAt(position)
+        node = model.nodeFromIndex(clicked)
         menu = QtWidgets.QMenu()
         
         openItem = menu.addAction('View in Explorer')
         sortItems = menu.addAction('Sort list')
         
         addCat = menu.addAction('Add new category...')
-        setItem = menu.addAction('Set category...')
+        tagItem = menu.addAction('Add to category...')
+        setItem = menu.addAction('Move to category...')
+        untagItem = menu.addAction('Remove from category')
         delCat = menu.addAction('Remove category')
-        if item.type:
+        if node.wad is not None:
+            group = model.nodeFromIndex(clicked.parent()).name
             delCat.setVisible(False)
+            untagItem.setVisible(group != DEFAULT_CAT)
         else:
-            setItem.setVisible(False)
-            openItem.setVisible(False)
+            for action in (tagItem, setItem, untagItem, openItem):
+                action.setVisible(False)
+            # Empty space below list
+            if node is model.root:
+                delCat.setVisible(False)
         
         action = menu.exec_(self.cat_list.mapToGlobal(position))
         if action == addCat:
             self.catDialog()
+        elif action == tagItem:
+            self.setDialog(self.selectedWADs(node))
         elif action == setItem:
-            self.setDialog(item)
+            self.setDialog(self.selectedWADs(node), group)
+        elif action == untagItem:
+            library.untagWADs(self.selectedWADs(node), group)
         elif action == delCat:
-            self.delCatDialog(item)
+            self.delCatDialog(node)
         elif action == openItem:
-            self.openItem(item)
+            self.openItem(node.wad)
         elif action == sortItems:
-            self.cat_list.model().sort(0)
+            model.sort(0)
+            
+    def selectedWADs(self, node):
+        """ PWAD nodes selected in folder view, or just the one clicked.
+        
+        WADs with many tags are selected once, however many times they
+        are shown.
+        """
+        model = self.cat_list.model()
+        nodes = [model.nodeFromIndex(index) for index in self.cat_list.selectionModel().selectedRows()]
+        nodes = list({id(selected): selected for selected in nodes if selected.wad is not None}.values())
+        return nodes if node in nodes else [node]
 
     def addDialog(self):
         # getOpenFileName returns tuple (filename, filter)
@@ -548,11 +2120,9 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         if not temp:
             return
         temp = os.path.normpath(temp)
-        hash = fileToHash(temp)
-        wad_list[hash] = WADItem(temp)
-        item = WADListItem(wad_list[hash])
-        item.setCheckable(True)
-        wad_model.appendRow(item)
+        wad = WADItem(temp, fileToHash(temp), fingerprint(temp), {'added': True})
+        library.addWADItem(wad, 'PWAD')
+        storeWAD(wad, 'PWAD')
         
     def addIDialog(self):
         # getOpenFileName returns tuple (filename, filter)
@@ -560,12 +2130,29 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         if not temp:
             return
         temp = os.path.normpath(temp)
-        hash = fileToHash(temp)
-        iwad_list[hash] = WADItem(temp)
-        iwad_model.appendRow(WADListItem(iwad_list[hash]))
+        wad = WADItem(temp, fileToHash(temp), fingerprint(temp), {'added': True})
+        library.addWADItem(wad, 'IWAD')
+        storeWAD(wad, 'IWAD')
         if len(iwad_list) == 1:
-            config_current['-iwad'] = iwad_list[hash].path
+            config_current['-iwad'] = wad.path
+            saveConfig()
             
+    def profileDialog(self):
+        """ Saves current game config under name, for wadlaunch.py -p.
+        
+        Existing profiles are offered, picking one overwrites it.
+        """
+        names = [key[len('config:'):] for key in index.keys('config:') if key != 'config:lastconfig']
+        name, ok = QtWidgets.QInputDialog.getItem(self, 'Save profile', 'Profile name:', names, 0, True)
+        name = name.strip()
+        if not ok or not name:
+            return
+        if name == 'lastconfig':
+            QtWidgets.QMessageBox.warning(self, 'Error!', 'This name is reserved for last used config.', QtWidgets.QMessageBox.Ok)
+            return
+        saveConfig(name)
+        self.statusBar().showMessage('Saved profile {0}.'.format(name), 3000)
+        
     def catDialog(self):
         dc = QtWidgets.QDialog(parent = self)
         dc.setWindowTitle('Add new category...')
@@ -591,17 +2178,22 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         dc.exec_()
         
     def addNewCat(self, dialog):
-        cat = dialog.text_name.text()
-        if cat not in cat_model_contents:
-            temp = WADListItem(cat, '', 0, 'Dog')
-            cat_model_contents[cat] = temp
-            cat_model.appendRow(temp)
+        cat = dialog.text_name.text().strip()
+        if cat and library.cat_model.group(cat) is None:
+            library.addCategory(cat)
             dialog.accept()
         else:
             msg = QtWidgets.QMessageBox.warning(self, 'Error!', 'Such category already exists!', QtWidgets.QMessageBox.Ok)
         return
         
-    def setDialog(self, item):
+    def setDialog(self, nodes, source = None):
+        """ Asks for category to put WADs into.
+        
+        Args:
+        nodes - list of PWAD Node objects
+        source - category WADs are moved out of, None to only add them
+        to another one
+        """
         di = QtWidgets.QDialog(parent = self)
         di.setWindowTitle('Choose category...')
         di.setWindowModality(QtCore.Qt.ApplicationModal)
@@ -609,8 +2201,9 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         di_layoutV = QtWidgets.QVBoxLayout()
               
         di.list_cats = QtWidgets.QListWidget()
-        for cat in cat_model_contents.keys():
-            di.list_cats.addItem(cat)
+        for cat in library.cat_model.names():
+            if cat != source and (source is not None or cat != DEFAULT_CAT):
+                di.list_cats.addItem(cat)
                 
         di_layoutV.addWidget(di.list_cats)
         
@@ -622,34 +2215,34 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         
         di_layoutV.addLayout(di_layoutH)
         
-        apply.clicked.connect(partial(self.setItem, item, di))
+        apply.clicked.connect(partial(self.setItem, nodes, source, di))
         cancel.clicked.connect(di.reject)
         
         di.setLayout(di_layoutV)
         di.exec_()
         
-    def setItem(self, item, dialog):
-        new_cat = dialog.list_cats.selectedItems()[0].text()
-        old_cat = item.cat
-        item.cat = new_cat
-        cats[item.text()] = new_cat
-        cat_model_contents[new_cat].appendRow(cat_model_contents[old_cat].takeRow(item.row()))
+    def setItem(self, nodes, source, dialog):
+        selected = dialog.list_cats.selectedItems()
+        if not selected:
+            return
+        if source is None:
+            library.tagWADs(nodes, selected[0].text())
+        else:
+            library.moveWADs(nodes, source, selected[0].text())
         dialog.accept()
         return
         
-    def delCatDialog(self, item):
+    def delCatDialog(self, group):
         print('Deleting a category')
-        if item.text() == 'All WADs':
+        if group.name == DEFAULT_CAT:
             msg = QtWidgets.QMessageBox.warning(self, 'Error!', 'This is default category, you can\'t remove it!', QtWidgets.QMessageBox.Ok)
             return
-        msg = QtWidgets.QMessageBox.question(self, 'Confirmation', 'Are you sure you want to delete this category?\nAll items in it will be moved to default one!', QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No, QtWidgets.QMessageBox.No)
+        msg = QtWidgets.QMessageBox.question(self, 'Confirmation', 'Are you sure you want to delete this category?\nWADs that have no other category will be moved to default one!', QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No, QtWidgets.QMessageBox.No)
         if msg == QtWidgets.QMessageBox.Yes:
-            while item.hasChildren():
-                cat_model_contents['All WADs'].appendRow(item.takeRow(0))
-            cat_model.takeRow(cat_model_contents.pop(item.text()).row())
+            library.removeCategory(group.name)
         
-    def openItem(self, item):
-        os.startfile(os.path.dirname(item.path))
+    def openItem(self, wad):
+        QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(os.path.dirname(wad.path)))
         return
     
     def prefDialog(self):
@@ -683,6 +2276,15 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         check_port = QtWidgets.QCheckBox()
         generalG.addWidget(check_port, 1, 1)
         
+        label_launch = QtWidgets.QLabel('While game runs: ')
+        generalG.addWidget(label_launch, 2, 0)
+        
+        dp.combo_launch = QtWidgets.QComboBox()
+        for key, text in LAUNCH_BEHAVIOURS.items():
+            dp.combo_launch.addItem(text, key)
+        dp.combo_launch.setCurrentIndex(max(0, dp.combo_launch.findData(prefs['General'].get('on_launch', 'hide'))))
+        generalG.addWidget(dp.combo_launch, 2, 1)
+        
         tab_general.setLayout(generalG)
         tabs.addTab(tab_general, 'General')
         
@@ -716,6 +2318,37 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         
         tab_paths.setLayout(pathsV)
         tabs.addTab(tab_paths, 'Paths')
+        
+        # Third tab
+        tab_scan = QtWidgets.QWidget()
+        scanG = QtWidgets.QGridLayout()
+        
+        label_workers = QtWidgets.QLabel('Workers reading files during scan: ')
+        scanG.addWidget(label_workers, 0, 0)
+        
+        dp.spin_workers = QtWidgets.QSpinBox()
+        dp.spin_workers.setRange(1, 64)
+        dp.spin_workers.setValue(prefs['Scan'].getint('workers', 1))
+        scanG.addWidget(dp.spin_workers, 0, 1)
+        
+        label_pool = QtWidgets.QLabel('Run workers as: ')
+        scanG.addWidget(label_pool, 1, 0)
+        
+        dp.combo_pool = QtWidgets.QComboBox()
+        dp.combo_pool.addItems(list(wadscan.POOLS.keys()))
+        dp.combo_pool.setCurrentText(prefs['Scan'].get('pool', 'thread'))
+        scanG.addWidget(dp.combo_pool, 1, 1)
+        
+        label_watch = QtWidgets.QLabel('Watch WAD folders for changes: ')
+        scanG.addWidget(label_watch, 2, 0)
+        
+        dp.check_watch = QtWidgets.QCheckBox()
+        dp.check_watch.setChecked(prefs['Scan'].getboolean('watch', False))
+        scanG.addWidget(dp.check_watch, 2, 1)
+        scanG.setRowStretch(3, 1)
+        
+        tab_scan.setLayout(scanG)
+        tabs.addTab(tab_scan, 'Scanning')
         dp_layoutV.addWidget(tabs)
         
         # Apply Cancel buttons go here
@@ -733,6 +2366,102 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         dp.setLayout(dp_layoutV)
         dp.exec_()
 
+    def dupesDialog(self):
+        """ Shows duplicate files in WAD folders, see DuplicatesDialog.
+        
+        """
+        if self.scan_thread is not None:
+            self.statusBar().showMessage('Wait for scan to finish first.', 3000)
+            return
+        dialog = DuplicatesDialog(prefs['WADPaths']['path'].split('\n'), self)
+        dialog.removed.connect(self.duplicatesRemoved)
+        dialog.exec_()
+        
+    def duplicatesRemoved(self, pairs):
+        """ Replaces removed duplicates with kept copies in library and config.
+        
+        Args:
+        pairs - list of (removed path, kept path) tuples
+        """
+        changed = False
+        for path, keep in pairs:
+            if path in config_current['-file']:
+                config_current['-file'].replace(path, keep)
+                changed = True
+        if changed:
+            saveConfig()
+            self.fillLoadList()
+        # Kept copy may not be in library yet, e.g. outside of WAD folders
+        added = {keep: wadscan.ScanResult(keep) for path, keep in pairs if path in library.items and keep not in library.items}
+        self.foldersChanged([path for path, keep in pairs], list(added.values()))
+        
+    def diagDialog(self):
+        """ Shows timings collected by wadtrace.
+        
+        Table sums up spans by name, list below has most recent events.
+        "Save trace..." writes what's in memory into file, to be sent
+        along with report of something being slow.
+        """
+        dd = QtWidgets.QDialog(parent = self)
+        dd.setWindowTitle('Diagnostics')
+        dd.resize(640, 480)
+        
+        dd_layoutV = QtWidgets.QVBoxLayout()
+        dd.table = QtWidgets.QTableWidget(0, 5)
+        dd.table.setHorizontalHeaderLabels(['Span', 'Count', 'Total, ms', 'Longest, ms', 'Last, ms'])
+        dd.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        dd.table.verticalHeader().hide()
+        dd.table.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        dd_layoutV.addWidget(dd.table)
+        
+        dd.counters = QtWidgets.QLabel()
+        dd.counters.setWordWrap(True)
+        dd_layoutV.addWidget(dd.counters)
+        
+        dd.recent = QtWidgets.QListWidget()
+        dd_layoutV.addWidget(dd.recent)
+        
+        dd_layoutH = QtWidgets.QHBoxLayout()
+        refresh = QtWidgets.QPushButton('Refresh')
+        refresh.clicked.connect(partial(self.diagRefresh, dd))
+        dd_layoutH.addWidget(refresh)
+        save = QtWidgets.QPushButton('Save trace...')
+        save.clicked.connect(self.diagSave)
+        dd_layoutH.addWidget(save)
+        close = QtWidgets.QPushButton('Close')
+        close.clicked.connect(dd.accept)
+        dd_layoutH.addWidget(close)
+        dd_layoutV.addLayout(dd_layoutH)
+        dd_layoutV.setAlignment(dd_layoutH, QtCore.Qt.AlignRight)
+        
+        dd.setLayout(dd_layoutV)
+        self.diagRefresh(dd)
+        dd.exec_()
+        
+    def diagRefresh(self, dd):
+        stats = wadtrace.tracer.stats()
+        dd.table.setRowCount(len(stats))
+        for row, (name, calls, total, longest, last) in enumerate(stats):
+            for column, value in enumerate((name, str(calls), '{0:.1f}'.format(total * 1000), '{0:.1f}'.format(longest * 1000), '{0:.1f}'.format(last * 1000))):
+                dd.table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+        dd.counters.setText(', '.join('{0}: {1}'.format(name, value) for name, value in sorted(wadtrace.tracer.counters.items())))
+        dd.recent.clear()
+        for event in reversed(wadtrace.ring.events()[-200:]):
+            if event['kind'] == 'span':
+                dd.recent.addItem('{0:10.3f}s  {1}  {2:.1f} ms'.format(event['start'], event['name'], event['duration'] * 1000))
+            else:
+                dd.recent.addItem('{0:10.3f}s  {1} += {2}'.format(event['start'], event['name'], event['args']['value']))
+        
+    def diagSave(self):
+        filename = QtWidgets.QFileDialog.getSaveFileName(self, 'Save trace', 'trace.json', 'Chrome trace (*.json);;JSON lines (*.jsonl)')[0]
+        if not filename:
+            return
+        sink = wadtrace.makeSink(filename)
+        for event in wadtrace.ring.events():
+            sink.emit(event)
+        sink.close()
+        self.statusBar().showMessage('Trace saved to {0}.'.format(filename), 3000)
+        
     def setEnginePath(self, caller):
         temp = os.path.normpath(QtWidgets.QFileDialog.getExistingDirectory(self, "Select GZDoom executable"))
         caller.setText(temp)
@@ -757,54 +2486,184 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
     def saveSettings(self, dialog):
         # General tab
         prefs['General']['gz_path'] = dialog.text_gzpath.text()
+        prefs['General']['on_launch'] = dialog.combo_launch.currentData()
         # Paths tab
         prefs['WADPaths']['path'] = ''
         temp = []
         for num in range(dialog.list_pwads.count()):
             temp.append(dialog.list_pwads.item(num).text())
         prefs['WADPaths']['path'] = '\n'.join(temp)
+        # Scanning tab
+        prefs['Scan']['workers'] = str(dialog.spin_workers.value())
+        prefs['Scan']['pool'] = dialog.combo_pool.currentText()
+        prefs['Scan']['watch'] = 'yes' if dialog.check_watch.isChecked() else 'no'
+        self.startWatching()
         dialog.accept()
     
     def launchGame(self):
         """ Start GZDoom with selected parametres.
     
         This will be collecting info from all over the programm and assemble it in one
-        long, thick string that's then is sent to subprocess module, which launches game.
-        There will be selectable behaviour - to lay hidden in wait for game to terminate,
-        or exit after launching it.
+        long, thick string that's then is sent to QProcess, see GameSession.
+        Any number of games can run at once. While any of them does, window
+        hides, minimizes or stays as it is, depending on preferences.
         """
         #print(self.iwad_list.selectedIndexes()[0].data())
         #print(self.iwad_model.item(self.iwad_select.currentIndex()).wad)
         #print(self.wad_list.selectedIndexes()[0].row())
-        command_string = [prefs['General']['gz_path'] + prefs['General']['executable'], '-iwad', config_current['-iwad']]
-        for item in config_current['-file']:
-            command_string.append('-file')
-            command_string.append(item)
-        gzprocess = subprocess.Popen(command_string)
-        self.hide()
-        gzprocess.wait()
-        self.show()
+        command_string = buildCommand(prefs, config_current)
+        session = GameSession(command_string, self)
+        session.ended.connect(self.gameEnded)
+        self.sessions.append(session)
+        with span('launch', files = len(config_current['-file'])):
+            session.start()
+        self.statusBar().showMessage('Game started.', 3000)
+        behaviour = prefs['General'].get('on_launch', 'hide')
+        if behaviour == 'hide':
+            self.hide()
+        elif behaviour == 'minimize':
+            self.showMinimized()
+        if self.log_dialog is not None:
+            self.log_dialog.addSession(session)
+            
+    def gameEnded(self, session):
+        """ Brings window back once last game is gone, reports how it ended.
+        
+        Log viewer is opened if game crashed or failed.
+        """
+        status = session.status()
+        print('{0} {1}'.format(session.name(), status))
+        wadtrace.count('launch.' + ('ok' if session.exit_code == 0 and not session.crashed and session.error is None else 'failed'))
+        if any(other.running() for other in self.sessions):
+            return
+        if self.quitting:
+            self.close()
+            return
+        if self.isHidden() or self.isMinimized():
+            self.showNormal()
+            self.activateWindow()
+        self.statusBar().showMessage('Game {0}.'.format(status), 5000)
+        if session.crashed or session.error is not None or session.exit_code:
+            self.logDialog(session)
+            
+    def logDialog(self, session = None):
+        """ Shows output of games, live while they run.
+        
+        Args:
+        session - GameSession to show, last one by default
+        """
+        if self.log_dialog is None:
+            self.log_dialog = GameLogDialog(self.sessions, self)
+        self.log_dialog.showSession(session or (self.sessions[-1] if self.sessions else None))
+        self.log_dialog.show()
+        self.log_dialog.raise_()
         
     def checkingItems(self, item):
-        if item.checkState():
-            print('Added ', item)
-            config_current['-file'].append(item.wad.path)
-        if not item.checkState():
-            print('Removed ', item)
-            config_current['-file'].remove(item.wad.path)
+        # Node is shared, views other than one it was checked in redraw it
+        library.wad_model.nodeChanged(item)
+        library.cat_model.nodeChanged(item)
+        self.search_model.nodeChanged(item)
+        config_current['-file'].toggle(item.wad.path, item.checked)
+        saveConfig()
+        self.fillLoadList()
+        self.fillMaps()
+        report = self.updateConflicts()
+        if item.checked and report and report[-1]['path'] == item.wad.path:
+            entry = report[-1]
+            if entry['lumps'] or entry['maps']:
+                self.statusBar().showMessage('{0} overrides {1} lumps and {2} maps of files loaded before it.'.format(
+                    item.wad.name(), sum(map(len, entry['lumps'].values())), sum(map(len, entry['maps'].values()))), 5000)
+        
+    def updateConflicts(self):
+        """ Checks current load order for overrides, see ConflictAnalyzer.
+        
+        Lump names come from cache, so only files never seen before are
+        read. Conflicts dialog is updated, if it's open.
+        
+        Return:
+        Report of ConflictAnalyzer.analyze.
+        """
+        files = [(library.items[path].hash, path) for path in config_current['-file'] if path in library.items]
+        report = self.analyzer.analyze(files)
+        if self.conflicts_dialog is not None and self.conflicts_dialog.isVisible():
+            self.conflicts_dialog.showReport(report)
+        return report
+        
+    def conflictsDialog(self):
+        """ Shows what checked PWADs override in each other.
+        
+        """
+        if self.conflicts_dialog is None:
+            self.conflicts_dialog = ConflictsDialog(self)
+        self.conflicts_dialog.show()
+        self.updateConflicts()
+        self.conflicts_dialog.raise_()
             
     def iwadChanged(self, what):
-        config_current['-iwad'] = iwad_model.item(what).wad.path
-        self.iwad_label.setPixmap(QtGui.QPixmap(LOGOS[iwad_model.item(what).text().lower()]))
+        node = self.shown.iwad_model.node(what)
+        config_current['-iwad'] = node.wad.path
+        saveConfig()
+        self.showGame(node)
+        self.fillMaps()
+        
+    def showGame(self, node):
+        """ Shows logo and name of game IWAD belongs to.
+        
+        Game is told by contents of file, not its name, see wadident.
+        
+        Args:
+        node - Node of IWAD
+        """
+        game = GAMES.get(ident_cache.identify(node.hash, node.wad.path))
+        if game is None:
+            self.iwad_label.setPixmap(QtGui.QPixmap(NO_LOGO))
+            self.iwad_label.setToolTip('Unknown game')
+        else:
+            self.iwad_label.setPixmap(QtGui.QPixmap(game['logo'] or NO_LOGO))
+            self.iwad_label.setToolTip(game['name'])
         
     def closeEvent(self, event):
+        # Games keep running, program quits once they're done
+        if any(session.running() for session in self.sessions):
+            print('Waiting for games to exit...')
+            self.quitting = True
+            self.hide()
+            event.ignore()
+            return
         print('Exiting...')
-        saveConfig('lastconfig.dat')
-        #saveCats()
+        if self.load_thread is not None:
+            self.load_thread.wait()
+        if self.scan_thread is not None:
+            self.scan_thread.cancel.set()
+            self.scan_thread.wait()
+        for thread in list(self.watch_threads):
+            thread.cancel.set()
+            thread.wait()
+        self.preview_thread.stop()
+        self.watcher.stop()
+        self.watcher.wait()
+        if self.map_thread is not None:
+            self.map_thread.cancel.set()
+            self.map_thread.wait()
+        if self.hash_thread is not None:
+            self.hash_thread.requestInterruption()
+            self.hash_thread.wait()
+        if getattr(self, 'verify_thread', None):
+            self.verify_thread.requestInterruption()
+            self.verify_thread.wait()
+        saveConfig()
         with open('prefs.ini', 'w') as file:
             prefs.write(file)
-        saveWADList('WADList.dat', wad_list)
-        saveWADList('IWADList.dat', iwad_list)
+        index.close()
+        file_cache.save()
+        dir_cache.save()
+        lump_cache.save()
+        ident_cache.save()
+        # Totals of whole session, counters are sent before sinks close
+        for name, cache in (('file_cache', file_cache), ('dir_cache', dir_cache)):
+            wadtrace.count('exit.{0}_hits'.format(name), cache.hits)
+            wadtrace.count('exit.{0}_misses'.format(name), cache.misses)
+        wadtrace.tracer.close()
         event.accept()
 
     def clExit(self):
@@ -812,7 +2671,4 @@ class MyWindowClass(QtWidgets.QMainWindow, form.Ui_MainWindow):
         
 # ================================================================
 if __name__ == '__main__':
-    app = QtWidgets.QApplication(sys.argv)
-    myWindow = MyWindowClass(None)
-    myWindow.show()
-    app.exec_()
+    sys.exit(main())
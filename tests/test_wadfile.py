@@ -0,0 +1,40 @@
+import io, os, sys, struct, zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wadfile import WadError, classifyZip, zipDirectory, ZIP_END_MAGIC, ZIP_ENTRY_MAGIC
+
+FOLDERS = (b'maps', b'sprites')
+
+def makeZip(names, comment = b''):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name in names:
+            archive.writestr(name, b'data')
+        archive.comment = comment
+    return buffer.getvalue()
+
+def test_classify():
+    data = makeZip(['maps/map01.wad'])
+    assert classifyZip(data, len(data), FOLDERS) == 'PWAD'
+    data = makeZip(['iwadinfo', 'maps/map01.wad'])
+    assert classifyZip(data, len(data), FOLDERS) == 'IWAD'
+    data = makeZip(['readme.txt'])
+    assert classifyZip(data, len(data), FOLDERS) is None
+
+def test_end_record_magic_in_comment():
+    data = makeZip(['maps/map01.wad'], b'xx' + ZIP_END_MAGIC + b'yy')
+    assert zipDirectory(data, len(data))[0] == 1
+
+def test_truncated():
+    data = makeZip(['maps/map01.wad'])[:-3]
+    with pytest.raises(WadError):
+        zipDirectory(data, len(data))
+
+def test_name_past_central_directory():
+    data = bytearray(makeZip(['maps']))
+    entry = data.index(ZIP_ENTRY_MAGIC)
+    struct.pack_into('<H', data, entry + 28, 9)
+    with pytest.raises(WadError):
+        classifyZip(bytes(data), len(data), FOLDERS)
@@ -0,0 +1,20 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wadmaps import parseMapinfo
+
+def test_quoted_title():
+    text = 'map MAP01 "Entryway"\nmap E1M1 "Hangar" {\n}\n'
+    assert parseMapinfo(text, {}) == {'MAP01': 'Entryway', 'E1M1': 'Hangar'}
+
+def test_lookup_title():
+    strings = {'HUSTR_1': 'Entryway'}
+    assert parseMapinfo('map MAP01 lookup "HUSTR_1"\n', strings) == {'MAP01': 'Entryway'}
+    assert parseMapinfo('map MAP01 "$HUSTR_1"\n', strings) == {'MAP01': 'Entryway'}
+
+def test_bare_title_whole_line():
+    text = 'map 1 WINNOWING HALL  \nwarptrans 1\nmap 2 SEVEN PORTALS\n'
+    assert parseMapinfo(text, {}) == {'MAP01': 'WINNOWING HALL', 'MAP02': 'SEVEN PORTALS'}
+
+def test_bare_title_before_brace():
+    assert parseMapinfo('map MAP01 Entry Way {\n}\n', {}) == {'MAP01': 'Entry Way'}
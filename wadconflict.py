@@ -0,0 +1,183 @@
+# ================================================================
+# Imports
+# ================================================================
+import os, struct, zipfile
+
+from wadhash import CacheFile
+from wadfile import WadError, openLumps
+from wadtrace import span, count
+
+# ================================================================
+# Constants
+# ================================================================
+# Lumps that follow map marker in WAD files
+MAP_LUMPS = frozenset(['THINGS', 'LINEDEFS', 'SIDEDEFS', 'VERTEXES', 'SEGS', 'SSECTORS', 'NODES', 'SECTORS', 'REJECT',
+                       'BLOCKMAP', 'BEHAVIOR', 'SCRIPTS', 'TEXTMAP', 'ZNODES', 'DIALOGUE', 'ENDMAP', 'LEAFS', 'LIGHTS', 'MACROS',
+                       'GL_VERT', 'GL_SEGS', 'GL_SSECT', 'GL_NODES', 'GL_PVS'])
+# Lumps port reads from every file and merges instead of replacing
+MERGED = frozenset(['DECORATE', 'ZSCRIPT', 'MAPINFO', 'ZMAPINFO', 'UMAPINFO', 'EMAPINFO', 'SNDINFO', 'GLDEFS', 'LANGUAGE',
+                    'KEYCONF', 'TEXTURES', 'ANIMDEFS', 'LOCKDEFS', 'TERRAIN', 'DECALDEF', 'SNDSEQ', 'GAMEINFO', 'MENUDEF',
+                    'SBARINFO', 'FONTDEFS', 'ALTHUDCF', 'CVARINFO', 'LOADACS', 'MODELDEF', 'VOXELDEF', 'TRNSLATE',
+                    'REVERBS', 'SECRETS', 'DEHSUPP', 'IWADINFO', 'SKININFO', 'XHAIRS', 'X11R6RGB', 'PALVERS', 'S_SKIN'])
+# WAD marker prefixes and namespaces they open
+NAMESPACES = {'S': 'sprites', 'SS': 'sprites', 'F': 'flats', 'FF': 'flats', 'P': 'patches', 'PP': 'patches',
+              'TX': 'textures', 'C': 'colormaps', 'A': 'acs', 'V': 'voxels', 'HI': 'hires'}
+# PK3 folders sharing namespace with WAD lumps outside markers
+GLOBAL_FOLDERS = ('', 'graphics', 'sounds', 'music')
+
+# ================================================================
+# Functions
+# ================================================================
+def wadLumps(lumps):
+    """ Lump and map names of WAD file.
+
+    Lumps inside S_START/S_END and similar markers are put into their
+    namespace, e.g. 'sprites/TROOA1'. Map lumps are left out, map as a
+    whole is listed by its name instead.
+
+    Args:
+    lumps - wadfile.WadFile object
+
+    Return:
+    Tuple (lump names, map names), both lists without duplicates.
+    """
+    names = lumps.names()
+    result = {}
+    maps = {}
+    namespace = ''
+    i = 0
+    while i < len(names):
+        name = names[i].upper()
+        prefix, marker, edge = name.rpartition('_')
+        if marker and edge in ('START', 'END'):
+            # Inner markers like F1_START just get skipped
+            if prefix in NAMESPACES:
+                namespace = NAMESPACES[prefix] + '/' if edge == 'START' else ''
+        elif i + 1 < len(names) and names[i + 1].upper() in ('THINGS', 'TEXTMAP'):
+            maps[name] = None
+            i += 1
+            while i + 1 < len(names) and names[i + 1].upper() in MAP_LUMPS:
+                i += 1
+        elif namespace or name not in MERGED:
+            result[namespace + name] = None
+        i += 1
+    return list(result), list(maps)
+
+def pk3Lumps(lumps):
+    """ Lump and map names of PK3 file, see wadLumps.
+
+    Members of lump folders are named by namespace and lump name, like
+    WAD lumps are, so PK3 can be checked against WAD. Members of other
+    folders keep their full path. Maps are WADs in maps folder.
+    """
+    result = {}
+    maps = {}
+    for member in lumps.names():
+        if member.endswith('/'):
+            continue
+        folder, slash, name = member.rpartition('/')
+        short = os.path.splitext(name)[0].upper()
+        top = folder.partition('/')[0].lower()
+        if top == 'maps' and name.lower().endswith('.wad'):
+            maps[short] = None
+        elif top in GLOBAL_FOLDERS:
+            if short not in MERGED:
+                result[short] = None
+        elif top in NAMESPACES.values():
+            result[top + '/' + short] = None
+        else:
+            result[member.lower()] = None
+    return list(result), list(maps)
+
+def readLumps(path):
+    """ Lump and map names of WAD or PK3, see wadLumps.
+
+    Return:
+    Tuple (lump names, map names), None if file can't be read.
+    """
+    try:
+        with span('conflict.read'), openLumps(path) as lumps:
+            if path.lower().endswith('.wad'):
+                return wadLumps(lumps)
+            return pk3Lumps(lumps)
+    except (OSError, ValueError, WadError, struct.error, zipfile.BadZipFile) as error:
+        print('{0}: {1}'.format(path, error))
+        return None
+
+# ================================================================
+# Classes
+# ================================================================
+class LumpCache(CacheFile):
+    """ Lump and map names of files, keyed by hash of file.
+
+    Contents never change for the same hash, so entries are never
+    invalidated, and copies of one file share them.
+    """
+
+    def lumps(self, hash, path):
+        """ Lump and map names of file, read only if not cached.
+
+        Return:
+        Tuple (lump names, map names), None if file can't be read.
+        """
+        with self.lock:
+            entry = self.entries.get(hash)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = readLumps(path)
+        if entry is not None:
+            with self.lock:
+                self.entries[hash] = entry
+                self.dirty = True
+        return entry
+
+class ConflictAnalyzer:
+    """ Tells which files of load order override lumps and maps of others.
+
+    Owners of every lump name are kept from last analysis. When new
+    load order only adds files at its end, which is what checking one
+    more PWAD does, only those files are looked at.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.order = []
+        # name -> position in order of file providing it, for lumps and maps
+        self.owners = ({}, {})
+        self.report = []
+
+    def analyze(self, files):
+        """ Finds overrides in load order.
+
+        Args:
+        files - list of (hash, path) tuples, in load order
+
+        Return:
+        List with dictionary for every file, having 'path', 'lumps' and
+        'maps'. Both of the latter map path of earlier file to sorted
+        list of names this file overrides in it.
+        """
+        with span('conflict.analyze', files = len(files)):
+            if files[:len(self.order)] != self.order:
+                self.order = []
+                self.owners = ({}, {})
+                self.report = []
+            for hash, path in files[len(self.order):]:
+                position = len(self.order)
+                entry = self.cache.lumps(hash, path)
+                found = ({}, {})
+                for names, owners, overridden in zip(entry or ((), ()), self.owners, found):
+                    for name in names:
+                        owner = owners.get(name)
+                        if owner is not None:
+                            overridden.setdefault(self.order[owner][1], []).append(name)
+                        owners[name] = position
+                for overridden in found:
+                    for names in overridden.values():
+                        names.sort()
+                count('conflict.overrides', sum(len(names) for overridden in found for names in overridden.values()))
+                self.order.append((hash, path))
+                self.report.append({'path': path, 'lumps': found[0], 'maps': found[1]})
+        return self.report
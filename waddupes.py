@@ -0,0 +1,205 @@
+# ================================================================
+# Imports
+# ================================================================
+import os, hashlib
+
+from wadhash import fingerprint, hashFile
+from wadtrace import span, count
+
+# ================================================================
+# Constants
+# ================================================================
+# Bytes read from each end of file for partial hash
+PARTIAL_SIZE = 64 * 1024
+
+# ================================================================
+# Classes
+# ================================================================
+class DuplicateGroup:
+    """ Files with identical contents.
+
+    Paths that are already hard links of each other count as one copy,
+    "links" maps each path to first path sharing its inode.
+    """
+
+    def __init__(self, hash, size, paths, links = None):
+        self.hash = hash
+        self.size = size
+        self.paths = paths
+        self.links = links or {}
+
+    def copies(self):
+        """ Number of separate copies on disk.
+
+        """
+        return len(self.paths) - len(self.links)
+
+    def wasted(self):
+        """ Bytes that would be freed by keeping only one copy.
+
+        """
+        return self.size * (self.copies() - 1)
+
+# ================================================================
+# Functions
+# ================================================================
+def partialHash(path, size, cache = None, fp = None):
+    """ MD5 of first and last PARTIAL_SIZE bytes of file.
+
+    For files no bigger than 2 * PARTIAL_SIZE that's whole file, so it
+    is as good as full hash.
+
+    Args:
+    path - path to file
+    size - size of file
+    cache - wadhash.FileCache to keep result in, under 'partial'
+    fp - fingerprint of file, needed with cache
+    """
+    if cache is not None:
+        value = cache.lookup(path, 'partial', fp)
+        if value is not None:
+            return value
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        if size <= 2 * PARTIAL_SIZE:
+            md5.update(file.read())
+        else:
+            md5.update(file.read(PARTIAL_SIZE))
+            file.seek(-PARTIAL_SIZE, os.SEEK_END)
+            md5.update(file.read(PARTIAL_SIZE))
+    count('dupes.partial_bytes', min(size, 2 * PARTIAL_SIZE))
+    value = md5.hexdigest()
+    if cache is not None:
+        cache.store(path, 'partial', value, fp)
+    return value
+
+def groupBy(paths, key):
+    """ Groups paths by key, keeping only groups of two and more.
+
+    Args:
+    paths - list of paths
+    key - function giving key of path, None to drop path
+
+    Return:
+    List of lists of paths.
+    """
+    groups = {}
+    for path in paths:
+        try:
+            value = key(path)
+        except OSError as error:
+            print('{0}: {1}'.format(path, error))
+            continue
+        if value is not None:
+            groups.setdefault(value, []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+def findDuplicates(paths, cache = None, cancel = None, progress = None):
+    """ Finds files with same contents, reading as little as possible.
+
+    Files are grouped by size first, which costs one stat per file.
+    Only files sharing size are partially hashed, see partialHash, and
+    only those still colliding after that are hashed whole. Hard links
+    of one file are never read more than once.
+
+    Args:
+    paths - list of file paths
+    cache - wadhash.FileCache, partial and full hashes are taken from
+    and stored in it
+    cancel - threading.Event, search stops once it's set
+    progress - function called with (done, total) while hashing
+
+    Return:
+    List of DuplicateGroup objects, most wasted space first, None if
+    cancelled.
+    """
+    stats = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError as error:
+            print('{0}: {1}'.format(path, error))
+            continue
+        if stat.st_size:
+            stats[path] = stat
+    with span('dupes.size', files = len(stats)):
+        by_size = groupBy(stats, lambda path: stats[path].st_size)
+
+    def fp(path):
+        stat = stats[path]
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    # Hard links are read once, through first path of each inode
+    inodes = {}
+    links = {}
+    candidates = []
+    for group in by_size:
+        unique = []
+        for path in group:
+            key = (stats[path].st_dev, stats[path].st_ino)
+            if key in inodes:
+                links[path] = inodes[key]
+            else:
+                inodes[key] = path
+                unique.append(path)
+        if len(unique) > 1:
+            candidates.append(unique)
+
+    total = sum(len(group) for group in candidates)
+    done = 0
+    by_partial = []
+    with span('dupes.partial', files = total):
+        for group in candidates:
+            if cancel is not None and cancel.is_set():
+                return None
+            by_partial.extend(groupBy(group, lambda path: partialHash(path, stats[path].st_size, cache, fp(path))))
+            done += len(group)
+            if progress is not None:
+                progress(done, total)
+
+    result = []
+    with span('dupes.full', files = sum(len(group) for group in by_partial)):
+        for group in by_partial:
+            size = stats[group[0]].st_size
+            if size <= 2 * PARTIAL_SIZE:
+                full = [(partialHash(path, size, cache, fp(path)), group)]
+            else:
+                hashes = {}
+                for path in group:
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    value = cache.lookup(path, 'md5', fp(path)) if cache is not None else None
+                    if value is None:
+                        value = hashFile(path)
+                        if cache is not None:
+                            cache.store(path, 'md5', value, fp(path))
+                    hashes.setdefault(value, []).append(path)
+                full = [(value, same) for value, same in hashes.items() if len(same) > 1]
+            for value, same in full:
+                # Put hard links back next to file they link to
+                linked = {path: origin for path, origin in links.items() if origin in same}
+                result.append(DuplicateGroup(value, size, sorted(same + list(linked)), linked))
+    result.sort(key = lambda group: group.wasted(), reverse = True)
+    return result
+
+def hardlink(keep, path):
+    """ Replaces file with hard link to another one.
+
+    Link is made under temporary name first and moved over file, so file
+    is never missing, even if something fails halfway.
+
+    Args:
+    keep - file to link to
+    path - file to replace
+
+    Return:
+    New fingerprint of path.
+    """
+    temp = '{0}.{1}.tmp'.format(path, os.getpid())
+    os.link(keep, temp)
+    try:
+        os.replace(temp, path)
+    except OSError:
+        os.remove(temp)
+        raise
+    return fingerprint(path)
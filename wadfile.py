@@ -0,0 +1,383 @@
+# ================================================================
+# Imports
+# ================================================================
+import os, mmap, struct, zlib, zipfile
+from array import array
+
+# ================================================================
+# Constants
+# ================================================================
+# WAD header: magic, number of lumps, offset of directory
+WAD_HEADER = struct.Struct('<4sii')
+# WAD directory entry: offset, size, name
+WAD_ENTRY = struct.Struct('<ii8s')
+# ZIP end of central directory record
+ZIP_END = struct.Struct('<4s4H2LH')
+ZIP_END_MAGIC = b'PK\x05\x06'
+# ZIP central directory file header
+ZIP_ENTRY = struct.Struct('<4s6H3L5H2L')
+ZIP_ENTRY_MAGIC = b'PK\x01\x02'
+# ZIP local file header
+ZIP_LOCAL = struct.Struct('<4s5H3L2H')
+
+# ================================================================
+# Classes
+# ================================================================
+class WadError(Exception):
+    """ File is not a WAD/PK3 or is broken beyond reading.
+
+    """
+
+class LumpFile:
+    """ Base of lump readers, mmaps file and keeps directory in arrays.
+
+    Lumps are returned as memoryview objects pointing right into mapped
+    file where possible, nothing gets copied. Views have to be released
+    (or simply dropped) before reader is closed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+            if not size:
+                raise WadError('{0}: empty file'.format(path))
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        except (OSError, ValueError, WadError):
+            self.file.close()
+            raise
+        self.view = memoryview(self.map)
+        self.size = size
+        self.lump_names = []
+        self.offsets = array('q')
+        self.sizes = array('q')
+        self.lookup = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.lump_names)
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # Someone still holds a lump, map goes away with last view
+            pass
+        self.file.close()
+
+    def names(self):
+        """ Names of all lumps, in directory order.
+
+        """
+        return self.lump_names
+
+    def index(self, name):
+        """ Index of lump with given name, last one wins like in game itself.
+
+        Return:
+        Index or -1 if there's no such lump.
+        """
+        if self.lookup is None:
+            self.lookup = {}
+            for i, lump in enumerate(self.lump_names):
+                self.lookup[lump.upper()] = i
+        return self.lookup.get(name.upper(), -1)
+
+    def lumpSize(self, key):
+        return self.sizes[key if isinstance(key, int) else self.index(key)]
+
+    def lump(self, key):
+        """ Contents of lump.
+
+        Args:
+        key - index of lump or its name
+
+        Return:
+        memoryview object, None if there's no such lump.
+        """
+        i = key if isinstance(key, int) else self.index(key)
+        if i < 0:
+            return None
+        return self.view[self.offsets[i]:self.offsets[i] + self.sizes[i]]
+
+class WadFile(LumpFile):
+    """ Reader of .wad files.
+
+    kind is 'IWAD' or 'PWAD', as stated by header.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        try:
+            self.readDirectory()
+        except (WadError, struct.error):
+            self.close()
+            raise
+
+    def readDirectory(self):
+        if self.size < WAD_HEADER.size:
+            raise WadError('{0}: WAD header not found'.format(self.path))
+        magic, numlumps, infotableofs = WAD_HEADER.unpack_from(self.map, 0)
+        if magic not in (b'IWAD', b'PWAD'):
+            raise WadError('{0}: WAD header not found'.format(self.path))
+        end = infotableofs + numlumps * WAD_ENTRY.size
+        if numlumps < 0 or infotableofs < 0 or end > self.size:
+            raise WadError('{0}: broken WAD directory'.format(self.path))
+        self.kind = magic.decode('ascii')
+        for offset, size, name in WAD_ENTRY.iter_unpack(self.view[infotableofs:end]):
+            # Markers and broken entries point nowhere
+            if offset < 0 or size < 0 or offset + size > self.size:
+                offset = size = 0
+            self.offsets.append(offset)
+            self.sizes.append(size)
+            self.lump_names.append(name.partition(b'\0')[0].decode('latin-1'))
+
+class Pk3File(LumpFile):
+    """ Reader of .pk3/.ipk3/.zip files.
+
+    Central directory is parsed straight from mapped file. Members are
+    named by their full path inside archive, lumps in PK3 sense (file
+    name without extension) can be found with lumpIndex. Stored members
+    are returned without copying, compressed ones have to be inflated.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.methods = array('H')
+        self.data_sizes = array('q')
+        self.headers = array('q')
+        try:
+            self.readDirectory()
+        except (WadError, struct.error, zipfile.BadZipFile):
+            self.close()
+            raise
+        self.short = None
+
+    def readDirectory(self):
+        for name, method, csize, usize, header in iterZipDirectory(self.map, self.size):
+            self.lump_names.append(name)
+            self.methods.append(method)
+            self.sizes.append(usize)
+            self.data_sizes.append(csize)
+            self.headers.append(header)
+            # Data offset is resolved on first read, see dataOffset
+            self.offsets.append(-1)
+
+    def dataOffset(self, i):
+        """ Where member's data starts, past its local header.
+
+        """
+        if self.offsets[i] < 0:
+            header = self.headers[i]
+            fields = ZIP_LOCAL.unpack_from(self.map, header)
+            if fields[0] != b'PK\x03\x04':
+                raise WadError('{0}: broken local header of {1}'.format(self.path, self.lump_names[i]))
+            self.offsets[i] = header + ZIP_LOCAL.size + fields[9] + fields[10]
+        return self.offsets[i]
+
+    def lumpIndex(self, name):
+        """ Index of member with given lump name, e.g. "TITLEPIC" for
+        "graphics/titlepic.png". Members in root win over ones in folders.
+
+        Return:
+        Index or -1 if there's no such member.
+        """
+        if self.short is None:
+            self.short = {}
+            for i, member in enumerate(self.lump_names):
+                if member.endswith('/'):
+                    continue
+                short = os.path.splitext(member.rpartition('/')[2])[0].upper()
+                if short not in self.short or '/' not in member:
+                    self.short[short] = i
+        return self.short.get(name.upper(), -1)
+
+    def lump(self, key):
+        i = key if isinstance(key, int) else self.index(key)
+        if i < 0:
+            return None
+        start = self.dataOffset(i)
+        data = self.view[start:start + self.data_sizes[i]]
+        if self.methods[i] == zipfile.ZIP_STORED:
+            return data
+        elif self.methods[i] == zipfile.ZIP_DEFLATED:
+            return memoryview(zlib.decompress(data, -15, self.sizes[i]))
+        # Anything else is rare enough to leave it to zipfile
+        data.release()
+        with zipfile.ZipFile(self.path) as archive:
+            return memoryview(archive.read(self.lump_names[i]))
+
+# ================================================================
+# Functions
+# ================================================================
+def zipDirectory(buffer, size):
+    """ Finds central directory of ZIP file through its end record.
+
+    Args:
+    buffer - file contents, e.g. mmap object
+    size - size of file
+
+    Return:
+    Tuple (number of entries, size, offset) of central directory, None
+    for ZIP64 archives.
+    """
+    # End record sits at the very end, followed only by comment
+    tail_start = max(0, size - ZIP_END.size - 0xFFFF)
+    tail = bytes(buffer[tail_start:size])
+    end = tail.rfind(ZIP_END_MAGIC)
+    # Comment may contain the magic too, so keep looking backwards until
+    # the record fits and its comment ends right at end of file
+    while end >= 0:
+        if end + ZIP_END.size <= len(tail):
+            fields = ZIP_END.unpack_from(tail, end)
+            if end + ZIP_END.size + fields[7] == len(tail):
+                break
+        end = tail.rfind(ZIP_END_MAGIC, 0, end)
+    if end < 0:
+        raise WadError('not a ZIP file')
+    count, dir_size, dir_offset = fields[4], fields[5], fields[6]
+    if count == 0xFFFF or dir_size == 0xFFFFFFFF or dir_offset == 0xFFFFFFFF:
+        return None
+    if dir_offset + dir_size > size:
+        raise WadError('broken ZIP end record')
+    return count, dir_size, dir_offset
+
+def iterZipDirectory(buffer, size):
+    """ Walks central directory of ZIP file.
+
+    Only end of central directory record and central directory itself
+    are read, so caller can stop early without touching the rest.
+    ZIP64 archives are handed over to zipfile module.
+
+    Args:
+    buffer - file contents, mmap object or anything else that is both
+    buffer and file-like object
+    size - size of file
+
+    Return:
+    Generator of tuples (name, method, compressed size, size, offset of
+    local header).
+    """
+    directory = zipDirectory(buffer, size)
+    if directory is None:
+        yield from iterZip64Directory(buffer)
+        return
+    count, dir_size, position = directory
+    for _ in range(count):
+        fields = ZIP_ENTRY.unpack_from(buffer, position)
+        if fields[0] != ZIP_ENTRY_MAGIC:
+            raise WadError('broken ZIP central directory')
+        flags, method, csize, usize = fields[3], fields[4], fields[8], fields[9]
+        name_length, extra_length, comment_length, header = fields[10], fields[11], fields[12], fields[16]
+        start = position + ZIP_ENTRY.size
+        if 0xFFFFFFFF in (csize, usize, header):
+            csize, usize, header = readZip64Extra(buffer, start + name_length, extra_length, csize, usize, header)
+        name = bytes(buffer[start:start + name_length])
+        # Bit 11 means UTF-8 name, otherwise it's old DOS code page
+        name = name.decode('utf-8' if flags & 0x800 else 'cp437')
+        yield name, method, csize, usize, header
+        position = start + name_length + extra_length + comment_length
+
+def readZip64Extra(buffer, position, length, csize, usize, header):
+    """ Takes real sizes and offset of member from its ZIP64 extra field.
+
+    Only values set to 0xFFFFFFFF in central directory are stored there,
+    in order size, compressed size, offset.
+    """
+    end = position + length
+    while position + 4 <= end:
+        tag, field_length = struct.unpack_from('<HH', buffer, position)
+        position += 4
+        if tag == 1:
+            values = []
+            for value in (usize, csize, header):
+                if value == 0xFFFFFFFF:
+                    value = struct.unpack_from('<Q', buffer, position)[0]
+                    position += 8
+                values.append(value)
+            return values[1], values[0], values[2]
+        position += field_length
+    raise WadError('broken ZIP64 extra field')
+
+def iterZip64Directory(buffer):
+    """ Same as iterZipDirectory, with zipfile doing the work.
+
+    """
+    buffer.seek(0)
+    with zipfile.ZipFile(buffer) as archive:
+        for info in archive.infolist():
+            yield info.filename, info.compress_type, info.compress_size, info.file_size, info.header_offset
+
+def openLumps(path):
+    """ Opens file with reader matching its format.
+
+    Return:
+    WadFile or Pk3File object.
+    """
+    if os.path.splitext(path)[1].lower() in ('.pk3', '.ipk3', '.zip'):
+        return Pk3File(path)
+    return WadFile(path)
+
+def classifyZip(buffer, size, folders):
+    """ Tells IWAD from PWAD by names in central directory alone.
+
+    Whole central directory is taken as one block and lowercased, then
+    names are looked up with plain bytes search instead of decoding every
+    entry. Hit only counts if it's start of entry name, which sits right
+    after fixed part of central directory header. Search ends with first
+    'iwadinfo' found. Lump folders are looked for only if there's none,
+    and search ends with first one found.
+
+    Args:
+    buffer - file contents, e.g. mmap object
+    size - size of file
+    folders - names of top-level lump folders, as lowercase bytes
+
+    Return:
+    'IWAD', 'PWAD' or None if archive has neither.
+    """
+    directory = zipDirectory(buffer, size)
+    if directory is None:
+        # Rare enough for slow path
+        names = [name.lower() for name, method, csize, usize, header in iterZipDirectory(buffer, size)]
+        if 'iwadinfo' in names:
+            return 'IWAD'
+        folder_names = set(folder.decode('ascii') for folder in folders)
+        if any(name.partition('/')[0] in folder_names for name in names):
+            return 'PWAD'
+        return None
+    count, dir_size, dir_offset = directory
+    block = bytes(buffer[dir_offset:dir_offset + dir_size]).lower()
+    magic = ZIP_ENTRY_MAGIC.lower()
+
+    def entries(name):
+        """ Offsets of entries whose name starts with "name", with length
+        of their names.
+        """
+        position = block.find(name, ZIP_ENTRY.size)
+        while position >= 0:
+            start = position - ZIP_ENTRY.size
+            if block[start:start + 4] == magic:
+                # Length is taken from original, lowercasing may garble it
+                length = struct.unpack_from('<H', buffer, dir_offset + start + 28)[0]
+                if start + ZIP_ENTRY.size + length > dir_size:
+                    raise WadError('broken ZIP central directory')
+                yield start, length
+            position = block.find(name, position + 1)
+
+    for start, length in entries(b'iwadinfo'):
+        if length == 8:
+            return 'IWAD'
+    for folder in folders:
+        for start, length in entries(folder):
+            end = start + ZIP_ENTRY.size + len(folder)
+            if length == len(folder) or (length > len(folder) and end < len(block) and block[end] == ord('/')):
+                return 'PWAD'
+    return None
@@ -0,0 +1,196 @@
+# ================================================================
+# Imports
+# ================================================================
+import os, json, hashlib, threading
+
+from wadtrace import span, count
+
+# ================================================================
+# Constants
+# ================================================================
+# Size of single read while hashing. Big enough to keep syscall count
+# low on multi-gigabyte PK3s, small enough to not matter for memory.
+CHUNK_SIZE = 1024 * 1024
+
+# ================================================================
+# Functions
+# ================================================================
+def fingerprint(path):
+    """ Cheap identity of file on disk.
+
+    If any of these change, file has to be considered modified.
+
+    Args:
+    path - path to file
+
+    Return:
+    List [size, mtime_ns, inode], list instead of tuple so it survives
+    trip through JSON unchanged.
+    """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+def fingerprintKey(fp):
+    """ Stand-in for hash of file that wasn't hashed yet.
+
+    Scans only classify new files, so they are filed under this key
+    until background pass replaces it with real hash.
+
+    Args:
+    fp - fingerprint of file, see fingerprint
+
+    Return:
+    String that never looks like MD5 digest.
+    """
+    return 'fp:{0}:{1}:{2}'.format(*fp)
+
+def isFingerprintKey(key):
+    return key.startswith('fp:')
+
+def hashFile(filename, chunk_size = CHUNK_SIZE):
+    """ MD5 of file, read in chunks.
+
+    File is read into one preallocated buffer, so memory use stays the
+    same no matter how big file is.
+
+    Args:
+    filename - path to file
+    chunk_size - size of single read
+
+    Return:
+    Hex digest of file contents.
+    """
+    md5 = hashlib.md5()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    total = 0
+    with span('hash.file'), open(filename, 'rb', buffering = 0) as file:
+        while True:
+            size = file.readinto(buffer)
+            if not size:
+                break
+            md5.update(view[:size])
+            total += size
+    count('hash.bytes', total)
+    return md5.hexdigest()
+
+# ================================================================
+# Classes
+# ================================================================
+class CacheFile:
+    """ Dictionary of cache entries kept in JSON file.
+
+    Cache can always be rebuilt, so broken or missing file simply means
+    empty cache. Scans, duplicate finder and GUI share caches, so entries
+    are only touched under "lock".
+    """
+
+    def __init__(self, filename = None):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+    def load(self):
+        """ Reads cache from JSON file given at creation.
+
+        """
+        try:
+            with open(self.filename, 'r') as file:
+                entries = json.load(file)
+            with self.lock:
+                self.entries = entries
+        except OSError:
+            print('Couldn\'t load cache from {0}.'.format(self.filename))
+        except json.decoder.JSONDecodeError:
+            print('{0} malformed, starting with empty cache.'.format(self.filename))
+
+    def save(self):
+        """ Writes cache back to file, only if anything changed.
+
+        """
+        if not self.dirty:
+            return
+        with self.lock:
+            data = json.dumps(self.entries)
+            self.dirty = False
+        try:
+            with open(self.filename, 'w') as file:
+                file.write(data)
+        except OSError:
+            self.dirty = True
+            print('Couldn\'t write cache to {0}.'.format(self.filename))
+
+    def stats(self):
+        return '{0}: {1} hits, {2} misses, {3} entries'.format(self.filename, self.hits, self.misses, len(self.entries))
+
+class FileCache(CacheFile):
+    """ Persistent cache of things computed from file contents.
+
+    Entries are keyed by path and remember fingerprint of file at the
+    time they were computed. When fingerprint of file on disk doesn't
+    match anymore, whole entry is thrown away.
+
+    Counters "hits" and "misses" tell how many lookups were served from
+    cache and how many had to compute value from scratch.
+    """
+
+    def lookup(self, path, field, fp = None):
+        """ Gets cached value, if it's still valid.
+
+        Args:
+        path - path to file
+        field - name of cached value, e.g. 'md5'
+        fp - fingerprint of file, taken from disk if not given
+
+        Return:
+        Cached value or None.
+        """
+        if fp is None:
+            fp = fingerprint(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry['fp'] == fp and field in entry:
+                self.hits += 1
+                return entry[field]
+            self.misses += 1
+        return None
+
+    def entry(self, path):
+        """ Copy of whole cache entry of file, valid or not.
+
+        Return:
+        Dictionary with fingerprint under 'fp', None if there's no entry.
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+            return dict(entry) if entry is not None else None
+
+    def store(self, path, field, value, fp):
+        """ Puts value into cache.
+
+        Args:
+        path - path to file
+        field - name of cached value
+        value - value itself, has to be JSON serializable
+        fp - fingerprint of file at the time value was computed
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry['fp'] != fp:
+                entry = self.entries[path] = {'fp': fp}
+            entry[field] = value
+            self.dirty = True
+
+    def hash(self, path):
+        """ MD5 of file, computed only when file changed since last time.
+
+        """
+        fp = fingerprint(path)
+        value = self.lookup(path, 'md5', fp)
+        if value is None:
+            value = hashFile(path)
+            self.store(path, 'md5', value, fp)
+        return value
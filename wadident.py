@@ -0,0 +1,130 @@
+# ================================================================
+# Imports
+# ================================================================
+import struct, zipfile
+
+from wadhash import CacheFile
+from wadfile import WadError, openLumps
+from wadtrace import span, count
+
+# ================================================================
+# Constants
+# ================================================================
+# Games program knows, by id
+GAMES = {'doom': {'name': 'DOOM', 'logo': 'images/doom.png'},
+         'doom1': {'name': 'DOOM Shareware', 'logo': 'images/doom.png'},
+         'doom2': {'name': 'DOOM II: Hell on Earth', 'logo': 'images/doom2.png'},
+         'plutonia': {'name': 'Final DOOM: The Plutonia Experiment', 'logo': 'images/doom2.png'},
+         'tnt': {'name': 'Final DOOM: TNT - Evilution', 'logo': 'images/doom2.png'},
+         'heretic': {'name': 'Heretic', 'logo': 'images/heretic.png'},
+         'hexen': {'name': 'Hexen: Beyond Heretic', 'logo': 'images/hexen.png'},
+         'strife': {'name': 'Strife: Quest for the Sigil', 'logo': 'images/strife.png'},
+         'chex': {'name': 'Chex Quest', 'logo': 'images/chexquest.png'},
+         'chex3': {'name': 'Chex Quest 3', 'logo': 'images/chexquest.png'},
+         'freedoom1': {'name': 'Freedoom: Phase 1', 'logo': None},
+         'freedoom2': {'name': 'Freedoom: Phase 2', 'logo': None},
+         'freedm': {'name': 'FreeDM', 'logo': None},
+         'hacx': {'name': 'HACX', 'logo': None}}
+
+# MD5 of released IWADs
+KNOWN_HASHES = {'1cd63c5ddff1bf8ce844237f580e9cf3': 'doom',
+                'c4fe9fd920207691a9f493668e0a2083': 'doom',
+                'f0cefca49926d00903cf57551d901abe': 'doom1',
+                '25e1459ca71d321525f84628f45ca8cd': 'doom2',
+                '75c8cf89566741fa9d22447604053bd7': 'plutonia',
+                '4e158d9953c79ccf97bd0663244cc6b6': 'tnt',
+                '66d686b1ed6d35ff103f15dbd30e0341': 'heretic',
+                'abb033caf81e26f12a2103e1fa25453f': 'hexen',
+                '2fed2031a5b03892106e0f117f17901f': 'strife',
+                '25485721882b050afa96a56e5758dd52': 'chex'}
+
+# Lumps every version of game has, checked in order, so games built on
+# top of others come before them
+SIGNATURES = (('freedm', ('MAP01', 'FREEDM')),
+              ('freedoom2', ('MAP01', 'FREEDOOM')),
+              ('freedoom1', ('E1M1', 'FREEDOOM')),
+              ('chex3', ('E1M1', 'CYCLA1', 'FLMBA1', 'MAPINFO')),
+              ('chex', ('E1M1', 'E4M1', 'W94_1', 'POSSH0M0')),
+              ('heretic', ('E1M1', 'TITLE', 'MUS_E1M1')),
+              ('hexen', ('MAP01', 'TITLE', 'WINNOWR')),
+              ('strife', ('MAP01', 'ENDSTRF')),
+              ('hacx', ('MAP01', 'HACX-R')),
+              ('plutonia', ('MAP01', 'CAMO1')),
+              ('tnt', ('MAP01', 'REDTNT2')),
+              ('doom2', ('MAP01',)),
+              ('doom', ('E1M1', 'E2M1')),
+              ('doom1', ('E1M1',)))
+
+# ================================================================
+# Functions
+# ================================================================
+def matchLumps(names):
+    """ Game whose signature lumps are all among names.
+
+    Args:
+    names - set of lump names, upper case
+
+    Return:
+    Game id, None if nothing matches.
+    """
+    for game, lumps in SIGNATURES:
+        if all(lump in names for lump in lumps):
+            return game
+    return None
+
+def lumpNames(path):
+    """ Names of all lumps in file, upper case.
+
+    Members of PK3s count by their name alone, e.g. "maps/map01.wad"
+    is MAP01.
+
+    Return:
+    Set of names, None if file can't be read.
+    """
+    try:
+        with span('ident.read'), openLumps(path) as lumps:
+            return {name.rpartition('/')[2].partition('.')[0].upper() for name in lumps.names()}
+    except (OSError, ValueError, WadError, struct.error, zipfile.BadZipFile) as error:
+        print('{0}: {1}'.format(path, error))
+        return None
+
+# ================================================================
+# Classes
+# ================================================================
+class IdentCache(CacheFile):
+    """ Games of files by hash, empty string for files of no known game.
+
+    Same hash is always same file, so entries never go stale.
+    """
+
+    def identify(self, hash, path):
+        """ Game of IWAD, looked at only once per hash.
+
+        Known releases are found by hash, anything else by lumps it has,
+        see matchLumps. Files that couldn't be read aren't remembered.
+
+        Args:
+        hash - MD5 of file
+        path - path to file
+
+        Return:
+        Game id, None for unknown files.
+        """
+        game = KNOWN_HASHES.get(hash)
+        if game is not None:
+            count('ident.known')
+            return game
+        with self.lock:
+            game = self.entries.get(hash)
+            if game is not None:
+                self.hits += 1
+                return game or None
+            self.misses += 1
+        names = lumpNames(path)
+        if names is None:
+            return None
+        game = matchLumps(names)
+        with self.lock:
+            self.entries[hash] = game or ''
+            self.dirty = True
+        return game
@@ -0,0 +1,238 @@
+# ================================================================
+# Imports
+# ================================================================
+import os, json, sqlite3
+
+# ================================================================
+# Constants
+# ================================================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wads (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    type TEXT NOT NULL,
+    format TEXT,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS wads_hash ON wads (hash);
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (tag, hash)
+);
+CREATE INDEX IF NOT EXISTS tags_hash ON tags (hash);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Categories older versions gave to every WAD, not turned into tags
+DEFAULT_CATEGORIES = ('', 'Unsorted', 'All WADs')
+
+# ================================================================
+# Classes
+# ================================================================
+class WADIndex:
+    """ SQLite database holding everything program knows about WADs.
+
+    Table "wads" has one row per file, with its hash, fingerprint,
+    type (IWAD/PWAD), format (file extension) and extracted metadata as
+    JSON. Tags live in table "tags", one row per tag and hash. Table
+    "settings" holds JSON values by key - game configs, list of tags
+    and such.
+    Every change is written right away in its own transaction, so
+    nothing is lost if program doesn't exit cleanly.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def row(hash, path, kind, fp, meta = None):
+        """ Builds row of "wads" table.
+
+        Args:
+        hash - hash of file
+        path - file path
+        kind - 'IWAD' or 'PWAD'
+        fp - fingerprint of file, see wadhash.fingerprint
+        meta - dictionary of extracted metadata
+        """
+        size, mtime, inode = fp if fp else (None, None, None)
+        format = os.path.splitext(path)[1].lower().lstrip('.')
+        return (path, hash, size, mtime, inode, kind, format, json.dumps(meta) if meta else None)
+
+    def wads(self, kind):
+        """ All files of given type.
+
+        Return:
+        List of tuples (hash, path, fingerprint, meta), where fingerprint
+        is None for files added without one.
+        """
+        result = []
+        for hash, path, size, mtime, inode, meta in self.db.execute(
+                'SELECT hash, path, size, mtime_ns, inode, meta FROM wads WHERE type = ? ORDER BY rowid', (kind,)):
+            fp = [size, mtime, inode] if size is not None else None
+            result.append((hash, path, fp, json.loads(meta) if meta else {}))
+        return result
+
+    def putWAD(self, hash, path, kind, fp, meta = None):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO wads VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self.row(hash, path, kind, fp, meta))
+
+    def putWADs(self, rows):
+        """ Writes many rows at once, see row().
+
+        """
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO wads VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def replaceWADs(self, rows):
+        """ Replaces whole table, e.g. after full rescan.
+
+        Done in one transaction, so either old or new list is there.
+        Metadata of files that didn't change is kept.
+        """
+        with self.db:
+            meta = dict(self.db.execute('SELECT path || hash, meta FROM wads WHERE meta IS NOT NULL'))
+            self.db.execute('DELETE FROM wads')
+            self.db.executemany('INSERT OR REPLACE INTO wads VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                (row if row[7] else row[:7] + (meta.get(row[0] + row[1]),) for row in rows))
+
+    def removeWAD(self, path):
+        with self.db:
+            self.db.execute('DELETE FROM wads WHERE path = ?', (path,))
+
+    def setHashMeta(self, items):
+        """ Sets metadata of every copy of files, by hash.
+
+        Args:
+        items - list of (hash, meta) tuples
+        """
+        with self.db:
+            self.db.executemany('UPDATE wads SET meta = ? WHERE hash = ?', ((json.dumps(meta), hash) for hash, meta in items))
+
+    def tagged(self):
+        """ All tags given to WADs.
+
+        Return:
+        List of (tag, hash) tuples, in order they were given.
+        """
+        return self.db.execute('SELECT tag, hash FROM tags ORDER BY rowid').fetchall()
+
+    def tagWADs(self, tag, hashes):
+        """ Gives tag to many WADs, in one transaction.
+
+        """
+        with self.db:
+            self.db.executemany('INSERT OR IGNORE INTO tags VALUES (?, ?)', ((tag, hash) for hash in hashes))
+
+    def untagWADs(self, tag, hashes):
+        with self.db:
+            self.db.executemany('DELETE FROM tags WHERE tag = ? AND hash = ?', ((tag, hash) for hash in hashes))
+
+    def removeTag(self, tag):
+        with self.db:
+            self.db.execute('DELETE FROM tags WHERE tag = ?', (tag,))
+
+    def importTags(self, pairs):
+        """ Turns categories of older versions into tags.
+
+        Default categories are left out, WADs without tags are shown as
+        uncategorized anyway. New tags are added to "tags" setting.
+
+        Args:
+        pairs - list of (category, hash) tuples
+        """
+        pairs = [(tag, hash) for tag, hash in pairs if tag not in DEFAULT_CATEGORIES]
+        if not pairs:
+            return
+        names = list(self.value('tags', []))
+        names.extend(tag for tag in dict.fromkeys(tag for tag, hash in pairs) if tag not in names)
+        with self.db:
+            self.db.executemany('INSERT OR IGNORE INTO tags VALUES (?, ?)', pairs)
+        self.setValue('tags', names)
+
+    def value(self, key, default = None):
+        """ Value from "settings" table.
+
+        """
+        for value, in self.db.execute('SELECT value FROM settings WHERE key = ?', (key,)):
+            return json.loads(value)
+        return default
+
+    def keys(self, prefix = ''):
+        """ Keys of "settings" table starting with prefix, sorted.
+
+        """
+        return [key for key, in self.db.execute('SELECT key FROM settings WHERE substr(key, 1, ?) = ? ORDER BY key', (len(prefix), prefix))]
+
+    def setValue(self, key, value):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)', (key, json.dumps(value)))
+
+    def migrate(self, wad_file, iwad_file, cats_file, config_file):
+        """ One-time import of JSON files used by older versions.
+
+        Runs only once, marked by "migrated" key in settings. Old files
+        are left alone, nothing reads them afterwards.
+
+        Args:
+        wad_file, iwad_file - WADList.dat, IWADList.dat
+        cats_file - CatsList.dat
+        config_file - lastconfig.dat
+        """
+        if self.value('migrated'):
+            return
+        rows = []
+        pairs = []
+        for filename, kind in ((iwad_file, 'IWAD'), (wad_file, 'PWAD')):
+            if not os.path.exists(filename):
+                continue
+            try:
+                with open(filename, 'r') as file:
+                    for item in json.load(file):
+                        rows.append(self.row(item[0], item[1], kind, item[3] if len(item) > 3 else None))
+                        if kind == 'PWAD' and item[2]:
+                            pairs.append((item[2], item[0]))
+            except (OSError, ValueError, IndexError):
+                print('Couldn\'t migrate WAD list from file {0}.'.format(filename))
+        for filename, key in ((cats_file, 'cats'), (config_file, 'config:lastconfig')):
+            if not os.path.exists(filename):
+                continue
+            try:
+                with open(filename, 'r') as file:
+                    self.setValue(key, json.load(file))
+            except (OSError, ValueError):
+                print('Couldn\'t migrate {0}.'.format(filename))
+        self.putWADs(rows)
+        self.importTags(pairs)
+        self.setValue('migrated', True)
+
+    def migrateCategories(self):
+        """ One-time move of categories kept by file name to tags.
+
+        Oldest versions kept them in "cats" setting, see importTags.
+        Marked done by "migrated:tags" key in settings.
+        """
+        if self.value('migrated:tags'):
+            return
+        pairs = []
+        by_name = {}
+        for path, hash in self.db.execute("SELECT path, hash FROM wads WHERE type = 'PWAD'"):
+            by_name.setdefault(os.path.basename(path), []).append(hash)
+        cats = self.value('cats', {})
+        if isinstance(cats, dict):
+            pairs.extend((tag, hash) for name, tag in cats.items() for hash in by_name.get(name, ()))
+        self.importTags(pairs)
+        self.setValue('migrated:tags', True)
@@ -0,0 +1,142 @@
+# ================================================================
+# Launching game without GUI
+#
+# Usage:
+#   python wadlaunch.py                     last game config
+#   python wadlaunch.py -p NAME             saved profile
+#   python wadlaunch.py --list              names of saved profiles
+#   python wadlaunch.py -- -warp 1 -skill 4 extra arguments for port
+#
+# Never imports Qt, so it's up in tens of milliseconds. Same command
+# line as "Launch game" button is used, see buildCommand.
+# ================================================================
+
+# ================================================================
+# Imports
+# ================================================================
+import sys, os, argparse, configparser, subprocess
+
+from wadindex import WADIndex
+
+# ================================================================
+# Constants
+# ================================================================
+PREFS_FILE = 'prefs.ini'
+INDEX_FILE = 'FrontDoom.db'
+
+# ================================================================
+# Functions
+# ================================================================
+def loadPrefs(filename = PREFS_FILE):
+    """ Reads preferences file, over default settings.
+
+    Return:
+    ConfigParser object.
+    """
+    result = configparser.ConfigParser()
+    result['General'] = {'gz_path': '', 'executable': '', 'verify_checksums': 'no', 'on_launch': 'hide'}
+    result['WADPaths'] = {'path': ''}
+    result['Scan'] = {'workers': str(min(8, os.cpu_count() or 1)), 'pool': 'thread', 'watch': 'no'}
+    result['Diagnostics'] = {'trace': ''}
+    if not result.read(filename):
+        print('Couldn\'t read preferences file, using default settings.')
+    return result
+
+def portPath(prefs):
+    """ Path to source port executable set in preferences.
+
+    """
+    return os.path.join(prefs['General']['gz_path'], prefs['General']['executable'])
+
+def buildCommand(prefs, config, extra = ()):
+    """ Command line starting source port with given game config.
+
+    Args:
+    prefs - preferences, see loadPrefs
+    config - game config, dictionary with '-iwad' and '-file' keys and
+    optional '+map' with name of map to start on
+    extra - further arguments for port
+
+    Return:
+    List of arguments, first one being port executable.
+    """
+    command = [portPath(prefs)]
+    if config.get('-iwad'):
+        command += ['-iwad', config['-iwad']]
+    # Port takes any number of files after single -file
+    files = list(config.get('-file', ()))
+    if files:
+        command.append('-file')
+        command.extend(files)
+    if config.get('+map'):
+        command += ['+map', config['+map']]
+    command.extend(extra)
+    return command
+
+def checkConfig(prefs, config):
+    """ Problems that would stop game from starting.
+
+    Return:
+    List of error messages, empty if everything's fine.
+    """
+    errors = []
+    port = portPath(prefs)
+    if not prefs['General']['executable']:
+        errors.append('No source port set in preferences.')
+    elif not (os.path.isfile(port) and os.access(port, os.X_OK)):
+        errors.append('Source port {0} not found or not executable.'.format(port))
+    if config.get('-iwad') and not os.path.isfile(config['-iwad']):
+        errors.append('IWAD {0} not found.'.format(config['-iwad']))
+    for item in config.get('-file', ()):
+        if not os.path.isfile(item):
+            errors.append('PWAD {0} not found.'.format(item))
+    return errors
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Launch game with saved config, without GUI.')
+    parser.add_argument('-p', '--profile', default = 'lastconfig', help = 'name of saved config, last one used by default')
+    parser.add_argument('-d', '--data', default = '.', help = 'folder with prefs.ini and FrontDoom.db')
+    parser.add_argument('--list', action = 'store_true', help = 'list saved configs and exit')
+    parser.add_argument('--skip-missing', action = 'store_true', help = 'leave out PWADs that don\'t exist instead of failing')
+    parser.add_argument('-n', '--dry-run', action = 'store_true', help = 'print command line instead of running it')
+    parser.add_argument('extra', nargs = argparse.REMAINDER, help = 'arguments for source port, after --')
+    args = parser.parse_args(argv)
+
+    os.chdir(args.data)
+    # Same as GUI does, configs of older versions are imported on first run
+    index = WADIndex(INDEX_FILE)
+    try:
+        index.migrate('WADList.dat', 'IWADList.dat', 'CatsList.dat', 'lastconfig.dat')
+        if args.list:
+            for key in index.keys('config:'):
+                print(key[len('config:'):])
+            return 0
+        config = index.value('config:' + args.profile)
+    finally:
+        index.close()
+    if config is None:
+        print('No saved config named {0} in {1}.'.format(args.profile, os.getcwd()))
+        return 2
+    prefs = loadPrefs()
+    if args.skip_missing:
+        config = dict(config, **{'-file': [item for item in config.get('-file', ()) if os.path.isfile(item)]})
+    errors = checkConfig(prefs, config)
+    extra = args.extra[1:] if args.extra[:1] == ['--'] else args.extra
+    command = buildCommand(prefs, config, extra)
+    if args.dry_run:
+        for error in errors:
+            print(error)
+        print(subprocess.list2cmdline(command))
+        return 0
+    if errors:
+        for error in errors:
+            print(error)
+        return 2
+    sys.stdout.flush()
+    if os.name == 'posix':
+        # Port takes over this process, shortcuts see its exit code
+        os.execv(command[0], command)
+    return subprocess.call(command)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# ================================================================
+# Imports
+# ================================================================
+import re, struct, zipfile
+
+from wadfile import WadError, openLumps
+from wadscan import POOLS, BATCH_SIZE
+from wadconflict import wadLumps, pk3Lumps
+from wadtrace import span, count
+
+# ================================================================
+# Constants
+# ================================================================
+# Map definition lumps, later ones override titles from earlier ones,
+# same as port gives ZMAPINFO precedence over MAPINFO
+INFO_LUMPS = ('UMAPINFO', 'MAPINFO', 'ZMAPINFO')
+COMMENTS = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+# map MAP01 "Title", map MAP01 lookup "KEY", Hexen's map 1 "Title" or
+# map 1 Title without quotes, running till end of line
+MAPINFO_MAP = re.compile(r'^[ \t]*map[ \t]+"?([^\s"{]+)"?[ \t]+(lookup[ \t]+)?(?:"((?:[^"\\]|\\.)*)"|([^\s"{][^\n{]*))', re.I | re.M)
+# MAP MAP01 { levelname = "Title" ... }
+UMAPINFO_MAP = re.compile(r'^[ \t]*map[ \t]+(\w+)\s*\{(.*?)\}', re.I | re.M | re.S)
+UMAPINFO_NAME = re.compile(r'levelname\s*=\s*"((?:[^"\\]|\\.)*)"', re.I)
+# KEY = "Text";
+LANGUAGE_STRING = re.compile(r'^[ \t]*(\w+)\s*=\s*"((?:[^"\\]|\\.)*)"', re.M)
+
+# ================================================================
+# Functions
+# ================================================================
+def lumpText(lumps, name):
+    """ Text lump as string, PK3 members found by lump name.
+
+    Return:
+    String without comments, None if there's no such lump.
+    """
+    i = lumps.lumpIndex(name) if hasattr(lumps, 'lumpIndex') else lumps.index(name)
+    if i < 0:
+        return None
+    data = lumps.lump(i)
+    text = bytes(data).decode('utf-8', 'replace')
+    data.release()
+    return COMMENTS.sub('', text)
+
+def parseMapinfo(text, strings):
+    """ Titles of maps from MAPINFO or ZMAPINFO.
+
+    Args:
+    text - contents of lump
+    strings - dictionary of LANGUAGE strings, for titles given by lookup
+
+    Return:
+    Dictionary of titles by map name.
+    """
+    titles = {}
+    for name, lookup, quoted, bare in MAPINFO_MAP.findall(text):
+        name = name.upper()
+        # Hexen numbers its maps
+        if name.isdigit():
+            name = 'MAP{0:02d}'.format(int(name))
+        title = quoted or bare.strip()
+        if lookup or title.startswith('$'):
+            title = strings.get(title.lstrip('$').upper(), '')
+        titles[name] = title.replace('\\"', '"')
+    return titles
+
+def parseUmapinfo(text, strings):
+    """ Titles of maps from UMAPINFO, see parseMapinfo.
+
+    """
+    titles = {}
+    for name, body in UMAPINFO_MAP.findall(text):
+        found = UMAPINFO_NAME.search(body)
+        if found:
+            titles[name.upper()] = found.group(1).replace('\\"', '"')
+    return titles
+
+def parseLanguage(text):
+    """ Strings of LANGUAGE lump, by key in upper case.
+
+    """
+    return {key.upper(): value for key, value in LANGUAGE_STRING.findall(text)}
+
+def readMaps(path):
+    """ Maps of WAD or PK3, with their titles.
+
+    Maps are those file actually has, as map markers in WADs and WADs in
+    maps folder of PK3s. Titles come from MAPINFO, ZMAPINFO or UMAPINFO
+    of the same file.
+
+    Return:
+    List of [name, title] lists in order maps appear in file, title
+    empty if not known. None if file can't be read.
+    """
+    try:
+        with openLumps(path) as lumps:
+            if path.lower().endswith('.wad'):
+                names = wadLumps(lumps)[1]
+            else:
+                names = pk3Lumps(lumps)[1]
+            if not names:
+                return []
+            language = lumpText(lumps, 'LANGUAGE')
+            strings = parseLanguage(language) if language else {}
+            titles = {}
+            for lump in INFO_LUMPS:
+                text = lumpText(lumps, lump)
+                if text:
+                    titles.update((parseUmapinfo if lump == 'UMAPINFO' else parseMapinfo)(text, strings))
+    except (OSError, ValueError, WadError, struct.error, zipfile.BadZipFile) as error:
+        print('{0}: {1}'.format(path, error))
+        return None
+    return [[name, titles.get(name, '')] for name in names]
+
+def readAllMaps(paths, workers = 1, pool = 'process', cancel = None):
+    """ Maps of many files, read in pool of workers.
+
+    Process pool is default, since parsing is pure Python and would
+    hold GIL in threads. Works in batches like wadscan.examineFiles.
+
+    Args:
+    paths - list of file paths
+    workers - number of workers, 1 means no pool at all
+    pool - 'thread' or 'process', see wadscan.POOLS
+    cancel - threading.Event, reading stops once it's set
+
+    Return:
+    Generator of lists of (path, maps) tuples, see readMaps.
+    """
+    executor = POOLS[pool](max_workers = workers) if workers > 1 and len(paths) > 1 else None
+    try:
+        for start in range(0, len(paths), BATCH_SIZE):
+            if cancel is not None and cancel.is_set():
+                return
+            batch = paths[start:start + BATCH_SIZE]
+            with span('maps.batch', files = len(batch)):
+                results = list((executor.map if executor is not None else map)(readMaps, batch))
+            count('maps.files', len(batch))
+            yield list(zip(batch, results))
+    finally:
+        if executor is not None:
+            executor.shutdown()
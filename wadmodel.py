@@ -0,0 +1,625 @@
+# ================================================================
+# Imports
+# ================================================================
+import os, re, time
+from PyQt5 import QtCore, QtGui
+
+from wadtrace import span
+
+# ================================================================
+# Constants
+# ================================================================
+# Rows handed to view at once, see WADTreeModel.fetchMore
+FETCH_SIZE = 1000
+COLUMNS = ('Name', 'Size', 'Date', 'Type')
+DIGITS = re.compile(r'([0-9]+)')
+
+# ================================================================
+# Functions
+# ================================================================
+def naturalKey(node):
+    """ Case-folded name with numbers compared by value, "map2" < "map10".
+
+    Key is a single string, so comparing two of them is one memcmp,
+    not a walk over tuple of mixed parts. Every number becomes "\\0",
+    its length and its digits without leading zeroes, so shorter numbers
+    go first and numbers go before letters. Computed once per node and
+    kept in it, names don't change.
+    """
+    if node.key is None:
+        node.key = DIGITS.sub(numberKey, node.name.casefold())
+    return node.key
+
+def numberKey(match):
+    digits = match.group().lstrip('0')
+    return '\0' + chr(len(digits) + 1) + digits
+
+def sizeKey(node):
+    return node.wad.fp[0] if node.wad.fp else -1
+
+def dateKey(node):
+    return node.wad.fp[1] if node.wad.fp else -1
+
+def typeKey(node):
+    return node.name.rpartition('.')[2].lower()
+
+SORT_KEYS = (naturalKey, sizeKey, dateKey, typeKey)
+
+def sortNodes(nodes, column, order):
+    """ Sorts list of nodes in place, folders always go first.
+
+    Keys are computed once per node, comparisons are all done by list.sort
+    itself, without calling back into Python. Columns other than name are
+    sorted by name first, sort is stable so equal values stay that way.
+
+    Args:
+    nodes - list of Node objects
+    column - index into COLUMNS
+    order - Qt.AscendingOrder or Qt.DescendingOrder
+    """
+    reverse = order == QtCore.Qt.DescendingOrder
+    folders = [node for node in nodes if node.wad is None]
+    if folders:
+        files = [node for node in nodes if node.wad is not None]
+        folders.sort(key = naturalKey, reverse = reverse)
+    else:
+        files = nodes
+    files.sort(key = naturalKey, reverse = reverse)
+    if column:
+        files.sort(key = SORT_KEYS[column], reverse = reverse)
+    if folders:
+        nodes[:] = folders + files
+
+def sizeText(size):
+    """ Size in bytes as short text, e.g. '12 MB'.
+
+    """
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return '{0:.0f} {1}'.format(size, unit)
+        size /= 1024
+    return '{0:.1f} GB'.format(size)
+
+def columnText(node, column):
+    """ Text of node in given column.
+
+    """
+    if column == 0:
+        return node.name
+    wad = node.wad
+    if wad is None:
+        return None
+    if column == 3:
+        return os.path.splitext(node.name)[1].lstrip('.').upper()
+    if not wad.fp:
+        return None
+    if column == 1:
+        return sizeText(wad.fp[0])
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(wad.fp[1] / 1e9))
+
+# ================================================================
+# Classes
+# ================================================================
+class Node:
+    """ Single row of WADTreeModel, either WAD or folder.
+
+    Kept as small as possible, libraries can have hundreds of thousands
+    of these. Folders have no wad and no hash.
+    """
+    __slots__ = ('parent', 'row', 'children', 'fetched', 'name', 'wad', 'hash', 'checkable', 'checked', 'tooltip', 'color', 'key')
+
+    def __init__(self, name, wad = None, hash = None, checkable = False):
+        self.parent = None
+        self.row = 0
+        self.children = []
+        # Number of children view knows about, rest waits for fetchMore
+        self.fetched = 0
+        self.name = name
+        self.wad = wad
+        self.hash = hash
+        self.checkable = checkable
+        self.checked = False
+        self.tooltip = None
+        self.color = None
+        # Sort key, see naturalKey
+        self.key = None
+
+    def text(self):
+        return self.name
+
+class WADTreeModel(QtCore.QAbstractItemModel):
+    """ Tree of WADs and folders they live in.
+
+    Nodes are plain Python objects, model only tells Qt about them.
+    Columns other than name are only filled for WADs, see COLUMNS.
+    Children are given to view in chunks of FETCH_SIZE, when view asks
+    for them (canFetchMore/fetchMore), and nodes are always inserted in
+    bulk, with one beginInsertRows/endInsertRows per chunk.
+    "itemChecked" is emitted with node whose check mark was toggled by
+    user.
+    """
+    itemChecked = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent = None, lazy = True):
+        """
+        Args:
+        lazy - if False, all rows are shown right away, e.g. for models
+        used by combo boxes, which never fetch more
+        """
+        super().__init__(parent)
+        self.root = Node('')
+        self.lazy = lazy
+
+    def nodeFromIndex(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self.root
+
+    def indexFromNode(self, node, column = 0):
+        if node is self.root or node is None:
+            return QtCore.QModelIndex()
+        return self.createIndex(node.row, column, node)
+
+    def node(self, row, parent = None):
+        """ Child node of parent, root by default.
+
+        """
+        return (parent or self.root).children[row]
+
+    # Qt interface
+    def index(self, row, column, parent = QtCore.QModelIndex()):
+        node = self.nodeFromIndex(parent)
+        if 0 <= row < node.fetched and 0 <= column < len(COLUMNS):
+            return self.createIndex(row, column, node.children[row])
+        return QtCore.QModelIndex()
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self.indexFromNode(index.internalPointer().parent)
+
+    def rowCount(self, parent = QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self.nodeFromIndex(parent).fetched
+
+    def columnCount(self, parent = QtCore.QModelIndex()):
+        return len(COLUMNS)
+
+    def hasChildren(self, parent = QtCore.QModelIndex()):
+        return parent.column() <= 0 and bool(self.nodeFromIndex(parent).children)
+
+    def canFetchMore(self, parent):
+        node = self.nodeFromIndex(parent)
+        return node.fetched < len(node.children)
+
+    def fetchMore(self, parent):
+        node = self.nodeFromIndex(parent)
+        first = node.fetched
+        last = min(len(node.children), first + FETCH_SIZE) - 1
+        if last < first:
+            return
+        self.beginInsertRows(parent, first, last)
+        node.fetched = last + 1
+        self.endInsertRows()
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+        if index.column() == 0 and self.nodeFromIndex(index).checkable:
+            flags |= QtCore.Qt.ItemIsUserCheckable
+        return flags
+
+    def data(self, index, role = QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = self.nodeFromIndex(index)
+        if role == QtCore.Qt.DisplayRole:
+            return columnText(node, index.column())
+        elif role == QtCore.Qt.CheckStateRole and node.checkable and index.column() == 0:
+            return QtCore.Qt.Checked if node.checked else QtCore.Qt.Unchecked
+        elif role == QtCore.Qt.ToolTipRole:
+            return node.tooltip
+        elif role == QtCore.Qt.ForegroundRole and node.color is not None:
+            return QtGui.QBrush(node.color)
+        elif role == QtCore.Qt.UserRole:
+            return node
+        return None
+
+    def headerData(self, section, orientation, role = QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole and 0 <= section < len(COLUMNS):
+            return COLUMNS[section]
+        return None
+
+    def sort(self, column, order = QtCore.Qt.AscendingOrder):
+        """ Sorts children of every node, with single layout change.
+
+        """
+        if not 0 <= column < len(COLUMNS):
+            return
+        with span('model.sort', column = column):
+            self.layoutAboutToBeChanged.emit()
+            stack = [self.root]
+            while stack:
+                parent = stack.pop()
+                sortNodes(parent.children, column, order)
+                for row, node in enumerate(parent.children):
+                    node.row = row
+                stack.extend(node for node in parent.children if node.children)
+            self.movePersistentIndexes(lambda node: node.row if node.row < node.parent.fetched else -1)
+            self.layoutChanged.emit()
+
+    def movePersistentIndexes(self, rowOf):
+        """ Points indexes Qt keeps around to new rows of their nodes.
+
+        Args:
+        rowOf - function giving new row of node, -1 if it's not shown
+        """
+        old = self.persistentIndexList()
+        new = []
+        for index in old:
+            node = index.internalPointer()
+            row = rowOf(node)
+            new.append(self.createIndex(row, index.column(), node) if row >= 0 else QtCore.QModelIndex())
+        self.changePersistentIndexList(old, new)
+
+    def setData(self, index, value, role = QtCore.Qt.EditRole):
+        if not index.isValid() or role != QtCore.Qt.CheckStateRole:
+            return False
+        node = self.nodeFromIndex(index)
+        if index.column() != 0:
+            return False
+        checked = value == QtCore.Qt.Checked
+        if node.checked == checked:
+            return True
+        node.checked = checked
+        self.dataChanged.emit(index, index, [role])
+        self.itemChecked.emit(node)
+        return True
+
+    # Changing contents
+    def appendNodes(self, parent, nodes):
+        """ Appends nodes to parent in one go.
+
+        View is told about them right away only if parent has less than
+        FETCH_SIZE rows shown, otherwise they wait for fetchMore.
+
+        Args:
+        parent - Node to append to, None for root
+        nodes - list of Node objects
+        """
+        parent = parent or self.root
+        start = len(parent.children)
+        for row, node in enumerate(nodes, start):
+            node.parent = parent
+            node.row = row
+        parent.children.extend(nodes)
+        if not self.lazy:
+            self.fetchAll(parent)
+        elif parent.fetched < FETCH_SIZE and parent.fetched == start:
+            self.fetchMore(self.indexFromNode(parent))
+
+    def fetchAll(self, parent):
+        first = parent.fetched
+        last = len(parent.children) - 1
+        if last < first:
+            return
+        self.beginInsertRows(self.indexFromNode(parent), first, last)
+        parent.fetched = last + 1
+        self.endInsertRows()
+
+    def removeNode(self, node):
+        """ Takes node out of tree.
+
+        """
+        parent = node.parent
+        row = node.row
+        shown = row < parent.fetched
+        if shown:
+            self.beginRemoveRows(self.indexFromNode(parent), row, row)
+        del parent.children[row]
+        for sibling in parent.children[row:]:
+            sibling.row -= 1
+        if shown:
+            parent.fetched -= 1
+            self.endRemoveRows()
+        node.parent = None
+
+    def nodeChanged(self, node):
+        """ Tells view node has to be drawn again.
+
+        """
+        if node.parent is not None and node.row < node.parent.fetched:
+            self.dataChanged.emit(self.indexFromNode(node), self.indexFromNode(node, len(COLUMNS) - 1))
+
+    def setChecked(self, node, checked):
+        """ Sets check mark without emitting itemChecked.
+
+        """
+        if node.checked != checked:
+            node.checked = checked
+            self.nodeChanged(node)
+
+    def walk(self, parent = None):
+        """ All nodes below parent, depth first.
+
+        """
+        stack = list(reversed((parent or self.root).children))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def clear(self):
+        self.beginResetModel()
+        self.root = Node('')
+        self.endResetModel()
+
+class WADResultModel(WADTreeModel):
+    """ Flat list of nodes picked out of WADTreeModel, e.g. search results.
+
+    Nodes are shared with tree they came from, so check marks and colors
+    set through either model show in both. Nodes keep their place in
+    tree, rows here are only positions in the list. Rows are given to
+    view in chunks of FETCH_SIZE, same as in tree.
+    """
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.nodes = []
+        self.fetched = 0
+
+    def setNodes(self, nodes):
+        """ Replaces whole list.
+
+        Args:
+        nodes - list of Node objects
+        """
+        self.beginResetModel()
+        self.nodes = nodes
+        self.fetched = min(len(nodes), FETCH_SIZE)
+        self.endResetModel()
+
+    def node(self, row, parent = None):
+        return self.nodes[row]
+
+    # Qt interface
+    def index(self, row, column, parent = QtCore.QModelIndex()):
+        if not parent.isValid() and 0 <= row < self.fetched and 0 <= column < len(COLUMNS):
+            return self.createIndex(row, column, self.nodes[row])
+        return QtCore.QModelIndex()
+
+    def parent(self, index):
+        return QtCore.QModelIndex()
+
+    def rowCount(self, parent = QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.fetched
+
+    def hasChildren(self, parent = QtCore.QModelIndex()):
+        return not parent.isValid() and bool(self.nodes)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.fetched < len(self.nodes)
+
+    def fetchMore(self, parent):
+        first = self.fetched
+        last = min(len(self.nodes), first + FETCH_SIZE) - 1
+        if parent.isValid() or last < first:
+            return
+        self.beginInsertRows(parent, first, last)
+        self.fetched = last + 1
+        self.endInsertRows()
+
+    def nodeChanged(self, node):
+        try:
+            row = self.nodes.index(node, 0, self.fetched)
+        except ValueError:
+            return
+        self.dataChanged.emit(self.createIndex(row, 0, node), self.createIndex(row, len(COLUMNS) - 1, node))
+
+    def sort(self, column, order = QtCore.Qt.AscendingOrder):
+        if not 0 <= column < len(COLUMNS):
+            return
+        with span('model.sort', column = column):
+            self.layoutAboutToBeChanged.emit()
+            sortNodes(self.nodes, column, order)
+            rows = {id(node): row for row, node in enumerate(self.nodes[:self.fetched])}
+            self.movePersistentIndexes(lambda node: rows.get(id(node), -1))
+            self.layoutChanged.emit()
+
+    def clear(self):
+        self.setNodes([])
+
+class WADCategoryModel(WADTreeModel):
+    """ Categories with WADs in them, two levels deep.
+
+    Top rows are category nodes owned by this model, rows below them
+    are nodes of library tree itself, not copies, so check marks and
+    colors are shared the same way as with WADResultModel. WAD can be
+    in many categories at once. Shared nodes keep their parent and row
+    in library tree, so indexes here point to list a row is in (root or
+    category) instead of node of the row.
+    Rows are inserted and removed in bulk, one insert per category.
+    """
+
+    def __init__(self, parent = None, groupsOf = None):
+        """
+        Args:
+        groupsOf - function giving names of categories node is in, so
+        changed nodes can be found without looking through all of them
+        """
+        super().__init__(parent)
+        self.groupsOf = groupsOf or (lambda node: ())
+        # Category nodes by name
+        self.groups = {}
+
+    def nodeFromIndex(self, index):
+        if index.isValid():
+            return index.internalPointer().children[index.row()]
+        return self.root
+
+    def indexFromNode(self, node, column = 0):
+        if node is self.root or node is None:
+            return QtCore.QModelIndex()
+        return self.createIndex(node.row, column, self.root)
+
+    def group(self, name):
+        """ Category node, None if there's no such category.
+
+        """
+        return self.groups.get(name)
+
+    def names(self):
+        return [group.name for group in self.root.children]
+
+    # Qt interface
+    def index(self, row, column, parent = QtCore.QModelIndex()):
+        container = self.nodeFromIndex(parent)
+        if 0 <= row < container.fetched and 0 <= column < len(COLUMNS):
+            return self.createIndex(row, column, container)
+        return QtCore.QModelIndex()
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self.indexFromNode(index.internalPointer())
+
+    def hasChildren(self, parent = QtCore.QModelIndex()):
+        if not parent.isValid():
+            return bool(self.root.children)
+        # Categories show expand arrow even when empty, WADs never do
+        return parent.column() <= 0 and parent.internalPointer() is self.root
+
+    def sort(self, column, order = QtCore.Qt.AscendingOrder):
+        """ Sorts categories by name and WADs in each of them by column.
+
+        """
+        if not 0 <= column < len(COLUMNS):
+            return
+        with span('model.sort', column = column):
+            self.layoutAboutToBeChanged.emit()
+            old = self.persistentIndexList()
+            nodes = [index.internalPointer().children[index.row()] for index in old]
+            sortNodes(self.root.children, 0, order)
+            for row, group in enumerate(self.root.children):
+                group.row = row
+                sortNodes(group.children, column, order)
+            rows = {}
+            new = []
+            for index, node in zip(old, nodes):
+                container = index.internalPointer()
+                if id(container) not in rows:
+                    rows[id(container)] = {id(node): row for row, node in enumerate(container.children[:container.fetched])}
+                row = rows[id(container)].get(id(node), -1)
+                new.append(self.createIndex(row, index.column(), container) if row >= 0 else QtCore.QModelIndex())
+            self.changePersistentIndexList(old, new)
+            self.layoutChanged.emit()
+
+    # Changing contents
+    def setGroups(self, groups):
+        """ Replaces all categories, with single model reset.
+
+        Args:
+        groups - list of (name, list of Node objects) tuples
+        """
+        self.beginResetModel()
+        self.root = Node('')
+        self.groups = {}
+        for row, (name, nodes) in enumerate(groups):
+            group = self.makeGroup(name, row)
+            group.children = list(nodes)
+            group.fetched = min(len(nodes), FETCH_SIZE)
+        self.root.fetched = len(self.root.children)
+        self.endResetModel()
+
+    def makeGroup(self, name, row):
+        group = Node(name)
+        group.row = row
+        group.parent = self.root
+        self.root.children.append(group)
+        self.groups[name] = group
+        return group
+
+    def addGroup(self, name):
+        """ Adds empty category, unless it's already there.
+
+        Return:
+        Category node.
+        """
+        group = self.groups.get(name)
+        if group is None:
+            row = len(self.root.children)
+            self.beginInsertRows(QtCore.QModelIndex(), row, row)
+            group = self.makeGroup(name, row)
+            self.root.fetched = row + 1
+            self.endInsertRows()
+        return group
+
+    def removeGroup(self, name):
+        """ Takes category out, WADs in it aren't touched.
+
+        Return:
+        List of nodes category had.
+        """
+        group = self.groups.pop(name, None)
+        if group is None:
+            return []
+        row = group.row
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self.root.children[row]
+        for sibling in self.root.children[row:]:
+            sibling.row -= 1
+        self.root.fetched -= 1
+        self.endRemoveRows()
+        return group.children
+
+    def addNodes(self, name, nodes):
+        """ Appends nodes to category, created if needed, in one go.
+
+        View learns about them the same way as with appendNodes.
+        """
+        if not nodes:
+            return
+        group = self.addGroup(name)
+        start = len(group.children)
+        group.children.extend(nodes)
+        if group.fetched < FETCH_SIZE and group.fetched == start:
+            self.fetchMore(self.indexFromNode(group))
+
+    def removeNodes(self, name, nodes):
+        """ Takes nodes out of category, one remove per run of adjacent rows.
+
+        """
+        group = self.groups.get(name)
+        if group is None or not nodes:
+            return
+        gone = set(map(id, nodes))
+        rows = [row for row, node in enumerate(group.children) if id(node) in gone]
+        parent = self.indexFromNode(group)
+        while rows:
+            last = rows.pop()
+            first = last
+            while rows and rows[-1] == first - 1:
+                first = rows.pop()
+            shown = first < group.fetched
+            if shown:
+                self.beginRemoveRows(parent, first, min(last, group.fetched - 1))
+            del group.children[first:last + 1]
+            if shown:
+                group.fetched -= min(last, group.fetched - 1) - first + 1
+                self.endRemoveRows()
+
+    def nodeChanged(self, node):
+        for name in self.groupsOf(node):
+            group = self.groups.get(name)
+            if group is None:
+                continue
+            try:
+                row = group.children.index(node, 0, group.fetched)
+            except ValueError:
+                continue
+            self.dataChanged.emit(self.createIndex(row, 0, group), self.createIndex(row, len(COLUMNS) - 1, group))
+
+    def clear(self):
+        self.setGroups([])
@@ -0,0 +1,80 @@
+# ================================================================
+# Imports
+# ================================================================
+from collections import OrderedDict
+
+# ================================================================
+# Classes
+# ================================================================
+class LoadOrder:
+    """ PWADs of game config, in order they are loaded.
+
+    Paths are keys of ordered dictionary, so checking, adding and
+    removing single file takes the same time no matter how many files
+    there are. Order is kept by insertion and can be changed as a whole
+    with setPaths, e.g. after files were dragged around.
+    Stored in game config as plain list of paths, see paths().
+    """
+
+    def __init__(self, paths = ()):
+        self.order = OrderedDict.fromkeys(paths)
+
+    def __contains__(self, path):
+        return path in self.order
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __repr__(self):
+        return 'LoadOrder({0!r})'.format(self.paths())
+
+    def add(self, path):
+        """ Puts file at end of load order, unless it's already there.
+
+        """
+        self.order.setdefault(path)
+
+    def discard(self, path):
+        """ Takes file out of load order, if it's there.
+
+        Return:
+        True if file was there.
+        """
+        if path in self.order:
+            del self.order[path]
+            return True
+        return False
+
+    def toggle(self, path, loaded):
+        """ Adds or removes file depending on "loaded".
+
+        """
+        if loaded:
+            self.add(path)
+        else:
+            self.discard(path)
+
+    def replace(self, old, new):
+        """ Puts another file in place of one already there.
+
+        If new file is already loaded, old one is just taken out.
+        """
+        if old not in self.order or new in self.order:
+            self.discard(old)
+            return
+        self.order = OrderedDict((new if path == old else path, None) for path in self.order)
+
+    def setPaths(self, paths):
+        """ Replaces whole load order.
+
+        """
+        self.order = OrderedDict.fromkeys(paths)
+
+    def paths(self):
+        """ List of paths in load order, what goes into saved config.
+
+        """
+        return list(self.order)
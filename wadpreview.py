@@ -0,0 +1,288 @@
+# ================================================================
+# Imports
+# ================================================================
+import os, struct, zipfile, threading
+from collections import OrderedDict
+
+from wadfile import WadError, openLumps
+from wadtrace import span, count
+
+# ================================================================
+# Constants
+# ================================================================
+# Lumps tried for preview, in order
+PICTURES = ('TITLEPIC', 'TITLE', 'INTERPIC', 'M_DOOM')
+# Doom picture header: width, height, left offset, top offset
+PATCH_HEADER = struct.Struct('<HHhh')
+# Full-screen raw pictures of Heretic and Hexen
+RAW_SIZE = (320, 200)
+# Magic numbers of formats Qt reads by itself
+IMAGE_MAGIC = (b'\x89PNG', b'\xff\xd8\xff')
+# Used when neither file nor IWAD has PLAYPAL
+GRAY_PALETTE = bytes(value for value in range(256) for channel in range(3))
+# Bytes of thumbnails kept on disk
+THUMB_CACHE_SIZE = 32 * 1024 * 1024
+
+# ================================================================
+# Functions
+# ================================================================
+def findLump(lumps, name):
+    """ Index of lump, PK3 members found by lump name too.
+
+    """
+    if hasattr(lumps, 'lumpIndex'):
+        return lumps.lumpIndex(name)
+    return lumps.index(name)
+
+def readPalette(lumps):
+    """ First palette of PLAYPAL, as 768 bytes of RGB.
+
+    Args:
+    lumps - wadfile.WadFile or Pk3File object
+
+    Return:
+    bytes object, None if file has no PLAYPAL.
+    """
+    i = findLump(lumps, 'PLAYPAL')
+    if i < 0 or lumps.lumpSize(i) < 768:
+        return None
+    data = lumps.lump(i)
+    palette = bytes(data[:768])
+    data.release()
+    return palette
+
+def findPicture(lumps):
+    """ Contents of first of PICTURES found in file.
+
+    Return:
+    bytes object, None if there's none.
+    """
+    for name in PICTURES:
+        i = findLump(lumps, name)
+        if i >= 0 and lumps.lumpSize(i):
+            data = lumps.lump(i)
+            result = bytes(data)
+            data.release()
+            return result
+    return None
+
+def patchPosts(data):
+    """ Posts of Doom picture, as stored column by column.
+
+    Tall pictures, where post starting above previous one means offset
+    relative to it, are handled.
+
+    Return:
+    Tuple (width, height, posts), posts being list of (x, y, length,
+    offset of first pixel) tuples.
+    """
+    size = len(data)
+    width, height, left, top = PATCH_HEADER.unpack_from(data, 0)
+    if not (0 < width <= 4096 and 0 < height <= 4096) or size < PATCH_HEADER.size + 4 * width:
+        raise WadError('not a Doom picture')
+    posts = []
+    for x, offset in enumerate(struct.unpack_from('<{0}I'.format(width), data, PATCH_HEADER.size)):
+        y = -1
+        while True:
+            if offset >= size:
+                raise WadError('broken Doom picture')
+            delta = data[offset]
+            if delta == 0xFF:
+                break
+            y = delta if delta > y else y + delta
+            length = data[offset + 1]
+            if offset + 3 + length > size:
+                raise WadError('broken Doom picture')
+            posts.append((x, y, length, offset + 3))
+            offset += length + 4
+    return width, height, posts
+
+def loadNumpy():
+    """ NumPy module, None if it's not installed.
+
+    NumPy is optional, pictures are decoded in plain Python without it.
+    It's imported on first picture, not at startup, since importing it
+    takes a while and only PreviewThread needs it.
+    """
+    global numpy
+    if numpy is False:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
+
+# Not imported yet, see loadNumpy
+numpy = False
+
+def decodePatch(data, palette):
+    """ Doom picture as RGBA pixels.
+
+    With NumPy, pixels of all posts are moved and looked up in palette
+    at once, otherwise post by post.
+
+    Args:
+    data - contents of lump
+    palette - 768 bytes of RGB
+
+    Return:
+    Tuple (width, height, RGBA bytes).
+    """
+    width, height, posts = patchPosts(data)
+    numpy = loadNumpy()
+    if numpy is not None and posts:
+        posts = numpy.array(posts, dtype = numpy.int64)
+        lengths = posts[:, 2]
+        # Position of every pixel within its post
+        ramp = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        xs = numpy.repeat(posts[:, 0], lengths)
+        ys = numpy.repeat(posts[:, 1], lengths) + ramp
+        source = numpy.repeat(posts[:, 3], lengths) + ramp
+        inside = ys < height
+        pixels = numpy.zeros((height, width, 4), dtype = numpy.uint8)
+        colors = numpy.frombuffer(palette, dtype = numpy.uint8).reshape(256, 3)
+        indexes = numpy.frombuffer(data, dtype = numpy.uint8)[source[inside]]
+        pixels[ys[inside], xs[inside], :3] = colors[indexes]
+        pixels[ys[inside], xs[inside], 3] = 255
+        return width, height, pixels.tobytes()
+    pixels = bytearray(width * height * 4)
+    for x, y, length, offset in posts:
+        for i in range(min(length, height - y)):
+            color = data[offset + i] * 3
+            position = ((y + i) * width + x) * 4
+            pixels[position:position + 4] = palette[color:color + 3] + b'\xff'
+    return width, height, bytes(pixels)
+
+def decodeRaw(data, palette, width, height):
+    """ Raw full-screen picture as RGBA pixels, see decodePatch.
+
+    """
+    numpy = loadNumpy()
+    if numpy is not None:
+        colors = numpy.frombuffer(palette, dtype = numpy.uint8).reshape(256, 3)
+        pixels = numpy.full((width * height, 4), 255, dtype = numpy.uint8)
+        pixels[:, :3] = colors[numpy.frombuffer(data, dtype = numpy.uint8, count = width * height)]
+        return width, height, pixels.tobytes()
+    table = [palette[i * 3:i * 3 + 3] + b'\xff' for i in range(256)]
+    return width, height, b''.join(table[value] for value in data[:width * height])
+
+def extractPreview(path, fallback = None):
+    """ Title picture of WAD or PK3.
+
+    Args:
+    path - path to file
+    fallback - path to file with PLAYPAL to use if this one has none,
+    usually IWAD
+
+    Return:
+    bytes of PNG/JPEG image as stored in file, tuple (width, height,
+    RGBA bytes) for pictures in Doom format, None if file has no
+    picture or can't be read.
+    """
+    try:
+        with span('preview.extract'), openLumps(path) as lumps:
+            data = findPicture(lumps)
+            if data is None or data.startswith(IMAGE_MAGIC):
+                return data
+            palette = readPalette(lumps)
+        if palette is None and fallback:
+            with openLumps(fallback) as lumps:
+                palette = readPalette(lumps)
+        palette = palette or GRAY_PALETTE
+        with span('preview.decode', numpy = loadNumpy() is not None):
+            # Doom pictures of full screen are always bigger than raw ones
+            if len(data) == RAW_SIZE[0] * RAW_SIZE[1]:
+                return decodeRaw(data, palette, *RAW_SIZE)
+            return decodePatch(data, palette)
+    except (OSError, ValueError, WadError, struct.error, zipfile.BadZipFile) as error:
+        print('{0}: {1}'.format(path, error))
+        return None
+
+# ================================================================
+# Classes
+# ================================================================
+class ThumbCache:
+    """ Thumbnails on disk, keyed by hash of file they come from.
+
+    Every thumbnail is a file in cache folder. Empty file means file
+    has no picture, so it isn't looked for again. Once total size goes
+    over limit, least recently used thumbnails are deleted. Can be used
+    from any thread.
+    """
+
+    def __init__(self, folder, limit = THUMB_CACHE_SIZE):
+        self.folder = folder
+        self.limit = limit
+        self.lock = threading.Lock()
+        # hash -> size, least recently used first
+        self.entries = OrderedDict()
+        self.total = 0
+
+    def load(self):
+        """ Finds thumbnails already in cache folder.
+
+        Modification time of thumbnail is time it was last used.
+        """
+        try:
+            os.makedirs(self.folder, exist_ok = True)
+            with os.scandir(self.folder) as stuff:
+                found = [(thing.stat().st_mtime, thing.name, thing.stat().st_size) for thing in stuff if thing.name.endswith('.png')]
+        except OSError as error:
+            print('{0}: {1}'.format(self.folder, error))
+            return
+        found.sort()
+        with self.lock:
+            for mtime, name, size in found:
+                self.entries[name[:-4]] = size
+                self.total += size
+
+    def filename(self, hash):
+        return os.path.join(self.folder, hash + '.png')
+
+    def lookup(self, hash):
+        """ Path of thumbnail, marked as just used.
+
+        Return:
+        Path, empty string if file has no picture, None if it's not
+        in cache.
+        """
+        with self.lock:
+            size = self.entries.get(hash)
+            if size is None:
+                count('preview.misses')
+                return None
+            self.entries.move_to_end(hash)
+        count('preview.hits')
+        filename = self.filename(hash)
+        try:
+            os.utime(filename)
+        except OSError:
+            with self.lock:
+                self.entries.pop(hash, None)
+            return None
+        return filename if size else ''
+
+    def store(self, hash, data):
+        """ Puts thumbnail into cache, making room for it if needed.
+
+        Args:
+        hash - hash of file
+        data - PNG bytes, empty if file has no picture
+        """
+        try:
+            with open(self.filename(hash), 'wb') as file:
+                file.write(data)
+        except OSError as error:
+            print('{0}: {1}'.format(self.folder, error))
+            return
+        with self.lock:
+            self.total += len(data) - self.entries.pop(hash, 0)
+            self.entries[hash] = len(data)
+            while self.total > self.limit and len(self.entries) > 1:
+                old, size = self.entries.popitem(last = False)
+                self.total -= size
+                try:
+                    os.remove(self.filename(old))
+                except OSError:
+                    pass
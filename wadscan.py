@@ -0,0 +1,357 @@
+# ================================================================
+# Imports
+# ================================================================
+import os, mmap, struct, zipfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from wadhash import CacheFile, fingerprint, fingerprintKey
+from wadfile import WadError, classifyZip
+from wadtrace import span, count
+
+# ================================================================
+# Constants
+# ================================================================
+EXTS = ['.wad', '.pk3', '.pk7', '.ipk3', '.ipk7', '.zip']
+LUMPS = ['acs', 'colormaps', 'filter', 'flats', 'graphics', 'hires', 'maps', 'music', 'patches', 'sounds', 'sprites', 'textures', 'voices', 'voxels']
+# Same, ready for searching raw ZIP directory
+LUMP_FOLDERS = tuple(name.encode('ascii') for name in LUMPS)
+POOLS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+# Files examined between checks for cancellation and progress reports
+BATCH_SIZE = 64
+
+# ================================================================
+# Classes
+# ================================================================
+class ScanResult:
+    """ Single WAD file found during scan.
+
+    kind is 'IWAD', 'PWAD' or None for files that turned out not to be
+    WADs at all.
+    """
+
+    def __init__(self, path, parent = None):
+        self.path = path
+        self.parent = parent
+        self.kind = None
+        self.hash = None
+        self.fp = None
+
+    def name(self):
+        return os.path.basename(self.path)
+
+class ScanFolder:
+    """ Folder found during scan, with its WADs and subfolders.
+
+    """
+
+    def __init__(self, path, parent = None):
+        self.path = path
+        self.parent = parent
+        self.files = []
+        self.folders = []
+
+    def name(self):
+        return os.path.basename(self.path)
+
+    def walk(self):
+        """ All files of folder and its subfolders, in tree order.
+
+        """
+        stack = [self]
+        while stack:
+            folder = stack.pop()
+            yield from folder.files
+            stack.extend(reversed(folder.folders))
+
+    def prune(self):
+        """ Drops files that aren't WADs and folders left empty by that.
+
+        Return:
+        True if anything is left in folder.
+        """
+        self.files = [file for file in self.files if file.kind]
+        self.folders = [folder for folder in self.folders if folder.prune()]
+        return bool(self.files or self.folders)
+
+class DirCache(CacheFile):
+    """ Listings of scanned folders, keyed by folder path.
+
+    Every entry holds mtime of folder along with names of WAD files and
+    subfolders found in it. Adding, removing or renaming anything inside
+    folder changes its mtime, so as long as mtime stays the same, stored
+    listing can be used instead of reading folder again.
+    Watcher rescans, duplicate finder and full scans list folders at the
+    same time, so entries are only touched under lock, see CacheFile.
+    """
+
+    def listing(self, path, mtime):
+        """ Stored listing of folder, if it's still valid.
+
+        Return:
+        Tuple (file names, folder names) or None.
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry['mtime'] == mtime:
+                self.hits += 1
+                return entry['files'], entry['folders']
+            self.misses += 1
+        return None
+
+    def store(self, path, mtime, files, folders):
+        with self.lock:
+            self.entries[path] = {'mtime': mtime, 'files': files, 'folders': folders}
+            self.dirty = True
+
+# ================================================================
+# Functions
+# ================================================================
+def classifyWAD(path):
+    """ Check supplied WAD to see what kind of beast it is.
+
+    WAD files can be of two main types - IWAD (Internal WAD), which is
+    game itself and requires nothing else to be played, or PWAD
+    (Patch WAD), which "patches" some IWAD with it's own data.
+    Process is different for various formats.
+
+    .wad files has 4-byte header which plainly states if it's I or P.
+    .pk3, .ipk3, .zip files must contain 'iwadinfo' file, PWADs must
+    have at least one of top-level lump folders
+    .pk7 - not yet implemented, considered PWAD by default
+    .ipk7 - not yet implemented, considered IWAD by default
+
+    Args:
+    path - path to WAD file
+
+    Return:
+    'IWAD', 'PWAD' or None for malformed and incompatible files.
+    """
+    temp_ext = os.path.splitext(path)[1].lower()
+    # Testing .wad file for status of stand-alone game
+    if temp_ext == '.wad':
+        with open(path, 'rb') as wad:
+            header = wad.read(4)
+        if header == b'IWAD':
+            return 'IWAD'
+        elif header == b'PWAD':
+            return 'PWAD'
+        print('{0}: WAD header not found'.format(path))
+        return None
+    # Testing .ipk3 and .zip for status of stand-alone game
+    # Only end record and central directory are read, see classifyZip
+    elif temp_ext in ['.ipk3', '.zip', '.pk3']:
+        with open(path, 'rb') as wad:
+            size = os.fstat(wad.fileno()).st_size
+            kind = None
+            if size:
+                with mmap.mmap(wad.fileno(), 0, access = mmap.ACCESS_READ) as buffer:
+                    kind = classifyZip(buffer, size, LUMP_FOLDERS)
+        if kind is None:
+            print('{0}: not compatible with GZDoom'.format(path))
+        return kind
+    # "Testing" .ipk7 for status of stand-alone game
+    elif temp_ext == '.ipk7':
+        return 'IWAD'
+    return 'PWAD'
+
+def examineFile(path, entry = None):
+    """ Classifies single file.
+
+    Meant to be run in worker pool, so it touches nothing but file
+    itself. Only headers are read, hash is reused from cache entry if
+    file didn't change, otherwise file gets fingerprint key in place of
+    hash, see wadhash.fingerprintKey.
+
+    Args:
+    path - path to WAD file
+    entry - file cache entry for this path, see wadhash.FileCache
+
+    Return:
+    Tuple (kind, hash, fingerprint), (None, None, None) on read errors.
+    """
+    try:
+        fp = fingerprint(path)
+        with span('scan.classify'):
+            kind = classifyWAD(path)
+        if kind is None:
+            return None, None, fp
+        if entry is not None and entry['fp'] == fp and 'md5' in entry:
+            return kind, entry['md5'], fp
+        return kind, fingerprintKey(fp), fp
+    except (OSError, WadError, struct.error, zipfile.BadZipFile) as error:
+        print('{0}: {1}'.format(path, error))
+        return None, None, None
+
+def readFolder(path):
+    """ Names of WAD files and subfolders in folder, sorted.
+
+    Hidden files and folders are skipped.
+
+    Return:
+    Tuple (file names, folder names).
+    """
+    files = []
+    folders = []
+    with os.scandir(path) as stuff:
+        for thing in stuff:
+            if thing.name.startswith('.'):
+                continue
+            if thing.is_file():
+                if os.path.splitext(thing.name)[1].lower() in EXTS:
+                    files.append(thing.name)
+            elif thing.is_dir():
+                folders.append(thing.name)
+    files.sort(key = str.lower)
+    folders.sort(key = str.lower)
+    return files, folders
+
+def listFolder(path, recursive, parent = None, dircache = None):
+    """ Builds tree of folders and WAD files, without opening any file.
+
+    Entries are sorted by name, so tree comes out the same every time.
+    Tree is walked with explicit stack, so depth of it doesn't matter.
+    Folders reached second time, be it through symlink loop or two
+    links to the same folder, are skipped.
+    With dircache, folders whose mtime didn't change aren't read at
+    all, their stored listing is used instead. Subfolders still have
+    to be visited, since changes deep down don't touch mtime of folders
+    above.
+
+    Args:
+    path - filesystem path to folder containing WADs
+    recursive - if True, also lists all folders found inside
+    parent - ScanFolder this folder belongs to, None for top one
+    dircache - DirCache object with listings from previous scans
+
+    Return:
+    ScanFolder object.
+    """
+    with span('scan.list', path = path):
+        return listTree(ScanFolder(path, parent), recursive, dircache)
+
+def listTree(top, recursive, dircache):
+    """ Fills in ScanFolder given by listFolder.
+
+    """
+    stack = [top]
+    visited = set()
+    while stack:
+        folder = stack.pop()
+        try:
+            stat = os.stat(folder.path)
+            if (stat.st_dev, stat.st_ino) in visited:
+                print('{0}: folder already scanned, skipping'.format(folder.path))
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+            listing = dircache.listing(folder.path, stat.st_mtime_ns) if dircache is not None else None
+            if listing is None:
+                listing = readFolder(folder.path)
+                if dircache is not None:
+                    dircache.store(folder.path, stat.st_mtime_ns, *listing)
+        except OSError as error:
+            print('{0}: {1}'.format(folder.path, error))
+            continue
+        files, folders = listing
+        prefix = os.path.join(folder.path, '')
+        folder.files = [ScanResult(prefix + name, folder) for name in files]
+        if recursive:
+            folder.folders = [ScanFolder(prefix + name, folder) for name in folders]
+            stack.extend(reversed(folder.folders))
+    count('scan.folders', len(visited))
+    return top
+
+def examineFiles(files, cache = None, workers = 1, pool = 'thread', cancel = None):
+    """ Classifies files, in batches.
+
+    Files are handed to pool of workers one batch at a time, so scan
+    can be stopped between batches and caller gets results as they
+    come. Within batch, results keep order of files.
+    Files whose fingerprint matches cache entry are never opened, type
+    and hash stored in cache are used instead.
+
+    Args:
+    files - list of ScanResult objects, filled in place
+    cache - wadhash.FileCache with hashes of known files
+    workers - number of workers reading files, 1 means no pool at all
+    pool - 'thread' or 'process', see POOLS
+    cancel - threading.Event, scan stops once it's set
+
+    Return:
+    Generator of lists of finished ScanResult objects.
+    """
+    executor = POOLS[pool](max_workers = workers) if workers > 1 and len(files) > 1 else None
+    try:
+        for start in range(0, len(files), BATCH_SIZE):
+            if cancel is not None and cancel.is_set():
+                return
+            batch = files[start:start + BATCH_SIZE]
+            with span('scan.batch', files = len(batch)):
+                examineBatch(batch, cache, executor)
+            yield batch
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def examineBatch(batch, cache, executor):
+    """ Fills in single batch of examineFiles.
+
+    """
+    todo = []
+    for file in batch:
+        entry = cache.entry(file.path) if cache is not None else None
+        if entry is not None and 'kind' in entry:
+            try:
+                stat = os.stat(file.path)
+                fp = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+            except OSError:
+                fp = None
+            if entry['fp'] == fp:
+                file.kind, file.fp = entry['kind'], fp
+                file.hash = entry.get('md5') or (fingerprintKey(fp) if file.kind else None)
+                cache.hits += 1
+                continue
+        todo.append((file, entry))
+    count('scan.cached', len(batch) - len(todo))
+    if not todo:
+        return
+    count('scan.examined', len(todo))
+    paths = [file.path for file, entry in todo]
+    entries = [entry for file, entry in todo]
+    if executor is not None:
+        results = executor.map(examineFile, paths, entries)
+    else:
+        results = map(examineFile, paths, entries)
+    for (file, entry), (file.kind, file.hash, file.fp) in zip(todo, results):
+        if cache is None or file.fp is None:
+            continue
+        cache.misses += 1
+        cache.store(file.path, 'kind', file.kind, file.fp)
+
+def scanFolders(path, recursive, cache = None, workers = 1, pool = 'thread', dircache = None):
+    """ Scan folder used for mods.
+
+    Runs through files, drops everything that's not a WAD on the first
+    glance, then checks if WADs are actually WADs, and of what type.
+    Listing of folders is done first, then files are handed to pool
+    of workers, which do the reading. Results are put back in the same
+    order files were listed in.
+    See classifyWAD and examineFiles for more.
+
+    Args:
+    path - filesystem path to folder containing WADs
+    recursive - if True, also recursively scans all folders found
+    cache - wadhash.FileCache with hashes of known files
+    workers - number of workers reading files, 1 means no pool at all
+    pool - 'thread' or 'process', see POOLS
+    dircache - DirCache object, see listFolder
+
+    Return:
+    ScanFolder tree with classified WADs, None if nothing was found.
+    """
+    with span('scan.folders', path = path):
+        tree = listFolder(path, recursive, dircache = dircache)
+        for batch in examineFiles(list(tree.walk()), cache, workers, pool):
+            pass
+    if tree.prune():
+        return tree
+    return None
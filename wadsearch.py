@@ -0,0 +1,127 @@
+# ================================================================
+# Imports
+# ================================================================
+from array import array
+
+# ================================================================
+# Classes
+# ================================================================
+class SearchIndex:
+    """ Trigram index for searching WAD library as user types.
+
+    Every entry is added with bunch of texts - name, path, category,
+    map names and such - and matches query if each word of query is
+    found somewhere in them. Words narrow entries down by the rarest of
+    their bigrams or trigrams, single characters are simply checked
+    against every entry. When query only grows, as it does while typing,
+    previous results are narrowed down instead, if there's less of them.
+    Entries are numbered in order they were added and results keep that
+    order. Removed entries are only blanked, their postings are cleaned
+    up once there's enough of them.
+    """
+
+    def __init__(self):
+        # Entry number -> key, None for removed entries
+        self.keys = []
+        # Entry number -> lowercase texts, empty for removed entries
+        self.texts = []
+        self.ids = {}
+        # Bigram or trigram -> array of entry numbers, in ascending order
+        self.grams = {}
+        self.removed = 0
+        # (query, entry numbers) of last search
+        self.last = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, key, texts):
+        """ Adds entry, replacing one with the same key.
+
+        Args:
+        key - anything hashable, returned by search
+        texts - list of strings to search in, None values are skipped
+        """
+        if key in self.ids:
+            self.remove(key)
+        number = len(self.keys)
+        text = '\n'.join(item.lower() for item in texts if item)
+        self.ids[key] = number
+        self.keys.append(key)
+        self.texts.append(text)
+        grams = set(text[i:i + 3] for i in range(len(text) - 2))
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+        for gram in grams:
+            posting = self.grams.get(gram)
+            if posting is None:
+                posting = self.grams[gram] = array('I')
+            posting.append(number)
+        self.last = None
+
+    def remove(self, key):
+        number = self.ids.pop(key, None)
+        if number is None:
+            return
+        self.keys[number] = None
+        self.texts[number] = ''
+        self.removed += 1
+        self.last = None
+        if self.removed > 1000 and self.removed > len(self.ids):
+            self.rebuild()
+
+    def rebuild(self):
+        """ Builds index again from live entries only.
+
+        """
+        entries = [(key, text) for key, text in zip(self.keys, self.texts) if key is not None]
+        self.__init__()
+        for key, text in entries:
+            self.add(key, [text])
+
+    def candidates(self, words):
+        """ Entry numbers that can possibly match all words.
+
+        Return:
+        Tuple (numbers, exact), numbers being shortest posting of grams
+        of words, or all entries if words are too short to have any.
+        Exact is True if every number in posting is known to match.
+        """
+        best = None
+        for word in words:
+            size = min(len(word), 3)
+            if size < 2:
+                continue
+            for i in range(len(word) - size + 1):
+                posting = self.grams.get(word[i:i + size])
+                if posting is None:
+                    return (), True
+                if best is None or len(posting) < len(best):
+                    best = posting
+        if best is None:
+            return range(len(self.texts)), False
+        return best, len(words) == 1 and len(words[0]) <= 3
+
+    def search(self, query):
+        """ Keys of entries matching every word of query.
+
+        Return:
+        List of keys in order entries were added, None for empty query.
+        """
+        words = query.lower().split()
+        if not words:
+            self.last = None
+            return None
+        query = ' '.join(words)
+        keys = self.keys
+        found, exact = self.candidates(words)
+        if self.last is not None and query.startswith(self.last[0]) and len(self.last[1]) < len(found):
+            found, exact = self.last[1], False
+        if exact:
+            found = [number for number in found if keys[number] is not None] if self.removed else list(found)
+        else:
+            texts = self.texts
+            # Longest words first, they throw away most
+            for word in sorted(words, key = len, reverse = True):
+                found = [number for number in found if word in texts[number]]
+        self.last = (query, found)
+        return [keys[number] for number in found]
@@ -0,0 +1,112 @@
+# ================================================================
+# Imports
+# ================================================================
+from wadtrace import count
+
+# ================================================================
+# Classes
+# ================================================================
+class TagStore:
+    """ Categories of WADs, keyed by hash of file.
+
+    WAD can have any number of tags. Hashes of every tag are kept in
+    inverted index, as insertion-ordered dictionaries used as sets, and
+    tags of every hash in forward one, so tagging, untagging and
+    listing either way don't depend on how many WADs there are.
+    Tags can exist without any WADs. Hashes outlive files, so moved or
+    rescanned files keep their tags.
+    Only keeps things in memory, WADIndex stores them.
+    """
+
+    def __init__(self):
+        # tag -> {hash: None}, in order tags were made
+        self.tags = {}
+        # hash -> {tag: None}
+        self.items = {}
+
+    def __contains__(self, tag):
+        return tag in self.tags
+
+    def __len__(self):
+        return len(self.tags)
+
+    def load(self, names, pairs):
+        """ Fills store with what was saved.
+
+        Args:
+        names - list of tags, in order
+        pairs - list of (tag, hash) tuples
+        """
+        for name in names:
+            self.addTag(name)
+        for tag, hash in pairs:
+            self.addTag(tag)[hash] = None
+            self.items.setdefault(hash, {})[tag] = None
+
+    def names(self):
+        return list(self.tags)
+
+    def hashes(self, tag):
+        """ Hashes of WADs with tag, in order they got it.
+
+        """
+        return list(self.tags.get(tag, ()))
+
+    def tagsOf(self, hash):
+        return list(self.items.get(hash, ()))
+
+    def addTag(self, tag):
+        """ Creates tag, unless it's already there.
+
+        Return:
+        Dictionary of hashes having it.
+        """
+        hashes = self.tags.get(tag)
+        if hashes is None:
+            hashes = self.tags[tag] = {}
+        return hashes
+
+    def tag(self, hashes, tag):
+        """ Gives tag to many WADs at once, creating it if needed.
+
+        Return:
+        List of hashes that didn't have it before.
+        """
+        tagged = self.addTag(tag)
+        added = [hash for hash in hashes if hash not in tagged]
+        for hash in added:
+            tagged[hash] = None
+            self.items.setdefault(hash, {})[tag] = None
+        count('tags.tagged', len(added))
+        return added
+
+    def untag(self, hashes, tag):
+        """ Takes tag from many WADs at once.
+
+        Return:
+        List of hashes that had it.
+        """
+        tagged = self.tags.get(tag, {})
+        removed = [hash for hash in hashes if hash in tagged]
+        for hash in removed:
+            del tagged[hash]
+            self.forget(hash, tag)
+        count('tags.untagged', len(removed))
+        return removed
+
+    def removeTag(self, tag):
+        """ Deletes tag, along with all it was given to.
+
+        Return:
+        List of hashes that had it.
+        """
+        removed = list(self.tags.pop(tag, ()))
+        for hash in removed:
+            self.forget(hash, tag)
+        return removed
+
+    def forget(self, hash, tag):
+        tags = self.items[hash]
+        del tags[tag]
+        if not tags:
+            del self.items[hash]
@@ -0,0 +1,236 @@
+# ================================================================
+# Imports
+# ================================================================
+import os, json, threading
+from collections import deque
+from timeit import default_timer as timer
+
+# ================================================================
+# Constants
+# ================================================================
+# Events kept in memory for Diagnostics dialog
+RING_SIZE = 10000
+
+# ================================================================
+# Sinks
+# ================================================================
+# Every event is a dictionary with "kind" ('span' or 'counter'),
+# "name", "cat", "start" and "duration" in seconds since tracer was
+# created, "thread" and "args". Sinks decide how it's stored.
+
+class RingSink:
+    """ Keeps last events in memory.
+
+    """
+
+    def __init__(self, size = RING_SIZE):
+        self.buffer = deque(maxlen = size)
+
+    def emit(self, event):
+        self.buffer.append(event)
+
+    def events(self):
+        return list(self.buffer)
+
+    def close(self):
+        pass
+
+class JsonLinesSink:
+    """ Appends every event to file as single line of JSON.
+
+    Lines are written as they come, so trace survives a crash.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.file = open(filename, 'a')
+
+    def emit(self, event):
+        line = json.dumps(event)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class ChromeTraceSink:
+    """ Writes events to Chrome trace-event file as they come.
+
+    Open result in chrome://tracing or Perfetto. File is a JSON array
+    of events, see chromeEvent, closing bracket is written when sink is
+    closed. Both viewers read array without it, so trace survives a
+    crash too.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.file = open(filename, 'w')
+        self.file.write('[')
+        self.first = True
+
+    def emit(self, event):
+        line = json.dumps(chromeEvent(event, self.pid))
+        with self.lock:
+            self.file.write(('\n' if self.first else ',\n') + line)
+            self.file.flush()
+            self.first = False
+
+    def close(self):
+        with self.lock:
+            self.file.write('\n]\n')
+            self.file.close()
+
+def chromeEvent(event, pid):
+    """ Converts event to Chrome trace-event format.
+
+    Spans become complete ("X") events and counters become counter
+    ("C") events, both with times in microseconds.
+
+    Args:
+    event - event dictionary
+    pid - process id trace is shown under
+
+    Return:
+    Dictionary ready to be dumped as JSON.
+    """
+    item = {'name': event['name'], 'cat': event['cat'], 'ts': event['start'] * 1e6, 'pid': pid, 'tid': event['thread']}
+    if event['kind'] == 'span':
+        item['ph'] = 'X'
+        item['dur'] = event['duration'] * 1e6
+        item['args'] = event['args']
+    else:
+        item['ph'] = 'C'
+        item['args'] = {event['name']: event['args']['total']}
+    return item
+
+def makeSink(filename):
+    """ File sink matching extension of file, JSON lines for ".jsonl".
+
+    """
+    if filename.lower().endswith('.jsonl'):
+        return JsonLinesSink(filename)
+    return ChromeTraceSink(filename)
+
+# ================================================================
+# Tracer
+# ================================================================
+class Span:
+    """ Context manager timing one piece of work.
+
+    """
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = timer()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.finish(self, timer())
+        return False
+
+class Tracer:
+    """ Named spans and counters, sent to any number of sinks.
+
+    Spans time a piece of work, counters add up numbers, such as cache
+    hits or bytes hashed. Every finished span and counter change is an
+    event sent to sinks. Tracer also keeps per-name totals, which is
+    what Diagnostics dialog shows.
+    Can be used from any thread.
+    """
+
+    def __init__(self):
+        self.origin = timer()
+        self.sinks = []
+        self.lock = threading.Lock()
+        # name -> [count, total, longest, last]
+        self.totals = {}
+        self.counters = {}
+
+    def addSink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def removeSink(self, sink):
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+            sink.close()
+
+    def close(self):
+        for sink in list(self.sinks):
+            self.removeSink(sink)
+
+    def span(self, name, cat = '', **args):
+        """ Times "with" block under given name.
+
+        Args:
+        name - name of span, e.g. 'scan.list'
+        cat - category, e.g. 'scan'
+        args - extra values stored with event
+        """
+        return Span(self, name, cat or name.partition('.')[0], args)
+
+    def spanSince(self, name, start, cat = '', **args):
+        """ Records span that started at given time and ends now.
+
+        Args:
+        start - start time taken with timeit.default_timer
+        """
+        span = Span(self, name, cat or name.partition('.')[0], args)
+        span.start = start
+        self.finish(span, timer())
+
+    def finish(self, span, end):
+        duration = end - span.start
+        with self.lock:
+            totals = self.totals.get(span.name)
+            if totals is None:
+                totals = self.totals[span.name] = [0, 0.0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+            totals[3] = duration
+        self.emit({'kind': 'span', 'name': span.name, 'cat': span.cat, 'start': span.start - self.origin,
+                   'duration': duration, 'thread': threading.get_ident(), 'args': span.args})
+
+    def count(self, name, value = 1, cat = ''):
+        """ Adds value to counter.
+
+        """
+        with self.lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+        self.emit({'kind': 'counter', 'name': name, 'cat': cat or name.partition('.')[0], 'start': timer() - self.origin,
+                   'duration': 0.0, 'thread': threading.get_ident(), 'args': {'value': value, 'total': total}})
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink.emit(event)
+
+    def stats(self):
+        """ Per-name totals of spans, sorted by total time.
+
+        Return:
+        List of tuples (name, count, total, longest, last), in seconds.
+        """
+        with self.lock:
+            rows = [(name,) + tuple(values) for name, values in self.totals.items()]
+        rows.sort(key = lambda row: row[2], reverse = True)
+        return rows
+
+# ================================================================
+# Module-wide tracer
+# ================================================================
+tracer = Tracer()
+ring = tracer.addSink(RingSink())
+span = tracer.span
+count = tracer.count